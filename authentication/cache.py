@@ -0,0 +1,159 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Optional
+import hashlib
+import time
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+class UserCache():
+    """
+    Process-wide TTL cache of user documents keyed by email, for the user lookup of every
+    authenticated request. UserService drops the entry of a user it updates or deletes;
+    changes made by another worker are seen once the entry expires.
+    """
+    def __init__(self, ttl_seconds: Optional[int] = None, max_size: Optional[int] = None):
+        """
+        Initializes the UserCache object.
+
+        Parameters:
+            ttl_seconds (int, optional): Lifetime of an entry in seconds.
+                Defaults to the USER_CACHE_TTL_SECONDS environment variable or 60.
+            max_size (int, optional): Maximum number of users kept in the cache.
+                Defaults to the USER_CACHE_SIZE environment variable or 10000.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+        if max_size is None:
+            max_size = int(os.getenv("USER_CACHE_SIZE", 10000))
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        # email -> (user, expires at)
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        # bumped on every invalidation so a lookup that raced with an
+        # update or delete is not stored over the fresh state
+        self._generation = 0
+
+    def get_or_load(self, email: str, loader: Callable[[str], Optional[dict]]) -> Optional[dict]:
+        """
+        Returns the cached user of an email, loading it with loader on a miss.
+        Unknown emails are not cached.
+
+        Parameters:
+            email (str): Email of the user.
+            loader (Callable): Called with the email to read the user from the database.
+
+        Returns:
+            dict or None: A copy of the user document, or None if there is no such user.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(email)
+                return dict(entry[0])
+            generation = self._generation
+
+        user = loader(email)
+        if user is None:
+            return None
+
+        with self._lock:
+            if self._generation == generation:
+                self._entries[email] = (dict(user), now + self.ttl_seconds)
+                self._entries.move_to_end(email)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, email: Optional[str] = None, school_id: Optional[str] = None):
+        """
+        Drops the cached user with an email or a school id.
+
+        Parameters:
+            email (str, optional): Email of the user.
+            school_id (str, optional): School id of the user, for updates that may change the email.
+        """
+        with self._lock:
+            self._generation += 1
+            if email is not None:
+                self._entries.pop(email, None)
+            if school_id is not None:
+                for cached_email in [key for key, entry in self._entries.items() if entry[0].get("school_id") == school_id]:
+                    del self._entries[cached_email]
+
+    def clear(self):
+        """
+        Drops every cached user.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+class TokenCache():
+    """
+    Process-wide cache of the access tokens whose signature was verified, kept until the
+    token expires, so a token is decoded once rather than on every request. Tokens are
+    keyed by their SHA-256 digest.
+    """
+    def __init__(self, max_size: Optional[int] = None):
+        """
+        Initializes the TokenCache object.
+
+        Parameters:
+            max_size (int, optional): Maximum number of tokens kept in the cache.
+                Defaults to the TOKEN_CACHE_SIZE environment variable or 10000.
+        """
+        if max_size is None:
+            max_size = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+        self.max_size = max_size
+        # token digest -> (email, expires at as a unix timestamp)
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token: str) -> Optional[str]:
+        """
+        Returns the email of a verified token that has not expired.
+
+        Parameters:
+            token (str): The access token.
+
+        Returns:
+            str or None: The email, or None if the token must be verified.
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def add(self, token: str, email: str, expires_at: float):
+        """
+        Stores a verified token.
+
+        Parameters:
+            token (str): The access token.
+            email (str): The email in the token.
+            expires_at (float): The exp claim of the token, as a unix timestamp.
+        """
+        with self._lock:
+            self._entries[self._key(token)] = (email, expires_at)
+            self._entries.move_to_end(self._key(token))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+user_cache = UserCache()
+token_cache = TokenCache()
@@ -3,22 +3,15 @@ import jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from pymongo import MongoClient
+from services.database_services import get_mongo_client
+from authentication.cache import token_cache, user_cache
 import os
 from data_definitions.schemas import Token, TokenData
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='login')
-# Replace with your MongoDB connection string
-connection_string = os.getenv("MONGODB_CONNECTION_STRING")
-
-# Connect to MongoDB
-client = MongoClient(connection_string)
 # SECRET_KEY
 # Algorithm
 # Expriation time
-# Get the database and collection
-db = client["chatbot"]
-collection = db["users"]
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
@@ -32,6 +25,13 @@ else:
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 
+def get_users_collection():
+    """
+    Returns the users collection on the shared MongoDB client.
+    """
+    return get_mongo_client()["chatbot"]["users"]
+
+
 def create_access_token(data: dict):
     to_encode = data.copy()
 
@@ -45,6 +45,11 @@ def create_access_token(data: dict):
 
 def verify_access_token(token: str, credentials_exception):
 
+    # a token whose signature was already verified is trusted until it expires
+    id = token_cache.get(token)
+    if id is not None:
+        return TokenData(id=id)
+
     try:
 
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -55,6 +60,9 @@ def verify_access_token(token: str, credentials_exception):
     except JWTError:
         raise credentials_exception
 
+    if payload.get("exp") is not None:
+        token_cache.add(token, id, payload["exp"])
+
     return token_data
 
 
@@ -66,5 +74,5 @@ def get_current_user(token: int = Depends(oauth2_scheme)):
     token = verify_access_token(token, credentials_exception)
 
     #user = db.query(models.User).filter(models.User.id == token.id).first()
-    user = collection.find_one({"email": token.id})
+    user = user_cache.get_or_load(token.id, lambda email: get_users_collection().find_one({"email": email}))
     return user
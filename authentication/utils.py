@@ -1,10 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from typing import Optional, Tuple
+import asyncio
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+# bcrypt cost of new hashes, hashes with another cost are replaced on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# bcrypt holds a CPU for the whole hash, so hashing runs on its own bounded pool
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", os.cpu_count() or 1))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="password")
 
 
 def hash(password: str):
-    return pwd_context.hash(password)
+    return _password_executor.submit(pwd_context.hash, password).result()
 
 
 def verify(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return _password_executor.submit(pwd_context.verify, plain_password, hashed_password).result()
+
+
+async def ahash(password: str) -> str:
+    """
+    Hashes a password on the password pool without blocking the event loop.
+    """
+    return await asyncio.wrap_future(_password_executor.submit(pwd_context.hash, password))
+
+
+async def averify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies a password on the password pool without blocking the event loop.
+
+    Returns:
+        Tuple[bool, Optional[str]]: Whether the password matches, and a new hash when the
+            stored one was made with another bcrypt cost and must be replaced.
+    """
+    return await asyncio.wrap_future(_password_executor.submit(pwd_context.verify_and_update, plain_password, hashed_password))
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 class User(BaseModel):
     """
@@ -60,6 +60,30 @@ class UserUpdate(BaseModel):
 
 
 
+class ActivityPoint(BaseModel):
+    start: datetime
+    messages: int
+    conversations: int
+
+class UserActivity(BaseModel):
+    user_id: str
+    message_count: int
+
+class CourseActivity(BaseModel):
+    course_name: str
+    message_count: int
+    conversation_count: int
+    active_users: int
+    series: List[ActivityPoint]
+    top_users: List[UserActivity]
+    feedback: Dict[str, int]
+
+class DashboardResponse(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    granularity: str
+    courses: List[CourseActivity]
+
 class MessageCountResponse(BaseModel):
     subject: str
     message_count: int
@@ -82,3 +106,87 @@ class FacebookDateIngested(BaseModel):
 
 
 
+
+
+class IngestionJobCreated(BaseModel):
+    job_id: str
+    status: str
+
+
+class BulkUploadFileResult(BaseModel):
+    file_name: str
+    status: str
+    detail: Optional[str] = None
+
+
+class BulkIngestionJobCreated(BaseModel):
+    job_id: Optional[str] = None
+    status: str
+    files: List[BulkUploadFileResult]
+
+
+class IngestionJob(BaseModel):
+    job_id: str
+    kind: str
+    course_name: str
+    file_name: Optional[str] = None
+    status: str
+    total_chunks: int
+    embedded_chunks: int
+    pages_processed: Optional[int] = None
+    total_pages: Optional[int] = None
+    attempts: int
+    error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class KnowledgeBaseDeletion(BaseModel):
+    files: int
+    vectors: int
+    docstore_nodes: int
+    metadata: Optional[int] = None
+    ref_docs: Optional[int] = None
+    bm25_docs: Optional[int] = None
+    facebook_posts: int = 0
+    course_removed: bool
+
+
+class QueryPlanReport(BaseModel):
+    name: str
+    namespace: str
+    filter: List[str]
+    stages: List[str]
+    index: Optional[str] = None
+    collscan: bool
+    keys_examined: Optional[int] = None
+    docs_examined: Optional[int] = None
+    suggested_index: Optional[List[str]] = None
+
+
+class EmbeddingCacheStats(BaseModel):
+    model: str
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class ChunkingCostEstimate(BaseModel):
+    chunks: int
+    tokens: int
+    cost: float
+
+
+class FileCostEstimate(BaseModel):
+    file_name: str
+    preview: ChunkingCostEstimate
+    ingest: ChunkingCostEstimate
+
+
+class CostEstimate(BaseModel):
+    files: List[FileCostEstimate]
+    preview: ChunkingCostEstimate
+    ingest: ChunkingCostEstimate
+    model: str
+    price_per_million_tokens: float
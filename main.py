@@ -1,9 +1,38 @@
 from fastapi import FastAPI
-from routers import query, knowledge_base, user, evaluation, ingest_data, auth, statistics, conversation
+from contextlib import asynccontextmanager
+from routers import query, knowledge_base, user, evaluation, ingest_data, auth, statistics, conversation, metrics, admin
 from fastapi.middleware.cors import CORSMiddleware
+from services.database_services import mongo_registry
+from services.ingestion_job_services import ingestion_job_service, facebook_sync_scheduler
+from services.memory_services import chat_message_writer
+from services.course_registry_services import course_registry
+from services.index_services import provision_indexes
+from services.knowledge_base_services import migrate_file_records
 from dotenv import load_dotenv
 load_dotenv()
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one MongoDB connection pool per process, shared by every service and router
+    mongo_registry.connect()
+    provision_indexes()
+    # courses still listing their files in their record are moved to the files registry before serving
+    migrate_file_records()
+    course_registry.start()
+    ingestion_job_service.start()
+    chat_message_writer.start()
+    facebook_sync_scheduler.start()
+    yield
+    facebook_sync_scheduler.stop()
+    # queued chat messages are written before the connection pool closes
+    chat_message_writer.shutdown()
+    ingestion_job_service.shutdown()
+    course_registry.stop()
+    mongo_registry.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 origins = ["*"]
@@ -23,6 +52,6 @@ app.include_router(user.router)
 app.include_router(query.router)
 app.include_router(ingest_data.router)
 app.include_router(knowledge_base.router)
-
-
-
+app.include_router(evaluation.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
\ No newline at end of file
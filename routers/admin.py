@@ -0,0 +1,45 @@
+from fastapi import status, HTTPException, APIRouter
+from typing import List, Optional
+from data_definitions.schemas import QueryPlanReport
+from services.index_services import IndexAdvisor, provision_indexes
+
+#services
+index_advisor = IndexAdvisor()
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"]
+)
+
+
+@router.get("/index_report", response_model=List[QueryPlanReport])
+def get_index_report(course_name: Optional[str] = None):
+    """
+    Endpoint running explain() on every hot query of the application and reporting the plan MongoDB picks.
+
+    Parameters:
+    - course_name (str, optional): Restrict the per-course queries to one course. Defaults to every course.
+
+    Returns:
+    - List[QueryPlanReport]: One entry per query, the collection scans first with the index they are missing.
+    - HTTP 500 for any server errors.
+    """
+    try:
+        return [QueryPlanReport(**entry) for entry in index_advisor.report(course_name)]
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/provision_indexes")
+def post_provision_indexes():
+    """
+    Endpoint creating the indexes of every hot query again, as done at startup.
+
+    Returns:
+    - dict: The number of courses, subjects and indexes provisioned.
+    - HTTP 500 for any server errors.
+    """
+    try:
+        return provision_indexes()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -1,32 +1,28 @@
 from fastapi import APIRouter, Depends, status, HTTPException
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from authentication.utils import verify
+from fastapi.concurrency import run_in_threadpool
+from authentication.utils import averify_and_update
+from authentication.cache import user_cache
 from authentication.oauth2 import create_access_token
-from pymongo import MongoClient
 import os
 from data_definitions import schemas
-from authentication.oauth2 import get_current_user
+from authentication.oauth2 import get_current_user, get_users_collection
 from dotenv import load_dotenv
 load_dotenv()
-# Replace with your MongoDB connection string
-connection_string = os.getenv("MONGODB_CONNECTION_STRING")
-
-# Connect to MongoDB
-client = MongoClient(connection_string)
-
-# Get the database and collection
-db = client["chatbot"]
-collection = db["users"]
 router = APIRouter(tags=['Authentication'])
 
 
 @router.post('/login', response_model=schemas.Token)
-def login(user_credentials: OAuth2PasswordRequestForm = Depends()):
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), collection = Depends(get_users_collection)):
     """
     Endpoint for user login, which verifies credentials and returns an access token.
 
     Parameters:
     - user_credentials (OAuth2PasswordRequestForm): The user's login credentials, provided by dependency injection.
+    - collection: The users collection on the shared MongoDB client, provided by dependency injection.
+
+    The password is checked on the bounded password pool. A password hashed with another
+    bcrypt cost than BCRYPT_ROUNDS is rehashed and stored again.
 
     Returns:
     - Token: A dictionary containing the access token and token type.
@@ -34,16 +30,21 @@ def login(user_credentials: OAuth2PasswordRequestForm = Depends()):
     Raises:
     - HTTPException: If the credentials are invalid, with a 403 status code.
     """
-    user = collection.find_one({"email": user_credentials.username})
+    user = await run_in_threadpool(collection.find_one, {"email": user_credentials.username})
 
     if not user:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
 
-    if not verify(user_credentials.password, user.get('password')):
+    valid, new_hash = await averify_and_update(user_credentials.password, user.get('password'))
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail=f"Invalid Credentials")
 
+    if new_hash:
+        await run_in_threadpool(collection.update_one, {"_id": user["_id"]}, {"$set": {"password": new_hash}})
+        user_cache.invalidate(email=user.get('email'))
+
     access_token = create_access_token(data={"email": user.get('email')})
 
     return {"access_token": access_token, "token_type": "bearer"}
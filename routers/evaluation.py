@@ -1,32 +1,69 @@
 from fastapi import Depends, status, HTTPException, Response, APIRouter, UploadFile, File
-from llama_index.core import (
-    SimpleDirectoryReader,
-)
-from llama_index.core.node_parser import SentenceSplitter
-import requests
 from tempfile import TemporaryDirectory
-from services.evaluation_services import file_cost_embeddings
+from typing import List
+import shutil
+import os
+from data_definitions.schemas import CostEstimate
+from services.evaluation_services import CostEstimationService
+
+#services
+cost_estimation_service = CostEstimationService()
 
 router = APIRouter(
     prefix="/evaluate",
     tags=["evaluate"]
 )    
+
+
+def save_uploads(files: List[UploadFile], temp_dir: str) -> List[tuple]:
+    """
+    Copies uploaded files to a directory in chunks.
+
+    Returns:
+    - List of (file path, file name) of the saved files.
+    """
+    saved = []
+    for index, file in enumerate(files):
+        # a subdirectory per upload keeps files with the same name apart
+        file_dir = os.path.join(temp_dir, str(index))
+        os.makedirs(file_dir)
+        file_path = os.path.join(file_dir, os.path.basename(file.filename))
+        with open(file_path, "wb") as temp_file:
+            shutil.copyfileobj(file.file, temp_file)
+        saved.append((file_path, file.filename))
+    return saved
+
+
 #to be added arg - db_name for the course
 @router.post("/filecost/", description="embedding tokens")
-async def file_cost(file: UploadFile):
+def file_cost(file: UploadFile):
+    """
+    Endpoint returning the embedding tokens of a file split in 120 token chunks.
+    """
+    try:
+        with TemporaryDirectory() as temp_dir:
+            [(file_path, file_name)] = save_uploads([file], temp_dir)
+            estimate = cost_estimation_service.estimate_file(file_path, file_name)
+        return estimate["preview"]["tokens"]
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An error occurred: {str(e)}")
+
+
+@router.post("/filecosts/", description="embedding tokens and cost of several files", response_model=CostEstimate)
+def files_cost(files: List[UploadFile]):
+    """
+    Endpoint estimating the embedding tokens and dollar cost of several files, per file and in total,
+    for the 120 token preview chunking and for the chunking used at ingestion.
+
+    Parameters:
+    - files (List[UploadFile]): The files to estimate.
+
+    Returns:
+    - CostEstimate: The per-file and total estimates.
+    """
     try:
-    # Create a temporary directory using a context manager
         with TemporaryDirectory() as temp_dir:
-            # Save the uploaded file content to the temporary directory
-            temp_file_path = f"{temp_dir}/{file.filename}"
-            file_content = await file.read()  # Read the uploaded file content
-            with open(temp_file_path, "wb") as temp_file:
-                temp_file.write(file_content)  # Write content to temporary file
-            # Process the file using SimpleDirectoryReader with the full path
-            data = SimpleDirectoryReader(input_files=[temp_file_path]).load_data()
-            #data returns a Document object
-            nodes = SentenceSplitter(chunk_size=120, chunk_overlap=20).get_nodes_from_documents(data)
-            tokens =  file_cost_embeddings(nodes)
-        return tokens
+            saved = save_uploads(files, temp_dir)
+            return cost_estimation_service.estimate_files(saved)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An error occurred: {str(e)}")
@@ -5,12 +5,15 @@ import os
 from tempfile import TemporaryDirectory
 import tempfile
 from llama_index.core import Document
-from data_definitions.schemas import Text_knowledgeBase, FacebookData, FacebookDateIngested
+from data_definitions.schemas import Text_knowledgeBase, FacebookData, IngestionJob, IngestionJobCreated, BulkIngestionJobCreated, EmbeddingCacheStats
+from fastapi.concurrency import run_in_threadpool
+from typing import List
 import tempfile
 from llama_index.core import Document
 from services.facebook_services import FacebookService
 from services.knowledge_base_services  import  KnowledgeBaseService
 from services.ingest_data_services import IngestDataService
+from services.ingestion_job_services import ingestion_job_service
 
 #services
 ingest_data_service = IngestDataService()
@@ -25,87 +28,104 @@ router = APIRouter(
 )
 
 #to be added arg - db_name for the course
-@router.post("/uploadfile/", description="Upload file")
+@router.post("/uploadfile/", description="Upload file", status_code=status.HTTP_202_ACCEPTED, response_model=IngestionJobCreated)
 async def upload_file(file: UploadFile, course_name: str):
+    """
+    Stores the uploaded file and queues its ingestion. Progress is reported by /ingest_data/jobs/{job_id}.
+    """
     try:
         if not kb_service.valid_index_name(course_name):
             raise ValueError("Invalid Index Name")
         file_name = file.filename
-        # Create a temporary directory using a context manager
-        with TemporaryDirectory() as temp_dir:
-            # Save the uploaded file content to the temporary directory
-            temp_file_path = f"{temp_dir}/{file.filename}"
-            file_content = await file.read()  # Read the uploaded file content
-            with open(temp_file_path, "wb") as temp_file:
-                temp_file.write(file_content)  # Write content to temporary file
-            # Process the file using SimpleDirectoryReader with the full path
-            data = SimpleDirectoryReader(input_files=[temp_file_path]).load_data()
-
-            #check if file exist
-            file = kb_service.get_all_files(course_name)
-            if file_name in file:
-                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"{file_name} already exist")
-            
-            ingest_data_service.add_data(course_name, data,file_name)
-            kb_service.add_file_to_course(course_name,file_name)
-        return Response(status_code=status.HTTP_200_OK, content="Successfully added to knowledge base")
+
+        #check if file exist
+        if kb_service.file_exists(course_name, file_name):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"{file_name} already exist")
+
+        job_id = await run_in_threadpool(ingestion_job_service.enqueue_upload, course_name, file_name, file.file)
+        return IngestionJobCreated(job_id=job_id, status="queued")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
 
-@router.post("/downloadlink/", description="Add file using link")
+@router.put("/updatefile/", description="Upload a new version of a file", status_code=status.HTTP_202_ACCEPTED, response_model=IngestionJobCreated)
+async def update_file(file: UploadFile, course_name: str):
+    """
+    Stores the new version of a file of the course and queues its re-ingestion.
+    Only the chunks that changed since the stored version are embedded and written, and
+    the chunks no longer in the file are deleted. The job result holds the number of
+    chunks unchanged, added and removed once it completes.
+    """
+    try:
+        if not kb_service.valid_index_name(course_name):
+            raise ValueError("Invalid Index Name")
+        file_name = file.filename
+        if not kb_service.file_exists(course_name, file_name):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{file_name} not found")
+
+        job_id = await run_in_threadpool(ingestion_job_service.enqueue_update, course_name, file_name, file.file)
+        return IngestionJobCreated(job_id=job_id, status="queued")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/uploadfiles/", description="Upload several files or zip archives", status_code=status.HTTP_202_ACCEPTED, response_model=BulkIngestionJobCreated)
+async def upload_files(files: List[UploadFile], course_name: str):
+    """
+    Stores the uploaded files, expanding zip archives, and queues their ingestion as one job.
+    Files are parsed in parallel processes and their chunks embedded in shared batches.
+
+    Returns:
+    - BulkIngestionJobCreated: The job id, or none if every file was skipped, and the result of each file:
+      "queued", or "duplicate" if it already exists in the course or is repeated in the upload.
+      The job result holds the ingestion result of each file once it completes.
+    """
+    try:
+        if not kb_service.valid_index_name(course_name):
+            raise ValueError("Invalid Index Name")
+        uploads = [(file.filename, file.file) for file in files]
+        queued = await run_in_threadpool(ingestion_job_service.enqueue_bulk_upload, course_name, uploads)
+        return BulkIngestionJobCreated(
+            job_id=queued["job_id"],
+            status="queued" if queued["job_id"] else "skipped",
+            files=queued["files"],
+        )
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/downloadlink/", description="Add file using link", status_code=status.HTTP_202_ACCEPTED, response_model=IngestionJobCreated)
 async def upload_file_link(download_link: str, course_name:str):
   """
-  Downloads a file from the specified URL and stores it in a temporary directory.
+  Queues the download and ingestion of the file at the specified URL.
 
   Args:
-      url (str): The URL of the file to download.
+      download_link (str): The URL of the file to download.
+      course_name (str): The name of the course.
 
   Returns:
-      str: The path to the downloaded file or None if there was an error.
+      IngestionJobCreated: The id of the queued job.
   """
-  if not kb_service.valid_index_name(course_name):
-            raise ValueError("Invalid Index Name")
-  # Create a temporary directory
-  with tempfile.TemporaryDirectory() as tmpdir:
+  try:
+    if not kb_service.valid_index_name(course_name):
+        raise ValueError("Invalid Index Name")
     # Extract filename from URL, considering the possibility of query parameters
-    filename = download_link.split("/")[-1].split("?")[0]  # Get last part before '?'
-    #prefixed_filename = f"Topic {topic}-{filename}"  # Add the prefix
-
-    filepath = os.path.join(tmpdir, filename)
-   
-
-    # Send a GET request to download the file
-    try:
-      response = requests.get(download_link, stream=True)
-      response.raise_for_status()  # Raise an exception for unsuccessful downloads
-    except requests.exceptions.RequestException as e:
-      print(f"Error downloading file: {e}")
-      return None
-    content_type = response.headers.get('Content-Type')
-    if content_type and not content_type.startswith('text/html'):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file URL or content type")
-
-    try:
-        # Write the downloaded data to the temporary file
-        with open(filepath, "wb") as f:
-            for chunk in response.iter_content(1024):
-                if chunk:  # filter out keep-alive new chunks
-                    f.write(chunk)
-        data = SimpleDirectoryReader(input_files=[filepath]).load_data()
-        #nodes = SentenceSplitter(chunk_size=1024, chunk_overlap=20).get_nodes_from_documents(data)
-        file_name = data[0].metadata['file_name']
-
-        #check if file exist
-        file = kb_service.get_all_files(course_name)
-        if file_name in file:
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"{file_name} already exist")
-        
-        ingest_data_service.add_data(course_name, data)
-        kb_service.add_file_to_course(course_name,file_name)
-        return Response(status_code=status.HTTP_200_OK)
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    file_name = download_link.split("/")[-1].split("?")[0]  # Get last part before '?'
+
+    #check if file exist
+    if kb_service.file_exists(course_name, file_name):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"{file_name} already exist")
+
+    job_id = ingestion_job_service.enqueue_link(course_name, download_link, file_name)
+    return IngestionJobCreated(job_id=job_id, status="queued")
+  except HTTPException:
+    raise
+  except Exception as e:
+    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
 
 
@@ -118,8 +138,7 @@ async def add_text_knowledge_base(subject:str, metadata:Text_knowledgeBase):
         file_name = metadata.topic
       
          #check if file exist
-        file = kb_service.get_all_files(subject)
-        if file_name in file:
+        if kb_service.file_exists(subject, file_name):
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"{file_name} already exist")
 
 
@@ -152,8 +171,7 @@ async def add_facebook_data(subject:str, metadata:FacebookData):
         file_name = "facebook_id: "+metadata.post_id
       
          #check if file exist
-        file = kb_service.get_all_files(subject)
-        if file_name in file:
+        if kb_service.file_exists(subject, file_name):
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"{file_name} already exist")
 
 
@@ -178,55 +196,69 @@ async def add_facebook_data(subject:str, metadata:FacebookData):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
 
-@router.post("/ingest_facebook_posts", response_model=FacebookDateIngested)
-def ingest_facebook_data(subject: str):
+@router.post("/ingest_facebook_posts", status_code=status.HTTP_202_ACCEPTED, response_model=IngestionJobCreated)
+def ingest_facebook_data(subject: str, full: bool = False):
+    """
+    Queues the ingestion of the Facebook page posts created since the course's last sync,
+    or of every post with full=true. The job result holds total_ingested and
+    total_already_ingested once it completes. Syncs also run every FB_SYNC_INTERVAL_SECONDS.
+    """
     try:  
         if not kb_service.valid_index_name(subject):
             raise ValueError("Invalid Index Name")
-        posts = fb_service.get_facebook_page_posts()
-        files = kb_service.get_all_facebook_posts(subject)
-        count =0
-        skip =0
-        if posts:
-            for post in posts['data']:
-                facebook_data = FacebookData(
-                    post_id= "facebook_post_id_" + post.get('id'),
-                    post_created=post.get('created_time'),
-                    content=post.get('message')
-                )
-                #check if file exist
-                if facebook_data.post_id not in files:
-                    count +=1
-                    document = Document(
-                    text=facebook_data.content,
-                    metadata={
-                        "file_name": facebook_data.post_id,
-                        "post_created":facebook_data.post_created,
-                    },
-                    excluded_llm_metadata_keys=['file_name'],
-                    excluded_embed_metadata_keys=['file_name'],
-                    metadata_seperator="::",
-                    metadata_template="{key}=>{value}",
-                    text_template="Metadata: {metadata_str}\n-----\nContent: {content}",
-                    )
-                    ingest_data_service.add_data(subject, [document],"This contains specific information in facebook page", 0)
-                    kb_service.add_file_to_course(subject,facebook_data.post_id)
-                    fb_service.add_post_to_course(subject,facebook_data)
-                    print("ingested", facebook_data.post_created)
-                else:
-                    skip +=1
-                    print("already ingested")
-        return FacebookDateIngested(total_ingested=count, total_already_ingested=skip)
+        job_id = ingestion_job_service.enqueue_facebook(subject, full)
+        return IngestionJobCreated(job_id=job_id, status="queued")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+def to_ingestion_job(job: dict) -> IngestionJob:
+    return IngestionJob(job_id=job["_id"], **{key: value for key, value in job.items() if key != "_id"})
 
 
+@router.get("/jobs/{job_id}", response_model=IngestionJob)
+def get_ingestion_job(job_id: str):
+    """
+    Endpoint to get the status and progress (chunks embedded out of total) of an ingestion job.
+    """
+    try:
+        job = ingestion_job_service.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"job {job_id} not found")
+        return to_ingestion_job(job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.get("/jobs/", response_model=List[IngestionJob])
+def get_ingestion_jobs(course_name: str, limit: int = 50):
+    """
+    Endpoint to list the latest ingestion jobs of a course.
+    """
+    try:
+        jobs = ingestion_job_service.get_jobs_by_course(course_name, limit)
+        return [to_ingestion_job(job) for job in jobs]
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
-
-
-
+@router.get("/embedding_cache/stats", response_model=List[EmbeddingCacheStats])
+def get_embedding_cache_stats():
+    """
+    Endpoint to get the embedding cache hit and miss counters of every embedding model.
+    """
+    try:
+        stats = ingest_data_service.embedding_cache.get_stats()
+        return [
+            EmbeddingCacheStats(
+                model=stat["_id"],
+                hits=stat.get("hits", 0),
+                misses=stat.get("misses", 0),
+                hit_rate=stat.get("hits", 0) / max(stat.get("hits", 0) + stat.get("misses", 0), 1)
+            )
+            for stat in stats
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
@@ -1,9 +1,10 @@
-from fastapi import status, HTTPException, Response, APIRouter, Depends
+from fastapi import status, HTTPException, Response, APIRouter, Depends, Query
 from authentication import oauth2
 from typing import List
-from data_definitions.schemas import FacebookData
-from services.knowledge_base_services import KnowledgeBaseService
+from data_definitions.schemas import FacebookData, KnowledgeBaseDeletion
+from services.knowledge_base_services import KnowledgeBaseService, FILES_PAGE_SIZE
 from services.facebook_services import FacebookService
+from services.facebook_sync_services import FACEBOOK_POST_PREFIX
 
 #services
 fb_sevice = FacebookService()
@@ -16,12 +17,14 @@ router = APIRouter(
 
 
 @router.get("/get_files/")
-def get_course_files(course_name:str):
+def get_course_files(course_name:str, skip: int = 0, limit: int = FILES_PAGE_SIZE):
     """
-    Endpoint to retrieve all files associated with a specific course.
+    Endpoint to retrieve the files associated with a specific course, in name order.
 
     Parameters:
     - course_name (str): The name of the course.
+    - skip (int): Number of files to skip, for pagination.
+    - limit (int): Maximum number of files returned, 100 by default. 0 returns every file.
 
     Returns:
     - List of files if found.
@@ -30,7 +33,7 @@ def get_course_files(course_name:str):
     - HTTP 500 for any other server errors.
     """
     try:
-        result = kb_service.get_all_files(course_name)
+        result = kb_service.get_files(course_name, skip=skip, limit=limit)
         if result:
             return result
         else:
@@ -113,39 +116,74 @@ def delete_course_files(course_name: str, file_name: str):
     - HTTP 500 for any other server errors.
     """
     try:
-        if not course_name in kb_service.get_all_course():
+        if not kb_service.course_exists(course_name):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{course_name} not found")
 
-        if file_name in kb_service.get_all_files(course_name):
+        if kb_service.file_exists(course_name, file_name):
             kb_service.delete_file(course_name,file_name)
-            kb_service.delete_course_file(course_name,file_name)
-            if file_name.startswith("facebook_post_id_"):
-                fb_sevice.delete_post_from_course(course_name,file_name)
+            if file_name.startswith(FACEBOOK_POST_PREFIX):
+                fb_sevice.delete_posts_from_course(course_name,[file_name])
             
         else:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{file_name} not found")
         return Response(status_code=status.HTTP_204_NO_CONTENT)
-    except ValueError as e:
-        # Raise an HTTPException with status code 404 (Not Found) if the course is not found
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)) 
-   
-
-
-
-
-
-
-
 
 
+@router.delete("/delete_files/", response_model=KnowledgeBaseDeletion)
+def delete_files(course_name: str, file_names: List[str] = Query(...)):
+    """
+    Endpoint to delete several files from a course at once.
 
+    Parameters:
+    - course_name (str): The name of the course.
+    - file_names (List[str]): The names of the files, repeated as query parameters.
 
+    Returns:
+    - KnowledgeBaseDeletion: What was removed. Names not in the course are ignored.
+    - HTTP 404 if the course is not found.
+    - HTTP 500 for any other server errors.
+    """
+    try:
+        if not kb_service.course_exists(course_name):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{course_name} not found")
 
+        file_names = list(kb_service.existing_files(course_name, file_names))
+        report = kb_service.delete_files(course_name, file_names)
+        post_ids = [file_name for file_name in file_names if file_name.startswith(FACEBOOK_POST_PREFIX)]
+        if post_ids:
+            report["facebook_posts"] = fb_sevice.delete_posts_from_course(course_name, post_ids)
+        return KnowledgeBaseDeletion(**report)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@router.delete("/delete_course/", response_model=KnowledgeBaseDeletion)
+def delete_course(course_name: str):
+    """
+    Endpoint to delete a course with its whole knowledge base.
 
+    Parameters:
+    - course_name (str): The name of the course.
 
+    Returns:
+    - KnowledgeBaseDeletion: What was removed.
+    - HTTP 404 if the course is not found.
+    - HTTP 500 for any other server errors.
+    """
+    try:
+        if not kb_service.course_exists(course_name):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{course_name} not found")
 
-    
\ No newline at end of file
+        report = kb_service.delete_course(course_name)
+        fb_sevice.drop_course(course_name)
+        return KnowledgeBaseDeletion(course_removed=True, **report)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
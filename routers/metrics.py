@@ -0,0 +1,19 @@
+from fastapi import Response, APIRouter
+from services.metrics_services import metrics_payload
+
+router = APIRouter(
+    tags=["metrics"]
+)
+
+
+@router.get("/metrics")
+def get_metrics():
+    """
+    Endpoint exposing the chat pipeline stage latencies and per-course LLM token counters
+    in the Prometheus text format.
+
+    Returns:
+    - Response: The metrics, for a Prometheus scrape.
+    """
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
@@ -1,11 +1,15 @@
 from fastapi import Depends, status, HTTPException, APIRouter
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+import json
 from services.chat_services import ChatEngineService
-from services.memory_services import ChatHistory
+from services.memory_services import ChatHistory, AsyncChatHistory
 from llama_index.core.response_synthesizers import ResponseMode
 from llama_index.core import get_response_synthesizer
 from data_definitions.constants import SYSTEM_MESSAGE
 from llama_index.core.postprocessor import PrevNextNodePostprocessor
 from services.knowledge_base_services import KnowledgeBaseService
+from services.metrics_services import observe_stage
 
 #services
 kb_services = KnowledgeBaseService()
@@ -18,7 +22,7 @@ router = APIRouter(
 
 
 @router.get("/fusion_retriever/")
-def fusion_retriever_bm25(query: str, course_name: str, user: str):
+async def fusion_retriever_bm25(query: str, course_name: str, user: str):
     """
     Endpoint to perform a query using a fusion retriever (BM25 and vector retriever) and interact with a chat engine.
 
@@ -34,36 +38,142 @@ def fusion_retriever_bm25(query: str, course_name: str, user: str):
     - HTTPException: If the course is not found or any other error occurs.
     """
     try: 
-        # Check if the course exists
-        if course_name not in kb_services.get_all_course():
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{course_name} not found")
+        chat_engine, user_conversation = await acreate_course_chat_engine(course_name, user)
         
-        #create vector retriever
-        index = chat_services.get_vector_index(course_name)
-        vector_retriever = index.as_retriever(similarity_top_k=3)
+        #chat with the chatbot
+        response = await chat_engine.achat(query)
 
-        #create bm25 retriever
-        docstore = chat_services.get_docstore(course_name)
-        bm25_retriever = chat_services.create_bm25_retriever(docstore)
+        #store conversation
+        with observe_stage("add_message"):
+            await user_conversation.add_message(query,str(response))
 
-        #create fusion retriever
-        fusion_retriever =  chat_services.query_fusion_retriever(vector_retriever,bm25_retriever)
-        
-        #instantiate Chathistory for storing and retrieving convertsations
-        user_conversation = ChatHistory(subject=course_name,user_id=user)
+        return str(response)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
-        #retrieve chathistory
-        chat_history =  user_conversation.get_chat_history()
 
-        #create CondensePlusContextChatEngine
-        chat_engine = chat_services.create_CondensePlusContextChatEngine(fusion_retriever,chat_history,docstore,course_name)
-        
-        #chat with the chatbot
-        response = chat_engine.chat(query)
+@router.get("/fusion_retriever/stream/")
+def fusion_retriever_bm25_stream(query: str, course_name: str, user: str):
+    """
+    Streaming variant of the fusion retriever endpoint. The answer is sent token by token as Server-Sent Events.
 
-        #store conversation
-        user_conversation.add_message(query,str(response))
+    Parameters:
+    - query (str): The query string provided by the user.
+    - course_name (str): The name of the course to search within.
+    - user (str): The user ID.
 
-        return str(response)
+    Returns:
+    - StreamingResponse: A text/event-stream of "data" events, each holding a JSON encoded token,
+      followed by an "end" event once the answer is stored, or an "error" event if generation fails.
+
+    Raises:
+    - HTTPException: If the course is not found or any other error occurs before streaming starts.
+    """
+    try:
+        chat_engine, user_conversation = create_course_chat_engine(course_name, user)
+
+        #condense, retrieve and start the streamed completion
+        streaming_response = chat_engine.stream_chat(query)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    def event_stream():
+        tokens = []
+        try:
+            for token in streaming_response.response_gen:
+                tokens.append(token)
+                yield f"data: {json.dumps(token)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+            return
+
+        #store conversation and cache the answer once the whole answer is known
+        answer = "".join(tokens)
+        chat_engine.record_answer_metrics()
+        chat_engine.cache_answer(answer)
+        with observe_stage("add_message"):
+            user_conversation.add_message(query,answer)
+        yield "event: end\ndata: \n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def create_course_chat_engine(course_name: str, user: str):
+    """
+    Builds the chat engine of a course for a user, on top of the cached course retrievers.
+
+    Parameters:
+    - course_name (str): The name of the course.
+    - user (str): The user ID.
+
+    Returns:
+    - tuple: The CondensePlusContextChatEngine and the user's ChatHistory.
+
+    Raises:
+    - HTTPException: If the course is not found.
+    """
+    # Check if the course exists
+    with observe_stage("course_check"):
+        course_exists = kb_services.course_exists(course_name)
+    if not course_exists:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{course_name} not found")
+    
+    #get the cached vector, bm25 and fusion retrievers of the course
+    course_retriever = chat_services.get_course_retriever(course_name)
+    fusion_retriever = course_retriever["fusion_retriever"]
+    docstore = course_retriever["docstore"]
+    
+    #instantiate Chathistory for storing and retrieving convertsations
+    user_conversation = ChatHistory(subject=course_name,user_id=user)
+
+    #retrieve chathistory
+    with observe_stage("chat_history_load"):
+        chat_history =  user_conversation.get_chat_history()
+
+    #create CondensePlusContextChatEngine
+    chat_engine = chat_services.create_CondensePlusContextChatEngine(fusion_retriever,chat_history,docstore,course_name)
+    return chat_engine, user_conversation
+
+
+async def acreate_course_chat_engine(course_name: str, user: str):
+    """
+    Async version of create_course_chat_engine. Chat history is read with motor,
+    and a cache miss on the course retrievers is built in the threadpool.
+
+    Parameters:
+    - course_name (str): The name of the course.
+    - user (str): The user ID.
+
+    Returns:
+    - tuple: The CondensePlusContextChatEngine and the user's AsyncChatHistory.
+
+    Raises:
+    - HTTPException: If the course is not found.
+    """
+    # Check if the course exists
+    with observe_stage("course_check"):
+        course_exists = kb_services.course_exists(course_name)
+    if not course_exists:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"{course_name} not found")
+    
+    #get the cached vector, bm25 and fusion retrievers of the course
+    course_retriever = await run_in_threadpool(chat_services.get_course_retriever, course_name)
+    fusion_retriever = course_retriever["fusion_retriever"]
+    docstore = course_retriever["docstore"]
+    
+    #instantiate AsyncChathistory for storing and retrieving convertsations
+    user_conversation = AsyncChatHistory(subject=course_name,user_id=user)
+
+    #retrieve chathistory
+    with observe_stage("chat_history_load"):
+        chat_history = await user_conversation.get_chat_history()
+
+    #create CondensePlusContextChatEngine
+    chat_engine = chat_services.create_CondensePlusContextChatEngine(fusion_retriever,chat_history,docstore,course_name)
+    return chat_engine, user_conversation
@@ -9,12 +9,16 @@ from services.evaluation_services import file_cost_embeddings
 from services.statistics_services import StatisticsServices
 from services.knowledge_base_services import KnowledgeBaseService
 from datetime import datetime
-from data_definitions.schemas import MessageCountResponse, ConversationCountResponse
+from data_definitions.schemas import MessageCountResponse, ConversationCountResponse, DashboardResponse
+from services.dashboard_services import DashboardService
+from typing import List, Optional
+from fastapi import Query
 router = APIRouter(
     prefix="/stats",
     tags=["stats"]
 )    
 kb_service = KnowledgeBaseService()
+dashboard_service = DashboardService()
 @router.get("/message-count", response_model=MessageCountResponse)
 def get_messages_count(subject: str, start_date: datetime, end_date: datetime):
     """
@@ -32,8 +36,7 @@ def get_messages_count(subject: str, start_date: datetime, end_date: datetime):
     """
     try:
         stats = StatisticsServices(subject)
-        result = kb_service.get_all_course()
-        if subject not in result:
+        if not kb_service.course_exists(subject):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Course '{subject}' not found")
         
         total_messages = stats.count_messages_in_date_range(start_date, end_date)
@@ -54,8 +57,7 @@ def get_all_conversations_count(subject: str):
     - HTTP 500 for any other server errors.
     """
     try:
-        courses = kb_service.get_all_course()
-        if subject not in courses:
+        if not kb_service.course_exists(subject):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Course '{subject}' not found")
         stats = StatisticsServices(subject)
         total_conversations = stats.count_total_conversations()
@@ -83,11 +85,44 @@ def get_conversations_count(subject: str, start_date: datetime, end_date: dateti
     """
     try:
         stats = StatisticsServices(subject)
-        result = kb_service.get_all_course()
-        if subject not in result:
+        if not kb_service.course_exists(subject):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"subject '{subject}' not found")
         
         total_messages = stats.count_conversations_in_date_range(start_date, end_date)
         return ConversationCountResponse(subject=subject,conversation_count=total_messages)
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.get("/dashboard", response_model=DashboardResponse)
+def get_dashboard(courses: Optional[List[str]] = Query(None), start_date: Optional[datetime] = None,
+                  end_date: Optional[datetime] = None, granularity: str = "day", top_users: int = 5):
+    """
+    Endpoint to get the activity of several courses at once for an analytics dashboard.
+
+    Parameters:
+    - courses (List[str], optional): The courses, repeated as query parameters. Defaults to every course.
+    - start_date (datetime, optional): The start of the date range. Defaults to 30 days before end_date.
+    - end_date (datetime, optional): The end of the date range. Defaults to now, rounded up to the minute.
+    - granularity (str): The unit of the time series: hour, day, week or month.
+    - top_users (int): The number of most active users returned per course.
+
+    Returns:
+    - DashboardResponse: The message, conversation and active user counts, the time series,
+      the most active users and the feedback count of each status, per course.
+      Served from a cache for DASHBOARD_CACHE_TTL_SECONDS.
+    - HTTP 400 for an unknown granularity or a top_users below 1.
+    - HTTP 404 if a course is not found.
+    - HTTP 500 for any other server errors.
+    """
+    try:
+        for course_name in courses or []:
+            if not kb_service.course_exists(course_name):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Course '{course_name}' not found")
+        return dashboard_service.get_dashboard(courses, start_date, end_date, granularity, top_users)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
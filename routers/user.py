@@ -1,40 +1,34 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from data_definitions.schemas import User, UserCreate, UserUpdate
-from pymongo import MongoClient
 import datetime
 import os
-from authentication.utils import hash
+from authentication.utils import ahash
 from services.user_service import UserService
+from authentication.oauth2 import get_users_collection
 router = APIRouter(
     prefix="/users",
     tags=["users"]
 )    
 
 user_service = UserService()
-# Replace with your MongoDB connection string
-connection_string = os.getenv("MONGODB_CONNECTION_STRING")
-
-# Connect to MongoDB
-client = MongoClient(connection_string)
-
-# Get the database and collection
-db = client["chatbot"]
-collection = db["users"]
 
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=User)
-async def create_user(user:UserCreate):
+async def create_user(user:UserCreate, collection = Depends(get_users_collection)):
     """
     Creates a new user in the database.
 
     Args:
         user: User data to create.
     """
-    existing_user = collection.find_one({"school_id": user.school_id})
+    existing_user = await run_in_threadpool(collection.find_one, {"school_id": user.school_id})
     if existing_user:
         raise HTTPException(status_code=400, detail="School ID already exists")
-    user_data = user_service.create_user(user)
+    # the password is hashed on the bounded password pool, the threadpool only waits on the database
+    hashed_password = await ahash(user.password)
+    user_data = await run_in_threadpool(user_service.create_user, user, hashed_password)
     # user_data = user.dict()
     # #user_data["created_at"] = datetime.utcnow()  # Set the current timestamp
   
@@ -0,0 +1,22 @@
+"""
+Builds the day and hour statistics rollups of existing chat history.
+
+Usage, from the repository root:
+    python -m scripts.backfill_stats_rollups [--subject SUBJECT]
+"""
+import argparse
+from services.statistics_services import rebuild_stats_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the statistics rollups from the stored chat history.")
+    parser.add_argument("--subject", help="Subject to backfill. Defaults to every subject.")
+    args = parser.parse_args()
+
+    result = rebuild_stats_rollups(args.subject)
+    print(f"Wrote {result['rollups']} rollups for {result['messages']} messages "
+          f"in {result['subjects']} subjects")
+
+
+if __name__ == "__main__":
+    main()
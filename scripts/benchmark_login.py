@@ -0,0 +1,102 @@
+"""
+Measures login throughput under concurrent load.
+
+Against a running server, posts concurrent /login requests with the given credentials:
+    python -m scripts.benchmark_login --url http://localhost:8000 --email EMAIL --password PASSWORD
+
+Without --url, runs the password verification of the login in process, on the bounded
+password pool, and also reports how long the event loop was stalled meanwhile:
+    python -m scripts.benchmark_login [--requests 200] [--concurrency 50]
+
+The pool size and bcrypt cost come from PASSWORD_HASH_CONCURRENCY and BCRYPT_ROUNDS.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from authentication.utils import BCRYPT_ROUNDS, PASSWORD_HASH_CONCURRENCY, averify_and_update, hash
+
+
+def report(latencies, errors: int, elapsed: float):
+    latencies = sorted(latencies)
+    print(f"{len(latencies)} logins in {elapsed:.2f}s: {len(latencies) / elapsed:.1f} logins/s, {errors} errors")
+    if latencies:
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        print(f"latency p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms")
+
+
+def benchmark_server(url: str, email: str, password: str, total: int, concurrency: int):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def login(_):
+        start = time.perf_counter()
+        response = session.post(f"{url.rstrip('/')}/login", data={"username": email, "password": password})
+        return time.perf_counter() - start, response.status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(login, range(total)))
+    elapsed = time.perf_counter() - start
+    report([latency for latency, ok in results if ok], sum(1 for _, ok in results if not ok), elapsed)
+
+
+async def benchmark_local(total: int, concurrency: int):
+    password = "benchmark-password"
+    hashed = hash(password)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    max_lag = 0.0
+    done = asyncio.Event()
+
+    async def watch_loop():
+        # a request served by the same loop waits for as long as a tick is late
+        nonlocal max_lag
+        while not done.is_set():
+            tick = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - tick - 0.01)
+
+    async def login():
+        async with semaphore:
+            start = time.perf_counter()
+            valid, _ = await averify_and_update(password, hashed)
+            if valid:
+                latencies.append(time.perf_counter() - start)
+
+    watcher = asyncio.create_task(watch_loop())
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await watcher
+    report(latencies, total - len(latencies), elapsed)
+    print(f"event loop stalled at most {max_lag * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure login throughput under concurrent load.")
+    parser.add_argument("--url", help="Base URL of a running server. Defaults to an in-process benchmark.")
+    parser.add_argument("--email", help="Email of an existing user, with --url.")
+    parser.add_argument("--password", help="Password of the user, with --url.")
+    parser.add_argument("--requests", type=int, default=200, help="Number of logins. Defaults to 200.")
+    parser.add_argument("--concurrency", type=int, default=50, help="Logins in flight at once. Defaults to 50.")
+    args = parser.parse_args()
+
+    print(f"bcrypt rounds {BCRYPT_ROUNDS}, password pool of {PASSWORD_HASH_CONCURRENCY} threads, "
+          f"{args.concurrency} concurrent logins")
+    if args.url:
+        if not args.email or not args.password:
+            parser.error("--email and --password are required with --url")
+        benchmark_server(args.url, args.email, args.password, args.requests, args.concurrency)
+    else:
+        asyncio.run(benchmark_local(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
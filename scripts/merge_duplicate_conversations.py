@@ -0,0 +1,28 @@
+"""
+Merges the duplicate conversation headers of a user in "chat_history.<subject>" and makes
+the user_id index unique. Startup does the same; run this to do it ahead of a deployment.
+
+Usage, from the repository root:
+    python -m scripts.merge_duplicate_conversations [--subject SUBJECT]
+"""
+import argparse
+from services.database_services import get_mongo_client
+from services.index_services import create_indexes, merge_duplicate_conversations, subject_indexes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge duplicate conversation headers and make user_id unique.")
+    parser.add_argument("--subject", help="Subject to merge. Defaults to every subject.")
+    args = parser.parse_args()
+
+    client = get_mongo_client()
+    subjects = [args.subject] if args.subject else client["chat_history"].list_collection_names()
+    merged = 0
+    for subject in subjects:
+        merged += merge_duplicate_conversations(client["chat_history"][subject])
+        create_indexes([spec for spec in subject_indexes(subject) if spec[0] == "chat_history"], client)
+    print(f"Merged {merged} duplicate conversation headers in {len(subjects)} subjects")
+
+
+if __name__ == "__main__":
+    main()
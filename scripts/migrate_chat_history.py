@@ -0,0 +1,22 @@
+"""
+Moves existing conversations from the single "messages" array layout to message buckets.
+
+Usage, from the repository root:
+    python -m scripts.migrate_chat_history [--subject SUBJECT]
+"""
+import argparse
+from services.memory_services import migrate_conversations_to_buckets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate chat history to message buckets.")
+    parser.add_argument("--subject", help="Subject to migrate. Defaults to every subject.")
+    args = parser.parse_args()
+
+    result = migrate_conversations_to_buckets(args.subject)
+    print(f"Migrated {result['messages']} messages of {result['conversations']} conversations "
+          f"in {result['subjects']} subjects")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""
+Moves the file names stored in the "file_names" array of each "vector.records" course document
+to the "vector.files" registry.
+
+Usage, from the repository root:
+    python -m scripts.migrate_file_registry
+"""
+from services.knowledge_base_services import migrate_file_records
+
+
+def main():
+    result = migrate_file_records()
+    print(f"Migrated {result['files']} files of {result['courses']} courses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.utils import globals_helper
+from nltk.stem import PorterStemmer
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from collections import Counter
+from services.database_services import get_mongo_client
+from typing import Dict, List
+import asyncio
+import math
+import re
+from dotenv import load_dotenv
+load_dotenv()
+
+_stemmer = PorterStemmer()
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into lowercase, stemmed tokens with english stopwords removed.
+
+    Parameters:
+        text (str): The text to tokenize.
+
+    Returns:
+        List[str]: The tokens of the text.
+    """
+    words = re.findall(r"\w+", text.lower())
+    return [_stemmer.stem(word) for word in words if word not in globals_helper.stopwords]
+
+
+class BM25IndexService():
+    """
+    Service class for a persisted, incrementally maintained BM25 inverted index per course.
+
+    For every course the "bm25" database holds three collections:
+        <course>/terms: one document per term with its document frequency and
+            postings, a map of node id to term frequency and node length.
+        <course>/docs: one document per indexed node with its file name and terms,
+            used to remove a file's postings.
+        <course>/stats: the node count and total length used for the average node length.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75, client=None):
+        self.client = client or get_mongo_client()
+        self.db = self.client["bm25"]
+        self.k1 = k1
+        self.b = b
+
+    def add_nodes(self,course_name: str, nodes: List[BaseNode]):
+        """
+        Adds nodes to the inverted index of a course. Nodes that are already indexed are skipped.
+
+        Parameters:
+            course_name (str): Name of the course.
+            nodes (List[BaseNode]): Nodes to be indexed.
+        """
+        try:
+            if not nodes:
+                return
+            docs = []
+            for node in nodes:
+                term_frequencies = Counter(tokenize(node.get_content()))
+                docs.append({
+                    "_id": node.node_id,
+                    "file_name": node.metadata.get("file_name"),
+                    "length": sum(term_frequencies.values()),
+                    "terms": dict(term_frequencies),
+                })
+
+            # the unique _id makes a concurrent or repeated add of the same node a no-op
+            docs_collection = self.db[f"{course_name}/docs"]
+            docs_collection.create_index("file_name")
+            skipped_ids = set()
+            try:
+                docs_collection.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                skipped_ids = {error["op"]["_id"] for error in e.details["writeErrors"] if error.get("code") == 11000}
+                if len(skipped_ids) != len(e.details["writeErrors"]):
+                    raise
+            docs = [doc for doc in docs if doc["_id"] not in skipped_ids]
+            if not docs:
+                return
+
+            postings = {}
+            for doc in docs:
+                for term, tf in doc["terms"].items():
+                    postings.setdefault(term, {})[f"postings.{doc['_id']}"] = {"tf": tf, "len": doc["length"]}
+            operations = [
+                UpdateOne({"_id": term}, {"$set": term_postings, "$inc": {"df": len(term_postings)}}, upsert=True)
+                for term, term_postings in postings.items()
+            ]
+            if operations:
+                self.db[f"{course_name}/terms"].bulk_write(operations, ordered=False)
+
+            self.db[f"{course_name}/stats"].update_one(
+                {"_id": "stats"},
+                {"$inc": {"doc_count": len(docs), "total_length": sum(doc["length"] for doc in docs)}},
+                upsert=True
+            )
+        except Exception as e:
+            raise Exception("Error in adding nodes to bm25 index: " + str(e))
+
+    def remove_file(self,course_name: str, file_name: str):
+        """
+        Removes all nodes of a file from the inverted index of a course.
+
+        Parameters:
+            course_name (str): Name of the course.
+            file_name (str): Name of the file to be removed.
+        """
+        try:
+            self._remove_docs(course_name, {"file_name": file_name})
+        except Exception as e:
+            raise Exception("Error in removing file from bm25 index: " + str(e))
+
+    def remove_files(self,course_name: str, file_names: List[str]) -> int:
+        """
+        Removes all nodes of several files from the inverted index of a course.
+
+        Parameters:
+            course_name (str): Name of the course.
+            file_names (List[str]): Names of the files to be removed.
+
+        Returns:
+            int: The number of nodes removed.
+        """
+        try:
+            return self._remove_docs(course_name, {"file_name": {"$in": file_names}})
+        except Exception as e:
+            raise Exception("Error in removing files from bm25 index: " + str(e))
+
+    def remove_nodes(self,course_name: str, node_ids: List[str]):
+        """
+        Removes nodes from the inverted index of a course.
+
+        Parameters:
+            course_name (str): Name of the course.
+            node_ids (List[str]): Ids of the nodes to be removed.
+        """
+        try:
+            self._remove_docs(course_name, {"_id": {"$in": node_ids}})
+        except Exception as e:
+            raise Exception("Error in removing nodes from bm25 index: " + str(e))
+
+    def _remove_docs(self,course_name: str, filter_criteria: dict) -> int:
+        docs_collection = self.db[f"{course_name}/docs"]
+        docs = list(docs_collection.find(filter_criteria))
+        if not docs:
+            return 0
+
+        unset = {}
+        for doc in docs:
+            for term in doc["terms"]:
+                unset.setdefault(term, {})[f"postings.{doc['_id']}"] = ""
+        terms_collection = self.db[f"{course_name}/terms"]
+        operations = [
+            UpdateOne({"_id": term}, {"$unset": term_postings, "$inc": {"df": -len(term_postings)}})
+            for term, term_postings in unset.items()
+        ]
+        if operations:
+            terms_collection.bulk_write(operations, ordered=False)
+        terms_collection.delete_many({"df": {"$lte": 0}})
+
+        docs_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        self.db[f"{course_name}/stats"].update_one(
+            {"_id": "stats"},
+            {"$inc": {"doc_count": -len(docs), "total_length": -sum(doc["length"] for doc in docs)}}
+        )
+        print("Deleted count bm25:", len(docs))
+        return len(docs)
+
+    def drop_course(self,course_name: str):
+        """
+        Drops the whole inverted index of a course.
+
+        Parameters:
+            course_name (str): Name of the course.
+        """
+        try:
+            self.db.drop_collection(f"{course_name}/terms")
+            self.db.drop_collection(f"{course_name}/docs")
+            self.db.drop_collection(f"{course_name}/stats")
+        except Exception as e:
+            raise Exception("Error in dropping bm25 index: " + str(e))
+
+    def ensure_index(self,course_name: str, docstore):
+        """
+        Builds the inverted index of a course from its docstore if it was never built,
+        e.g. for courses ingested before the index existed.
+
+        Parameters:
+            course_name (str): Name of the course.
+            docstore: The document store of the course.
+        """
+        try:
+            stats = self.db[f"{course_name}/stats"].find_one({"_id": "stats"})
+            if stats and stats.get("built"):
+                return
+            self.add_nodes(course_name, list(docstore.docs.values()))
+            self.db[f"{course_name}/stats"].update_one(
+                {"_id": "stats"},
+                {"$set": {"built": True}, "$inc": {"doc_count": 0, "total_length": 0}},
+                upsert=True
+            )
+        except Exception as e:
+            raise Exception("Error in building bm25 index: " + str(e))
+
+    def search(self,course_name: str, query: str, top_k: int) -> List[tuple]:
+        """
+        Scores the nodes of a course against a query with BM25, reading only the postings of the query terms.
+
+        Parameters:
+            course_name (str): Name of the course.
+            query (str): The query string.
+            top_k (int): Number of results to return.
+
+        Returns:
+            List[tuple]: (node_id, score) pairs, best first.
+        """
+        try:
+            query_terms = Counter(tokenize(query))
+            if not query_terms:
+                return []
+            stats = self.db[f"{course_name}/stats"].find_one({"_id": "stats"})
+            if not stats or stats.get("doc_count", 0) <= 0:
+                return []
+            doc_count = stats["doc_count"]
+            avg_length = stats["total_length"] / doc_count or 1
+
+            scores: Dict[str, float] = {}
+            for term_doc in self.db[f"{course_name}/terms"].find({"_id": {"$in": list(query_terms)}}):
+                df = term_doc["df"]
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                weight = idf * query_terms[term_doc["_id"]]
+                for node_id, posting in term_doc.get("postings", {}).items():
+                    tf = posting["tf"]
+                    norm = tf + self.k1 * (1 - self.b + self.b * posting["len"] / avg_length)
+                    scores[node_id] = scores.get(node_id, 0.0) + weight * tf * (self.k1 + 1) / norm
+
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        except Exception as e:
+            raise Exception("Error in searching bm25 index: " + str(e))
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """
+    Retriever that scores nodes with the persisted BM25 index of a course
+    and loads only the matching nodes from the docstore.
+    """
+    def __init__(self, index_service: BM25IndexService, course_name: str, docstore, similarity_top_k: int = 3):
+        self._index_service = index_service
+        self._course_name = course_name
+        self._docstore = docstore
+        self._similarity_top_k = similarity_top_k
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        results = self._index_service.search(self._course_name, query_bundle.query_str, self._similarity_top_k)
+        if not results:
+            return []
+        nodes = self._docstore.get_nodes([node_id for node_id, _ in results], raise_error=False)
+        nodes_by_id = {node.node_id: node for node in nodes if node is not None}
+        return [
+            NodeWithScore(node=nodes_by_id[node_id], score=score)
+            for node_id, score in results
+            if node_id in nodes_by_id
+        ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # the index lives behind the sync pymongo client, keep it off the event loop
+        return await asyncio.to_thread(self._retrieve, query_bundle)
@@ -0,0 +1,209 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, List, Optional
+import numpy as np
+import time
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+class RetrieverCache():
+    """
+    Process-wide LRU cache of the per-course retrieval components
+    (vector index, docstore, BM25 retriever and fusion retriever).
+    """
+    def __init__(self, max_size: Optional[int] = None):
+        """
+        Initializes the RetrieverCache object.
+
+        Parameters:
+            max_size (int, optional): Maximum number of courses kept in the cache.
+                Defaults to the RETRIEVER_CACHE_SIZE environment variable or 16.
+        """
+        if max_size is None:
+            max_size = int(os.getenv("RETRIEVER_CACHE_SIZE", 16))
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        # bumped on every invalidation so a build that raced with an
+        # ingest or delete is not stored over the fresh state
+        self._generations = {}
+
+    def get_or_create(self, course_name: str, factory: Callable[[str], Any]) -> Any:
+        """
+        Returns the cached entry for a course, building it with factory on a miss.
+
+        Parameters:
+            course_name (str): Name of the course.
+            factory (Callable): Called with the course name to build the entry.
+
+        Returns:
+            Any: The cached or newly built entry.
+        """
+        with self._lock:
+            entry = self._entries.get(course_name)
+            if entry is not None:
+                self._entries.move_to_end(course_name)
+                return entry
+            generation = self._generations.get(course_name, 0)
+
+        # build outside the lock, BM25 construction can take seconds
+        entry = factory(course_name)
+
+        with self._lock:
+            if self._generations.get(course_name, 0) == generation:
+                self._entries[course_name] = entry
+                self._entries.move_to_end(course_name)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, course_name: str):
+        """
+        Drops the cached entry of a course.
+
+        Parameters:
+            course_name (str): Name of the course.
+        """
+        with self._lock:
+            self._entries.pop(course_name, None)
+            self._generations[course_name] = self._generations.get(course_name, 0) + 1
+
+    def clear(self):
+        """
+        Drops every cached entry.
+        """
+        with self._lock:
+            for course_name in self._entries:
+                self._generations[course_name] = self._generations.get(course_name, 0) + 1
+            self._entries.clear()
+
+
+class SemanticAnswerCache():
+    """
+    Per-course cache of answers keyed on the embedding of the condensed question.
+    A question whose embedding is close enough to a cached one reuses its answer.
+    """
+    def __init__(self, threshold: Optional[float] = None, ttl_seconds: Optional[int] = None, max_entries: Optional[int] = None):
+        """
+        Initializes the SemanticAnswerCache object.
+
+        Parameters:
+            threshold (float, optional): Minimum cosine similarity for a hit.
+                Defaults to the SEMANTIC_CACHE_THRESHOLD environment variable or 0.95.
+            ttl_seconds (int, optional): Lifetime of an entry in seconds.
+                Defaults to the SEMANTIC_CACHE_TTL_SECONDS environment variable or 86400.
+            max_entries (int, optional): Maximum number of entries per course.
+                Defaults to the SEMANTIC_CACHE_SIZE environment variable or 512.
+        """
+        if threshold is None:
+            threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", 86400))
+        if max_entries is None:
+            max_entries = int(os.getenv("SEMANTIC_CACHE_SIZE", 512))
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # course name -> OrderedDict of entry id -> (normalized embedding, answer, created at)
+        self._courses = {}
+        self._next_id = 0
+        self._lock = Lock()
+        # bumped on every invalidation so an answer generated from the old
+        # knowledge base is not stored after an ingest or delete
+        self._generations = {}
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, course_name: str, embedding: List[float]) -> Optional[str]:
+        """
+        Returns the cached answer of the most similar question of a course, if it is above the threshold.
+
+        Parameters:
+            course_name (str): Name of the course.
+            embedding (List[float]): Embedding of the condensed question.
+
+        Returns:
+            str or None: The cached answer, or None on a miss.
+        """
+        query = self._normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._courses.get(course_name)
+            if not entries:
+                return None
+            for entry_id in [entry_id for entry_id, entry in entries.items() if now - entry[2] > self.ttl_seconds]:
+                del entries[entry_id]
+            if not entries:
+                return None
+            entry_ids = list(entries)
+            matrix = np.stack([entries[entry_id][0] for entry_id in entry_ids])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            entries.move_to_end(entry_ids[best])
+            return entries[entry_ids[best]][1]
+
+    def generation(self, course_name: str) -> int:
+        """
+        Returns the invalidation generation of a course, to be passed back to add.
+
+        Parameters:
+            course_name (str): Name of the course.
+
+        Returns:
+            int: The current generation.
+        """
+        with self._lock:
+            return self._generations.get(course_name, 0)
+
+    def add(self, course_name: str, embedding: List[float], answer: str, generation: Optional[int] = None):
+        """
+        Stores the answer of a condensed question.
+
+        Parameters:
+            course_name (str): Name of the course.
+            embedding (List[float]): Embedding of the condensed question.
+            answer (str): The answer to cache.
+            generation (int, optional): Generation read before the answer was generated.
+                The answer is dropped if the course was invalidated since.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(course_name, 0):
+                return
+            entries = self._courses.setdefault(course_name, OrderedDict())
+            entries[self._next_id] = (vector, answer, time.monotonic())
+            self._next_id += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, course_name: str):
+        """
+        Drops every cached answer of a course.
+
+        Parameters:
+            course_name (str): Name of the course.
+        """
+        with self._lock:
+            self._courses.pop(course_name, None)
+            self._generations[course_name] = self._generations.get(course_name, 0) + 1
+
+
+retriever_cache = RetrieverCache()
+answer_cache = SemanticAnswerCache()
+
+def invalidate_course_caches(course_name: str):
+    """
+    Drops everything cached for a course. Called whenever its knowledge base changes.
+
+    Parameters:
+        course_name (str): Name of the course.
+    """
+    retriever_cache.invalidate(course_name)
+    answer_cache.invalidate(course_name)
@@ -3,24 +3,205 @@ from llama_index.core import (
     StorageContext,
 )
 from llama_index.core.chat_engine import CondensePlusContextChatEngine, ContextChatEngine
+from llama_index.core.chat_engine.types import AgentChatResponse, StreamingAgentChatResponse
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.llms import ChatMessage, MessageRole
 from llama_index.core import get_response_synthesizer
 from llama_index.core.postprocessor import PrevNextNodePostprocessor
-from llama_index.retrievers.bm25 import BM25Retriever
 from llama_index.core.retrievers import QueryFusionRetriever
 from llama_index.storage.docstore.mongodb import MongoDocumentStore
 import os
+import asyncio
 from llama_index.core.response_synthesizers import ResponseMode
 from llama_index.vector_stores.mongodb import MongoDBAtlasVectorSearch
-import pymongo
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
 from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.core.tools import QueryEngineTool,ToolMetadata
 from llama_index.agent.openai import OpenAIAgent
 from llama_index.llms.openai import OpenAI
 from data_definitions.constants import SYSTEM_MESSAGE
-from typing import List
+from services.cache_services import retriever_cache, answer_cache
+from services.database_services import get_mongo_client, get_mongo_docstore
+from services.bm25_index_services import BM25IndexService, BM25IndexRetriever
+from services.metrics_services import (
+    STAGE_LATENCY,
+    TimedQueryFusionRetriever,
+    TimedRetriever,
+    create_token_counter,
+    observe_stage,
+    record_token_usage,
+)
+from time import perf_counter
+from typing import List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
+class AsyncMongoDBAtlasVectorSearch(MongoDBAtlasVectorSearch):
+    """
+    MongoDBAtlasVectorSearch whose async query runs the blocking $vectorSearch
+    in a worker thread instead of on the event loop.
+    """
+    async def aquery(self, query: VectorStoreQuery, **kwargs) -> VectorStoreQueryResult:
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+
+class CachedCondensePlusContextChatEngine(CondensePlusContextChatEngine):
+    """
+    CondensePlusContextChatEngine that checks the course's semantic answer cache
+    with the condensed question before retrieving and generating an answer,
+    and records the condense and answer synthesis latencies and LLM token usage.
+    """
+    _answer_cache = None
+    _llm_token_counter = None
+    _synthesis_started = None
+
+    def enable_metrics(self, course_name: str, token_counter):
+        """
+        Turns on the token usage counters for this engine.
+
+        Parameters:
+            course_name (str): Name of the course the tokens are counted for.
+            token_counter (TokenCountingHandler): Token counter registered on the engine's LLM.
+        """
+        self._metrics_course_name = course_name
+        self._llm_token_counter = token_counter
+
+    def record_answer_metrics(self):
+        """
+        Records the answer synthesis latency and the tokens used by the last answer.
+        Called by chat and achat, and by callers of stream_chat once the stream is consumed.
+        """
+        if self._synthesis_started is not None:
+            STAGE_LATENCY.labels("answer_synthesis").observe(perf_counter() - self._synthesis_started)
+            self._synthesis_started = None
+        if self._llm_token_counter is not None:
+            record_token_usage(self._metrics_course_name, self._llm_token_counter)
+
+    def _run_c3(self, message: str, chat_history: Optional[List[ChatMessage]] = None):
+        result = super()._run_c3(message, chat_history)
+        # everything after the context is built is the LLM generating the answer
+        self._synthesis_started = perf_counter()
+        return result
+
+    async def _arun_c3(self, message: str, chat_history: Optional[List[ChatMessage]] = None):
+        result = await super()._arun_c3(message, chat_history)
+        self._synthesis_started = perf_counter()
+        return result
+
+    def enable_answer_cache(self, course_name: str, embed_model, cache=answer_cache):
+        """
+        Turns on the semantic answer cache for this engine.
+
+        Parameters:
+            course_name (str): Name of the course the answers belong to.
+            embed_model: Embedding model used for the condensed question.
+            cache (SemanticAnswerCache, optional): The cache to use. Defaults to the process-wide cache.
+        """
+        self._answer_cache = cache
+        self._course_name = course_name
+        self._embed_model = embed_model
+        self._condensed_question = None
+        self._question_embedding = None
+        self._cache_generation = None
+
+    def _condense_question(self, chat_history: List[ChatMessage], latest_message: str) -> str:
+        # reuse the question condensed for the cache lookup instead of asking the LLM twice
+        if self._answer_cache is not None and self._condensed_question is not None:
+            condensed_question, self._condensed_question = self._condensed_question, None
+            return condensed_question
+        with observe_stage("condense"):
+            return super()._condense_question(chat_history, latest_message)
+
+    async def _acondense_question(self, chat_history: List[ChatMessage], latest_message: str) -> str:
+        if self._answer_cache is not None and self._condensed_question is not None:
+            condensed_question, self._condensed_question = self._condensed_question, None
+            return condensed_question
+        with observe_stage("condense"):
+            return await super()._acondense_question(chat_history, latest_message)
+
+    def _cached_answer(self, message: str, condensed_question: str, embedding: List[float]) -> Optional[str]:
+        self._condensed_question = condensed_question
+        self._question_embedding = embedding
+        answer = self._answer_cache.lookup(self._course_name, embedding)
+        if answer is not None:
+            self._condensed_question = None
+            self._question_embedding = None
+            self._memory.put(ChatMessage(content=message, role=MessageRole.USER))
+            self._memory.put(ChatMessage(content=answer, role=MessageRole.ASSISTANT))
+        return answer
+
+    def _lookup_answer(self, message: str, chat_history: Optional[List[ChatMessage]]) -> Optional[str]:
+        if chat_history is not None:
+            self._memory.set(chat_history)
+        self._cache_generation = self._answer_cache.generation(self._course_name)
+        with observe_stage("condense"):
+            condensed_question = super()._condense_question(self._memory.get(input=message), message)
+        embedding = self._embed_model.get_text_embedding(condensed_question)
+        return self._cached_answer(message, condensed_question, embedding)
+
+    async def _alookup_answer(self, message: str, chat_history: Optional[List[ChatMessage]]) -> Optional[str]:
+        if chat_history is not None:
+            self._memory.set(chat_history)
+        self._cache_generation = self._answer_cache.generation(self._course_name)
+        with observe_stage("condense"):
+            condensed_question = await super()._acondense_question(self._memory.get(input=message), message)
+        embedding = await self._embed_model.aget_text_embedding(condensed_question)
+        return self._cached_answer(message, condensed_question, embedding)
+
+    def cache_answer(self, answer: str):
+        """
+        Stores the answer generated for the last looked up question.
+        Called by chat and achat, and by callers of stream_chat once the stream is consumed.
+
+        Parameters:
+            answer (str): The generated answer.
+        """
+        if self._answer_cache is None or self._question_embedding is None:
+            return
+        self._answer_cache.add(self._course_name, self._question_embedding, answer, self._cache_generation)
+        self._question_embedding = None
+
+    def chat(self, message: str, chat_history: Optional[List[ChatMessage]] = None) -> AgentChatResponse:
+        if self._answer_cache is None:
+            response = super().chat(message, chat_history)
+            self.record_answer_metrics()
+            return response
+        answer = self._lookup_answer(message, chat_history)
+        if answer is not None:
+            self.record_answer_metrics()
+            return AgentChatResponse(response=answer)
+        response = super().chat(message)
+        self.record_answer_metrics()
+        self.cache_answer(response.response)
+        return response
+
+    async def achat(self, message: str, chat_history: Optional[List[ChatMessage]] = None) -> AgentChatResponse:
+        if self._answer_cache is None:
+            response = await super().achat(message, chat_history)
+            self.record_answer_metrics()
+            return response
+        answer = await self._alookup_answer(message, chat_history)
+        if answer is not None:
+            self.record_answer_metrics()
+            return AgentChatResponse(response=answer)
+        response = await super().achat(message)
+        self.record_answer_metrics()
+        self.cache_answer(response.response)
+        return response
+
+    def stream_chat(self, message: str, chat_history: Optional[List[ChatMessage]] = None) -> StreamingAgentChatResponse:
+        if self._answer_cache is None:
+            return super().stream_chat(message, chat_history)
+        answer = self._lookup_answer(message, chat_history)
+        if answer is not None:
+            # a finished stream holding the whole cached answer as a single token
+            response = StreamingAgentChatResponse(response=answer)
+            response.queue.put_nowait(answer)
+            response.is_done = True
+            return response
+        return super().stream_chat(message)
+
+
 class ChatEngineService():
     """
     Service class for managing chat engine functionalities and components.
@@ -29,7 +210,7 @@ class ChatEngineService():
     def __init__(self): 
         self.embed_model = OpenAIEmbedding(model="text-embedding-3-small")
         self.llm = OpenAI(temperature=0, model="gpt-3.5-turbo-0125")
-        self.MONGO_URI = os.getenv('MONGODB_CONNECTION_STRING')
+        self.bm25_index = BM25IndexService()
     def get_vector_index(self,course_name):
         """
         Retrieves the vector index for a specified course.
@@ -41,9 +222,8 @@ class ChatEngineService():
             VectorIndex: The vector index for the specified course.
         """
         try:
-            client = pymongo.MongoClient(self.MONGO_URI)
-            vector_store = MongoDBAtlasVectorSearch(
-                client,
+            vector_store = AsyncMongoDBAtlasVectorSearch(
+                get_mongo_client(),
                 db_name="vector",
                 collection_name=course_name,
                 index_name=course_name
@@ -65,25 +245,28 @@ class ChatEngineService():
         try:
 
             storage = StorageContext.from_defaults(
-                    docstore=MongoDocumentStore.from_uri(uri=self.MONGO_URI, namespace=course_name, db_name="docstore"),
+                    docstore=get_mongo_docstore(course_name),
                     )
             return storage.docstore
         except Exception as e:
             raise Exception("Error in getting doc store: " + str(e))
 
-    def create_bm25_retriever(self,docstore):
+    def create_bm25_retriever(self,docstore,course_name: str):
         """
-        Creates a BM25 retriever for a specified document store.
+        Creates a BM25 retriever backed by the persisted inverted index of a course.
+        The index is built from the docstore the first time a course is queried.
 
         Parameters:
             docstore: The document store.
+            course_name (str): Name of the course.
 
         Returns:
-            BM25Retriever: The BM25 retriever.
+            BM25IndexRetriever: The BM25 retriever.
         """
         try: 
-            bm25_retriever = BM25Retriever.from_defaults(
-            docstore=docstore, similarity_top_k=3
+            self.bm25_index.ensure_index(course_name, docstore)
+            bm25_retriever = BM25IndexRetriever(
+            self.bm25_index, course_name, docstore, similarity_top_k=3
             )
             return bm25_retriever
         except Exception as e:
@@ -91,17 +274,17 @@ class ChatEngineService():
 
     def query_fusion_retriever(self,vector_retriever, bm25_retriever):
         """
-        Creates a query fusion retriever.
+        Creates a query fusion retriever recording the latency of the fusion step.
 
         Parameters:
             vector_retriever (VectorStoreIndex): The vector retriever.
-            bm25_retriever (BM25Retriever): The BM25 retriever.
+            bm25_retriever (BM25IndexRetriever): The BM25 retriever.
 
         Returns:
             QueryFusionRetriever: The query fusion retriever.
         """
         try:
-            retriever = QueryFusionRetriever(
+            retriever = TimedQueryFusionRetriever(
             [vector_retriever, bm25_retriever],
             similarity_top_k=4,
             num_queries=1,  # set this to 1 to disable query generation
@@ -115,6 +298,44 @@ class ChatEngineService():
         except Exception as e:
             raise Exception("Error in creating fusion retriever: " + str(e))
 
+    def build_course_retriever(self,course_name: str) -> dict:
+        """
+        Builds the retrieval components of a course: vector index, docstore,
+        BM25 retriever and the fusion retriever combining them.
+
+        Parameters:
+            course_name (str): Name of the course.
+
+        Returns:
+            dict: The components keyed by "index", "docstore", "bm25_retriever" and "fusion_retriever".
+        """
+        with observe_stage("vector_index_setup"):
+            index = self.get_vector_index(course_name)
+        vector_retriever = TimedRetriever(index.as_retriever(similarity_top_k=3), "retriever_vector")
+        docstore = self.get_docstore(course_name)
+        with observe_stage("bm25_build"):
+            bm25_retriever = self.create_bm25_retriever(docstore,course_name)
+        fusion_retriever = self.query_fusion_retriever(vector_retriever,TimedRetriever(bm25_retriever, "retriever_bm25"))
+        return {
+            "index": index,
+            "docstore": docstore,
+            "bm25_retriever": bm25_retriever,
+            "fusion_retriever": fusion_retriever,
+        }
+
+    def get_course_retriever(self,course_name: str) -> dict:
+        """
+        Retrieves the retrieval components of a course from the per-course cache,
+        building them on a cache miss.
+
+        Parameters:
+            course_name (str): Name of the course.
+
+        Returns:
+            dict: The components as returned by build_course_retriever.
+        """
+        return retriever_cache.get_or_create(course_name, self.build_course_retriever)
+
     def create_query_engine_tool(self,vector_query_engine,name: str):
         """
         Creates a query engine tool.
@@ -191,16 +412,20 @@ class ChatEngineService():
         - docstore: The document store containing the documents to be used for context.
         - course_name (str): The name of the course, used to format the system prompt.
         Returns:
-        - chat_engine: An instance of CondensePlusContextChatEngine configured with the provided parameters.
+        - chat_engine: An instance of CachedCondensePlusContextChatEngine configured with the provided parameters,
+          the course's semantic answer cache and a token counter of its own.
         """
         try:
+            # a token counter per engine so concurrent requests are counted separately
+            token_counter = create_token_counter()
+            llm = OpenAI(temperature=0, model="gpt-3.5-turbo-0125", callback_manager=CallbackManager([token_counter]))
 
             response_synthesizer = get_response_synthesizer(
             response_mode=ResponseMode.TREE_SUMMARIZE
             )
-            chat_engine = CondensePlusContextChatEngine.from_defaults(
+            chat_engine = CachedCondensePlusContextChatEngine.from_defaults(
                 retriever,
-                llm=self.llm,
+                llm=llm,
                 chat_history=chat_history,
                 system_prompt=SYSTEM_MESSAGE.format(course_name=course_name.replace("_", " ")),
                 context_prompt=( 
@@ -213,6 +438,8 @@ class ChatEngineService():
                 response_synthesizer = response_synthesizer,
                 verbose=False,
             )
+            chat_engine.enable_answer_cache(course_name, self.embed_model)
+            chat_engine.enable_metrics(course_name, token_counter)
             return chat_engine
         except Exception as e:
             raise Exception("Error in creating CondensePlusContextChatEngine: " + str(e))
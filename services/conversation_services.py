@@ -1,4 +1,5 @@
-from pymongo import MongoClient
+from services.database_services import get_mongo_client
+from services.index_services import ensure_subject_indexes
 import uuid
 from llama_index.core.llms import ChatMessage
 from data_definitions.schemas import Message, FeedBack
@@ -11,9 +12,8 @@ class ConversationManager:
     """
     Class for managing conversation in a MongoDB database.
     """
-    def __init__(self):
-        MONGO_URI = os.getenv("MONGODB_CONNECTION_STRING")
-        self.client = MongoClient(MONGO_URI)
+    def __init__(self, client=None):
+        self.client = client or get_mongo_client()
 
 
     def get_messages(self,subject:str, user_id: str) -> List[Message]:
@@ -28,11 +28,10 @@ class ConversationManager:
             List[Message]: A list of messages for the given subject and user ID.
         """
         try:
-            db = self.client["chat_history"]
-            conversations = db[subject]
-            conversation = conversations.find_one({"user_id": user_id})
-            if conversation:
-                return [Message(**msg) for msg in conversation.get("messages", [])]
+            db = self.client["chat_buckets"]
+            buckets = list(db[subject].find({"user_id": user_id}, {"messages": 1}).sort("bucket", 1))
+            if buckets:
+                return [Message(**msg) for bucket in buckets for msg in bucket["messages"]]
             else:
                 print("Conversation not found")
                 return []
@@ -50,6 +49,7 @@ class ConversationManager:
         try:
             db = self.client["feedback"]
             conversation = db[feedback.subject]
+            ensure_subject_indexes(feedback.subject, self.client)
             new_conversation_data = FeedBack(user_id=feedback.user_id, subject=feedback.subject, status="New")
             conversation.insert_one(new_conversation_data.model_dump())
         except Exception as e:
@@ -0,0 +1,154 @@
+from services.database_services import get_mongo_client
+from threading import Event, Lock, Thread
+from typing import List, Optional
+import time
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+class CourseRegistry():
+    """
+    Process-wide set of the course names recorded in "vector.records", for membership
+    checks that do not touch MongoDB.
+
+    The set is loaded at startup, updated by this process when a course gains its first
+    file or loses its last one, and reloaded every ttl_seconds in a background thread.
+    With watch enabled, a change stream on the records collection also reloads it as
+    soon as another worker adds or removes a course.
+    """
+    def __init__(self, client=None, ttl_seconds: Optional[int] = None, watch: Optional[bool] = None):
+        """
+        Initializes the CourseRegistry object.
+
+        Parameters:
+            client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+            ttl_seconds (int, optional): Seconds between two reloads.
+                Defaults to the COURSE_REGISTRY_TTL_SECONDS environment variable or 60.
+            watch (bool, optional): Whether to follow a change stream on the records collection.
+                Defaults to the COURSE_REGISTRY_WATCH environment variable or False.
+                Change streams require a replica set or sharded cluster.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("COURSE_REGISTRY_TTL_SECONDS", 60))
+        if watch is None:
+            watch = os.getenv("COURSE_REGISTRY_WATCH", "false").lower() in ("1", "true", "yes")
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.watch = watch
+        self._courses = None
+        self._loaded_at = 0.0
+        self._lock = Lock()
+        self._stop = Event()
+        self._threads = []
+
+    @property
+    def records(self):
+        return (self._client or get_mongo_client())["vector"]["records"]
+
+    def load(self):
+        """
+        Reloads the course names from the records collection.
+        """
+        try:
+            courses = {doc["course_name"] for doc in self.records.find({}, {"course_name": 1, "_id": 0})}
+            with self._lock:
+                self._courses = courses
+                self._loaded_at = time.monotonic()
+        except Exception as e:
+            raise Exception("Error in loading courses: " + str(e))
+
+    def _ensure_loaded(self):
+        if self._courses is None:
+            self.load()
+        elif not self._threads and time.monotonic() - self._loaded_at > self.ttl_seconds:
+            # no refresher thread running, refresh on the caller's time instead
+            self.load()
+
+    def contains(self, course_name: str) -> bool:
+        """
+        Checks if a course exists.
+
+        Parameters:
+            course_name (str): Name of the course.
+
+        Returns:
+            bool: True if the course exists, False otherwise.
+        """
+        self._ensure_loaded()
+        return course_name in self._courses
+
+    def get_courses(self) -> List[str]:
+        """
+        Retrieves every course name.
+
+        Returns:
+            List[str]: List of course names.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return sorted(self._courses)
+
+    def add(self, course_name: str):
+        """
+        Records a course created by this process.
+
+        Parameters:
+            course_name (str): Name of the course.
+        """
+        with self._lock:
+            if self._courses is not None:
+                self._courses.add(course_name)
+
+    def discard(self, course_name: str):
+        """
+        Forgets a course removed by this process.
+
+        Parameters:
+            course_name (str): Name of the course.
+        """
+        with self._lock:
+            if self._courses is not None:
+                self._courses.discard(course_name)
+
+    def start(self):
+        """
+        Loads the courses and starts the refresh and change stream threads. Called at application startup.
+        """
+        self.load()
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [Thread(target=self._refresh, name="course-registry-refresh", daemon=True)]
+        if self.watch:
+            self._threads.append(Thread(target=self._watch, name="course-registry-watch", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stops the background threads. Called at application shutdown.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _refresh(self):
+        while not self._stop.wait(self.ttl_seconds):
+            try:
+                self.load()
+            except Exception as e:
+                print(f"Error refreshing course registry: {e}")
+
+    def _watch(self):
+        try:
+            # delete events only carry the document key, so every change reloads the (small) set
+            with self.records.watch(max_await_time_ms=1000) as stream:
+                while not self._stop.is_set():
+                    if stream.try_next() is not None:
+                        self.load()
+        except Exception as e:
+            print(f"Course registry change stream stopped, relying on the {self.ttl_seconds}s refresh: {e}")
+
+
+course_registry = CourseRegistry()
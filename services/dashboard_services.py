@@ -0,0 +1,190 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+from services.course_registry_services import course_registry
+from services.database_services import get_mongo_client
+from typing import List, Optional
+import time
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+# units accepted by $dateTrunc for the time series
+DASHBOARD_GRANULARITIES = ["hour", "day", "week", "month"]
+
+def course_activity_pipeline(start_date: datetime, end_date: datetime, granularity: str, top_users: int) -> List[dict]:
+    """
+    Builds the aggregation computing the chat activity of a course over a date range in one pass
+    over its message buckets: message and conversation counts, the time series, and the most
+    active users.
+
+    A conversation is counted when its first message, position 0 of bucket 0, is in the range.
+
+    Parameters:
+        start_date (datetime): Start of the date range.
+        end_date (datetime): End of the date range.
+        granularity (str): Unit of the time series, one of DASHBOARD_GRANULARITIES.
+        top_users (int): Number of most active users returned.
+
+    Returns:
+        List[dict]: The pipeline, to run on "chat_buckets.<course>".
+    """
+    first_message = {"$cond": [{"$and": [{"$eq": ["$bucket", 0]}, {"$eq": ["$position", 0]}]}, 1, 0]}
+    return [
+        # only the buckets overlapping the date range are unwound
+        {"$match": {"start": {"$lte": end_date}, "end": {"$gte": start_date}}},
+        {"$unwind": {"path": "$messages", "includeArrayIndex": "position"}},
+        {"$match": {"messages.timestamp": {"$gte": start_date, "$lte": end_date}}},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "messages": {"$sum": 1},
+                    "conversations": {"$sum": first_message},
+                    "users": {"$addToSet": "$user_id"},
+                }},
+                {"$project": {"_id": 0, "messages": 1, "conversations": 1, "active_users": {"$size": "$users"}}},
+            ],
+            "series": [
+                {"$group": {
+                    "_id": {"$dateTrunc": {"date": "$messages.timestamp", "unit": granularity}},
+                    "messages": {"$sum": 1},
+                    "conversations": {"$sum": first_message},
+                }},
+                {"$sort": {"_id": 1}},
+                {"$project": {"_id": 0, "start": "$_id", "messages": 1, "conversations": 1}},
+            ],
+            "top_users": [
+                {"$group": {"_id": "$user_id", "message_count": {"$sum": 1}}},
+                {"$sort": {"message_count": -1, "_id": 1}},
+                {"$limit": top_users},
+                {"$project": {"_id": 0, "user_id": "$_id", "message_count": 1}},
+            ],
+        }},
+    ]
+
+
+class DashboardService():
+    """
+    Service class for the multi-course analytics dashboard.
+
+    The activity of each course is computed with a single $facet aggregation over its
+    message buckets, plus a $group over its feedback collection, and the courses run
+    concurrently on a bounded thread pool. Dashboards are cached for a short time,
+    keyed by the courses and the date range asked for.
+    """
+    def __init__(self, client=None, ttl_seconds: Optional[int] = None, max_workers: Optional[int] = None, registry=None):
+        """
+        Initializes the DashboardService object.
+
+        Parameters:
+            client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+            ttl_seconds (int, optional): Seconds a dashboard is served from the cache.
+                Defaults to the DASHBOARD_CACHE_TTL_SECONDS environment variable or 30.
+            max_workers (int, optional): Number of courses aggregated at once.
+                Defaults to the DASHBOARD_MAX_CONCURRENCY environment variable or 8.
+            registry (CourseRegistry, optional): Course names. Defaults to the shared registry.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", 30))
+        if max_workers is None:
+            max_workers = int(os.getenv("DASHBOARD_MAX_CONCURRENCY", 8))
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.course_registry = registry or course_registry
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dashboard")
+        self._cache = {}
+        self._lock = Lock()
+
+    @property
+    def client(self):
+        return self._client or get_mongo_client()
+
+    def get_dashboard(self, courses: Optional[List[str]] = None, start_date: Optional[datetime] = None,
+                      end_date: Optional[datetime] = None, granularity: str = "day", top_users: int = 5) -> dict:
+        """
+        Retrieves the activity of several courses over a date range.
+
+        Parameters:
+            courses (List[str], optional): Courses to report. Defaults to every course.
+            start_date (datetime, optional): Start of the date range. Defaults to 30 days before end_date.
+            end_date (datetime, optional): End of the date range. Defaults to now, rounded up to the minute.
+            granularity (str, optional): Unit of the time series, one of DASHBOARD_GRANULARITIES. Defaults to "day".
+            top_users (int, optional): Number of most active users per course, at least 1. Defaults to 5.
+
+        Returns:
+            dict: The date range, the granularity and the activity of each course.
+        """
+        if granularity not in DASHBOARD_GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(DASHBOARD_GRANULARITIES)}")
+        if top_users < 1:
+            raise ValueError("top_users must be at least 1")
+        if end_date is None:
+            # rounded up to the next minute so the default range, and its cache key, is the same for a minute
+            end_date = datetime.utcnow().replace(second=0, microsecond=0) + timedelta(minutes=1)
+        if start_date is None:
+            start_date = end_date - timedelta(days=30)
+        courses = sorted(set(courses)) if courses else self.course_registry.get_courses()
+
+        key = (tuple(courses), start_date, end_date, granularity, top_users)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+
+        try:
+            futures = [
+                self._executor.submit(self.get_course_activity, course_name, start_date, end_date, granularity, top_users)
+                for course_name in courses
+            ]
+            dashboard = {
+                "start_date": start_date,
+                "end_date": end_date,
+                "granularity": granularity,
+                "courses": [future.result() for future in futures],
+            }
+        except Exception as e:
+            raise Exception("Error in building dashboard: " + str(e))
+
+        with self._lock:
+            # drop the expired dashboards so the cache only holds the recent ones
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            self._cache[key] = (now + self.ttl_seconds, dashboard)
+        return dashboard
+
+    def get_course_activity(self, course_name: str, start_date: datetime, end_date: datetime,
+                            granularity: str = "day", top_users: int = 5) -> dict:
+        """
+        Retrieves the activity of one course over a date range.
+
+        Parameters:
+            course_name (str): Name of the course.
+            start_date (datetime): Start of the date range.
+            end_date (datetime): End of the date range.
+            granularity (str, optional): Unit of the time series. Defaults to "day".
+            top_users (int, optional): Number of most active users. Defaults to 5.
+
+        Returns:
+            dict: The message, conversation and active user counts, the time series,
+                the most active users and the feedback count of each status.
+        """
+        try:
+            client = self.client
+            pipeline = course_activity_pipeline(start_date, end_date, granularity, top_users)
+            activity = next(client["chat_buckets"][course_name].aggregate(pipeline))
+            totals = activity["totals"][0] if activity["totals"] else {"messages": 0, "conversations": 0, "active_users": 0}
+            feedback = client["feedback"][course_name].aggregate([
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+            ])
+            return {
+                "course_name": course_name,
+                "message_count": totals["messages"],
+                "conversation_count": totals["conversations"],
+                "active_users": totals["active_users"],
+                "series": activity["series"],
+                "top_users": activity["top_users"],
+                "feedback": {doc["_id"]: doc["count"] for doc in feedback if doc["_id"] is not None},
+            }
+        except Exception as e:
+            raise Exception(f"Error in computing activity of {course_name}: " + str(e))
@@ -0,0 +1,112 @@
+from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from llama_index.storage.docstore.mongodb import MongoDocumentStore
+from llama_index.storage.kvstore.mongodb import MongoDBKVStore
+from threading import Lock
+from typing import Optional
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+class MongoClientRegistry():
+    """
+    Process-wide registry of the MongoDB clients shared by every service and router.
+    Each client keeps a single connection pool and set of monitoring threads for the process.
+    """
+    def __init__(self, uri: Optional[str] = None):
+        """
+        Initializes the MongoClientRegistry object. Clients are created on first use or by connect.
+
+        Parameters:
+            uri (str, optional): MongoDB connection string. Defaults to MONGODB_CONNECTION_STRING.
+
+        Pool sizes are read from MONGO_MAX_POOL_SIZE (default 100) and MONGO_MIN_POOL_SIZE (default 0).
+        """
+        self.uri = uri or os.getenv("MONGODB_CONNECTION_STRING")
+        self.max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+        self.min_pool_size = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+        self._client = None
+        self._async_client = None
+        self._lock = Lock()
+
+    def _client_options(self) -> dict:
+        return {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+        }
+
+    def get_client(self) -> MongoClient:
+        """
+        Returns the shared pymongo client, creating it on first use.
+
+        Returns:
+            MongoClient: The shared client.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(self.uri, **self._client_options())
+        return self._client
+
+    def get_async_client(self) -> AsyncIOMotorClient:
+        """
+        Returns the shared motor client, creating it on first use.
+
+        Returns:
+            AsyncIOMotorClient: The shared async client.
+        """
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = AsyncIOMotorClient(self.uri, **self._client_options())
+        return self._async_client
+
+    def connect(self):
+        """
+        Creates both clients and checks the server is reachable. Called at application startup.
+        """
+        try:
+            self.get_client().admin.command("ping")
+            self.get_async_client()
+        except Exception as e:
+            raise Exception("Error in connecting to MongoDB: " + str(e))
+
+    def close(self):
+        """
+        Closes both clients. Called at application shutdown.
+        """
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            if self._async_client is not None:
+                self._async_client.close()
+                self._async_client = None
+
+
+mongo_registry = MongoClientRegistry()
+
+def get_mongo_client() -> MongoClient:
+    """
+    Returns the process-wide pymongo client.
+    """
+    return mongo_registry.get_client()
+
+def get_async_mongo_client() -> AsyncIOMotorClient:
+    """
+    Returns the process-wide motor client.
+    """
+    return mongo_registry.get_async_client()
+
+def get_mongo_docstore(course_name: str) -> MongoDocumentStore:
+    """
+    Returns the docstore of a course on top of the shared clients.
+
+    Parameters:
+        course_name (str): Name of the course.
+
+    Returns:
+        MongoDocumentStore: The document store for the specified course.
+    """
+    kvstore = MongoDBKVStore(mongo_client=get_mongo_client(), mongo_aclient=get_async_mongo_client(), db_name="docstore")
+    return MongoDocumentStore(kvstore, namespace=course_name)
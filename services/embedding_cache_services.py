@@ -0,0 +1,135 @@
+from datetime import datetime
+from llama_index.core.schema import BaseNode, MetadataMode
+from pymongo import UpdateOne
+from services.database_services import get_mongo_client
+from threading import Lock
+from typing import List
+import hashlib
+import json
+from dotenv import load_dotenv
+load_dotenv()
+
+class EmbeddingCacheService():
+    """
+    Service class for a persistent embedding cache keyed by a hash of the
+    embedding model name and the text a chunk is embedded with, see cache_text.
+
+    Vectors are stored in "embedding_cache.vectors", and hit and miss counters
+    per model in "embedding_cache.stats".
+    """
+    def __init__(self, client=None):
+        client = client or get_mongo_client()
+        db = client["embedding_cache"]
+        self.vectors = db["vectors"]
+        self.stats = db["stats"]
+        # counters of this process, the stats collection holds the totals of every process
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def cache_text(node: BaseNode) -> str:
+        """
+        Builds the text a chunk is cached under: its text and the metadata it is embedded with,
+        except the file_path, the temporary path an upload is written to, which differs on every
+        upload and would keep re-uploads, updates and copies in other courses from hitting the cache.
+
+        Parameters:
+            node (BaseNode): The chunk.
+
+        Returns:
+            str: The text to build the cache key from.
+        """
+        metadata = {
+            key: value for key, value in node.metadata.items()
+            if key not in node.excluded_embed_metadata_keys and key != "file_path"
+        }
+        return json.dumps([node.get_content(metadata_mode=MetadataMode.NONE), metadata], sort_keys=True, default=str)
+
+    @staticmethod
+    def cache_key(model_name: str, text: str) -> str:
+        """
+        Builds the cache key of a text embedded with a model.
+
+        Parameters:
+            model_name (str): Name of the embedding model.
+            text (str): The text to embed.
+
+        Returns:
+            str: The sha256 hex digest of the model name and text.
+        """
+        return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+    def embed_nodes(self, nodes: List[BaseNode], embed_model, batch_size: int = 100):
+        """
+        Sets the embedding of every node without one, reusing cached vectors
+        and sending only the cache misses to the embedding model, in batches.
+
+        Parameters:
+            nodes (List[BaseNode]): Nodes to embed.
+            embed_model: The embedding model.
+            batch_size (int, optional): Number of texts per embedding request. Defaults to 100.
+        """
+        try:
+            model_name = embed_model.model_name
+            keys_by_node = {}
+            for node in nodes:
+                if node.embedding is None:
+                    text = node.get_content(metadata_mode=MetadataMode.EMBED)
+                    keys_by_node[node.node_id] = (self.cache_key(model_name, self.cache_text(node)), text)
+            if not keys_by_node:
+                return
+
+            keys = list({key for key, _ in keys_by_node.values()})
+            cached = {}
+            for doc in self.vectors.find({"_id": {"$in": keys}}, {"embedding": 1}):
+                cached[doc["_id"]] = doc["embedding"]
+
+            # identical chunks in the same batch are embedded once
+            missing = {}
+            for key, text in keys_by_node.values():
+                if key not in cached:
+                    missing[key] = text
+            missing_keys = list(missing)
+            for start in range(0, len(missing_keys), batch_size):
+                batch_keys = missing_keys[start:start + batch_size]
+                embeddings = embed_model.get_text_embedding_batch([missing[key] for key in batch_keys])
+                now = datetime.utcnow()
+                self.vectors.bulk_write([
+                    UpdateOne(
+                        {"_id": key},
+                        {"$setOnInsert": {"model": model_name, "embedding": embedding, "created_at": now}},
+                        upsert=True
+                    )
+                    for key, embedding in zip(batch_keys, embeddings)
+                ], ordered=False)
+                cached.update(zip(batch_keys, embeddings))
+
+            for node in nodes:
+                if node.node_id in keys_by_node:
+                    node.embedding = cached[keys_by_node[node.node_id][0]]
+
+            # every node that did not cost an embedding request counts as a hit
+            hits = len(keys_by_node) - len(missing_keys)
+            with self._lock:
+                self.hits += hits
+                self.misses += len(missing_keys)
+            self.stats.update_one(
+                {"_id": model_name},
+                {"$inc": {"hits": hits, "misses": len(missing_keys)}},
+                upsert=True
+            )
+        except Exception as e:
+            raise Exception("Error in embedding nodes: " + str(e))
+
+    def get_stats(self) -> List[dict]:
+        """
+        Retrieves the hit and miss counters of every embedding model.
+
+        Returns:
+            List[dict]: One entry per model with its total hits and misses.
+        """
+        try:
+            return list(self.stats.find({}))
+        except Exception as e:
+            raise Exception("Error in getting embedding cache stats: " + str(e))
@@ -1,20 +1,148 @@
-from llama_index.core import (
-    VectorStoreIndex,
-)
-from llama_index.core.schema import BaseNode
-from typing import List
-from llama_index.core import MockEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, MetadataMode
+from services.ingest_data_services import FileDocumentStream, INGEST_CHUNK_SIZE, INGEST_CHUNK_OVERLAP
+from typing import Dict, List, Optional, Tuple
+from threading import Lock
 import tiktoken
-from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
+import os
 
 from dotenv import load_dotenv
 load_dotenv()
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# chunking of the /evaluate/filecost preview
+PREVIEW_CHUNK_SIZE = 120
+PREVIEW_CHUNK_OVERLAP = 20
+
+_encoding = None
+_encoding_lock = Lock()
+
+def get_encoding() -> tiktoken.Encoding:
+    """
+    Returns the tiktoken encoding of the embedding model, loaded once per process.
+
+    Returns:
+        tiktoken.Encoding: The encoding.
+    """
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                _encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    return _encoding
+
+def count_embedding_tokens(nodes: List[BaseNode]) -> int:
+    """
+    Counts the tokens sent to the embedding model for a list of nodes,
+    i.e. their content with the metadata not excluded from embedding.
+
+    Parameters:
+        nodes (List[BaseNode]): The nodes.
+
+    Returns:
+        int: The number of tokens.
+    """
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    if not texts:
+        return 0
+    return sum(len(tokens) for tokens in get_encoding().encode_ordinary_batch(texts))
+
 def file_cost_embeddings(documents: List[BaseNode]):
-    embed_model = MockEmbedding(embed_dim=1536)
-    token_counter = TokenCountingHandler(
-    tokenizer=tiktoken.encoding_for_model("gpt-3.5-turbo").encode
-    )   
-    callback_manager = CallbackManager([token_counter])
-    embed_model = embed_model
-    VectorStoreIndex(documents,embed_model=embed_model,callback_manager=callback_manager)
-    return token_counter.total_embedding_token_count
\ No newline at end of file
+    """
+    Kept for the routers importing it, see count_embedding_tokens.
+    """
+    return count_embedding_tokens(documents)
+
+
+class CostEstimationService():
+    """
+    Service class estimating the embedding tokens and cost of files before ingesting them.
+
+    Files are read a page at a time and each page is split with both the preview
+    chunking (120 tokens) and the ingest chunking, so nothing but the token counts
+    is kept in memory.
+    """
+    def __init__(self, price_per_million_tokens: Optional[float] = None):
+        """
+        Initializes the CostEstimationService object.
+
+        Parameters:
+            price_per_million_tokens (float, optional): Embedding price in dollars per million tokens.
+                Defaults to the EMBEDDING_PRICE_PER_MILLION_TOKENS environment variable or 0.02,
+                the price of text-embedding-3-small.
+        """
+        if price_per_million_tokens is None:
+            price_per_million_tokens = float(os.getenv("EMBEDDING_PRICE_PER_MILLION_TOKENS", 0.02))
+        self.price_per_million_tokens = price_per_million_tokens
+        self.splitters = {
+            "preview": SentenceSplitter(chunk_size=PREVIEW_CHUNK_SIZE, chunk_overlap=PREVIEW_CHUNK_OVERLAP),
+            "ingest": SentenceSplitter(chunk_size=INGEST_CHUNK_SIZE, chunk_overlap=INGEST_CHUNK_OVERLAP),
+        }
+
+    def cost(self, tokens: int) -> float:
+        """
+        Converts a number of embedding tokens to dollars.
+
+        Parameters:
+            tokens (int): Number of tokens.
+
+        Returns:
+            float: The cost in dollars.
+        """
+        return tokens * self.price_per_million_tokens / 1_000_000
+
+    def _estimate(self, chunks: int, tokens: int) -> dict:
+        return {"chunks": chunks, "tokens": tokens, "cost": self.cost(tokens)}
+
+    def estimate_file(self, file_path: str, file_name: Optional[str] = None) -> dict:
+        """
+        Estimates the embedding tokens and cost of a file for each chunking.
+
+        Parameters:
+            file_path (str): Path of the file on disk.
+            file_name (str, optional): Name reported for the file. Defaults to the file's base name.
+
+        Returns:
+            dict: The file name and, for "preview" and "ingest", its chunks, tokens and cost.
+        """
+        try:
+            file_name = file_name or os.path.basename(file_path)
+            counts: Dict[str, Tuple[int, int]] = {name: (0, 0) for name in self.splitters}
+            for document in FileDocumentStream(file_path):
+                for name, splitter in self.splitters.items():
+                    if name == "ingest":
+                        # uploads are ingested with the file name as topic, the preview has none
+                        document.metadata["topic"] = file_name
+                    nodes = splitter.get_nodes_from_documents([document])
+                    chunks, tokens = counts[name]
+                    counts[name] = (chunks + len(nodes), tokens + count_embedding_tokens(nodes))
+            return {
+                "file_name": file_name,
+                **{name: self._estimate(chunks, tokens) for name, (chunks, tokens) in counts.items()},
+            }
+        except Exception as e:
+            raise Exception(f"Error in estimating cost of {file_name}: " + str(e))
+
+    def estimate_files(self, files: List[Tuple[str, str]]) -> dict:
+        """
+        Estimates the embedding tokens and cost of several files.
+
+        Parameters:
+            files (List[Tuple[str, str]]): (file path, file name) of each file.
+
+        Returns:
+            dict: The per-file estimates under "files", the totals for "preview" and "ingest",
+                the embedding model and its price per million tokens.
+        """
+        estimates = [self.estimate_file(file_path, file_name) for file_path, file_name in files]
+        totals = {}
+        for name in self.splitters:
+            chunks = sum(estimate[name]["chunks"] for estimate in estimates)
+            tokens = sum(estimate[name]["tokens"] for estimate in estimates)
+            totals[name] = self._estimate(chunks, tokens)
+        return {
+            "files": estimates,
+            **totals,
+            "model": EMBEDDING_MODEL,
+            "price_per_million_tokens": self.price_per_million_tokens,
+        }
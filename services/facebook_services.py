@@ -1,9 +1,10 @@
 
 import requests
 import os
-import pymongo
+from pymongo import UpdateOne
+from services.database_services import get_mongo_client
 from data_definitions.schemas import FacebookData
-from typing import List
+from typing import Iterator, List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -11,12 +12,22 @@ class FacebookService():
     """
     Service class for interacting with Facebook posts data and MongoDB database.
     """
-    def __init__(self):
+    def __init__(self, client=None, session: Optional[requests.Session] = None, graph_url: Optional[str] = None):
+        """
+        Initializes the FacebookService object.
+
+        Parameters:
+            client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+            session (requests.Session, optional): HTTP session reused for every Graph API request.
+            graph_url (str, optional): Base URL of the Graph API. Defaults to the FB_GRAPH_URL
+                environment variable or https://graph.facebook.com/v17.0, and can point to a local stand-in.
+        """
         self.PAGE_ID = os.getenv("PAGE_ID")
         self.FB_ACCESS_TOKEN = os.getenv("FB_ACCESS_TOKEN")
-        MONGO_URI = os.getenv("MONGODB_CONNECTION_STRING")
-        self.client = pymongo.MongoClient(MONGO_URI)
+        self.client = client or get_mongo_client()
         self.db_name = "facebook_records"
+        self.graph_url = (graph_url or os.getenv("FB_GRAPH_URL", "https://graph.facebook.com/v17.0")).rstrip("/")
+        self.session = session or requests.Session()
 
 
     def get_facebook_page_posts(self):
@@ -27,12 +38,12 @@ class FacebookService():
             dict or None: A dictionary containing the posts if the request is successful, None otherwise.
         """
             
-        url = f'https://graph.facebook.com/v17.0/{self.PAGE_ID}/posts'
+        url = f'{self.graph_url}/{self.PAGE_ID}/posts'
         params = {
             'access_token': self.FB_ACCESS_TOKEN
         }
         
-        response = requests.get(url, params=params)
+        response = self.session.get(url, params=params)
 
         
         if response.status_code == 200:
@@ -43,6 +54,38 @@ class FacebookService():
             return None
         
 
+    def iter_page_posts(self, page_size: int = 100, since: Optional[int] = None) -> Iterator[dict]:
+        """
+        Iterates over every post of the Facebook page, following the Graph API paging links.
+
+        Parameters:
+            page_size (int, optional): Number of posts requested per page. Defaults to 100.
+            since (int, optional): Unix timestamp, only posts created from then on are returned.
+
+        Yields:
+            dict: A post with its id, message and created_time.
+
+        Raises:
+            Exception: If a page cannot be retrieved.
+        """
+        url = f'{self.graph_url}/{self.PAGE_ID}/posts'
+        params = {
+            'access_token': self.FB_ACCESS_TOKEN,
+            'fields': 'id,message,created_time',
+            'limit': page_size,
+        }
+        if since is not None:
+            params['since'] = since
+        while url:
+            response = self.session.get(url, params=params)
+            if response.status_code != 200:
+                raise Exception(f"Error getting facebook posts: {response.status_code} {response.text}")
+            page = response.json()
+            yield from page.get('data', [])
+            # the next link already carries the token, limit and cursor
+            url = page.get('paging', {}).get('next')
+            params = None
+
     def add_post_to_course(self,course_name: str, fb_data: FacebookData):
         """
         Add a post to a specified course collection in the database.
@@ -67,6 +110,30 @@ class FacebookService():
             raise Exception(f"Error adding post to course {course_name}: {str(e)}")
 
 
+    def add_posts_to_course(self,course_name: str, fb_data: List[FacebookData]):
+        """
+        Add several posts to a specified course collection with a single bulk write.
+        A post already recorded is left unchanged.
+
+        Args:
+            course_name (str): The name of the course collection.
+            fb_data (List[FacebookData]): The data of the Facebook posts to be added.
+
+        Raises:
+            Exception: If there is an error during the database operation.
+        """
+        try:
+            if not fb_data:
+                return
+            facebook_collection = self.client[self.db_name][course_name]
+            facebook_collection.bulk_write([
+                UpdateOne({'post_id': post.post_id}, {'$setOnInsert': post.model_dump()}, upsert=True)
+                for post in fb_data
+            ], ordered=False)
+        except Exception as e:
+            raise Exception(f"Error adding posts to course {course_name}: {str(e)}")
+
+
     def delete_post_from_course(self,course_name: str, post_id: str):
         """
         Delete a post from a specified course collection in the database.
@@ -101,6 +168,38 @@ class FacebookService():
             raise Exception(f"Error deleting post with ID {post_id} from course {course_name}: {str(e)}")
         
 
+    def delete_posts_from_course(self,course_name: str, post_ids: List[str]) -> int:
+        """
+        Deletes several posts from a specified course collection in the database.
+
+        Args:
+            course_name (str): The name of the course collection.
+            post_ids (List[str]): The IDs of the posts to be deleted.
+
+        Returns:
+            int: The number of posts deleted.
+        """
+        try:
+            facebook_collection = self.client[self.db_name][course_name]
+            deleted_count = facebook_collection.delete_many({'post_id': {'$in': post_ids}}).deleted_count
+            if facebook_collection.find_one({}, {'_id': 1}) is None:
+                self.client[self.db_name].drop_collection(course_name)
+            return deleted_count
+        except Exception as e:
+            raise Exception(f"Error deleting posts from course {course_name}: {str(e)}")
+
+    def drop_course(self,course_name: str):
+        """
+        Deletes every post of a course.
+
+        Args:
+            course_name (str): The name of the course collection.
+        """
+        try:
+            self.client[self.db_name].drop_collection(course_name)
+        except Exception as e:
+            raise Exception(f"Error deleting posts of course {course_name}: {str(e)}")
+
     def get_ingested_facebook_post_by_course(self,course_name:str):
         """
         Retrieves ingested Facebook posts by course name from the database.
@@ -0,0 +1,250 @@
+from datetime import datetime, timedelta
+from threading import Event, Thread
+from llama_index.core import Document
+from pymongo import ReturnDocument
+from data_definitions.schemas import FacebookData
+from services.facebook_services import FacebookService
+from services.ingest_data_services import IngestDataService
+from services.knowledge_base_services import KnowledgeBaseService
+from typing import Callable, List, Optional
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+FACEBOOK_POST_PREFIX = "facebook_post_id_"
+FACEBOOK_TOPIC = "This contains specific information in facebook page"
+
+def parse_created_time(created_time: str) -> datetime:
+    """
+    Parses the created_time of a Graph API post, e.g. 2024-01-31T09:15:00+0000.
+
+    Parameters:
+        created_time (str): The created_time of the post.
+
+    Returns:
+        datetime: The timezone aware creation time.
+    """
+    return datetime.strptime(created_time, "%Y-%m-%dT%H:%M:%S%z")
+
+def facebook_post_document(facebook_data: FacebookData) -> Document:
+    """
+    Builds the knowledge base document of a Facebook post.
+
+    Parameters:
+        facebook_data (FacebookData): The post.
+
+    Returns:
+        Document: The document, named after the post id.
+    """
+    return Document(
+        text=facebook_data.content,
+        metadata={
+            "file_name": facebook_data.post_id,
+            "post_created": facebook_data.post_created,
+        },
+        excluded_llm_metadata_keys=['file_name'],
+        excluded_embed_metadata_keys=['file_name'],
+        metadata_seperator="::",
+        metadata_template="{key}=>{value}",
+        text_template="Metadata: {metadata_str}\n-----\nContent: {content}",
+    )
+
+
+class FacebookSyncService():
+    """
+    Service class for syncing the Facebook page posts into a course knowledge base in bulk.
+
+    Every page of posts is read through the Graph API paging links, the new posts are
+    embedded together in batches, and vectors, docstore nodes, file records and
+    facebook_records are written with bulk operations.
+
+    The created_time of the newest post seen is stored per course in "jobs.facebook_sync"
+    once a sync succeeds, and the next sync only requests posts from then on.
+    """
+    def __init__(self, fb_service: Optional[FacebookService] = None, kb_service: Optional[KnowledgeBaseService] = None,
+                 ingest_data_service: Optional[IngestDataService] = None):
+        """
+        Initializes the FacebookSyncService object.
+
+        Parameters:
+            fb_service (FacebookService, optional): Graph API and facebook_records access.
+            kb_service (KnowledgeBaseService, optional): File records access.
+            ingest_data_service (IngestDataService, optional): Embeds and stores the posts.
+        """
+        self.fb_service = fb_service or FacebookService()
+        self.kb_service = kb_service or KnowledgeBaseService()
+        self.ingest_data_service = ingest_data_service or IngestDataService()
+        self.sync_state = self.fb_service.client["jobs"]["facebook_sync"]
+
+    def get_checkpoint(self, course_name: str) -> Optional[str]:
+        """
+        Retrieves the created_time of the newest post synced for a course.
+
+        Parameters:
+            course_name (str): Name of the course.
+
+        Returns:
+            str or None: The checkpoint, None if the course was never synced.
+        """
+        state = self.sync_state.find_one({"_id": course_name}, {"since": 1})
+        return state.get("since") if state else None
+
+    def sync(self, course_name: str, progress_callback: Optional[Callable[[int, int], None]] = None, full: bool = False) -> dict:
+        """
+        Ingests the page posts not yet in the course, requesting only the posts
+        created since the course's checkpoint.
+
+        Parameters:
+            course_name (str): Name of the course.
+            progress_callback (Callable, optional): Called with (posts embedded, new posts) after each embedding batch.
+            full (bool, optional): Ignore the checkpoint and read every post. Defaults to False.
+
+        Returns:
+            dict: The number of posts ingested and of posts already ingested.
+        """
+        try:
+            checkpoint = self.get_checkpoint(course_name)
+            since = int(parse_created_time(checkpoint).timestamp()) if checkpoint and not full else None
+            posts = [post for post in self.fb_service.iter_page_posts(since=since) if post.get('id')]
+
+            # the checkpoint post itself is returned again, only the fetched ids are checked
+            ingested = self.kb_service.existing_files(course_name, [FACEBOOK_POST_PREFIX + post['id'] for post in posts])
+            new_posts: List[FacebookData] = []
+            skip = 0
+            for post in posts:
+                post_id = FACEBOOK_POST_PREFIX + post.get('id')
+                if post_id in ingested:
+                    skip += 1
+                    continue
+                if not post.get('message'):
+                    # photo and share posts without text have nothing to embed
+                    continue
+                ingested.add(post_id)
+                new_posts.append(FacebookData(
+                    post_id=post_id,
+                    post_created=post.get('created_time'),
+                    content=post.get('message')
+                ))
+
+            if new_posts:
+                documents = [facebook_post_document(post) for post in new_posts]
+                self.ingest_data_service.add_data(course_name, documents, FACEBOOK_TOPIC, 0, progress_callback=progress_callback)
+                self.kb_service.add_files_to_course(course_name, [post.post_id for post in new_posts])
+                self.fb_service.add_posts_to_course(course_name, new_posts)
+
+            result = {"total_ingested": len(new_posts), "total_already_ingested": skip}
+            created_times = [post['created_time'] for post in posts if post.get('created_time')]
+            if created_times:
+                newest = max(created_times, key=parse_created_time)
+                if checkpoint is None or parse_created_time(newest) > parse_created_time(checkpoint):
+                    checkpoint = newest
+            self.sync_state.update_one(
+                {"_id": course_name},
+                {"$set": {"since": checkpoint, "last_synced_at": datetime.utcnow(), "last_result": result}},
+                upsert=True
+            )
+            print(f"Ingested {len(new_posts)} facebook posts in {course_name}, {skip} already ingested")
+            return result
+        except Exception as e:
+            raise Exception("Error in syncing facebook posts: " + str(e))
+
+    def claim_due_courses(self, interval_seconds: int, courses: Optional[List[str]] = None) -> List[str]:
+        """
+        Claims the courses whose periodic sync is due, pushing their next run one interval ahead.
+        A course is claimed by a single worker even when several run a scheduler.
+
+        Parameters:
+            interval_seconds (int): Seconds between two syncs of a course.
+            courses (List[str], optional): Courses to sync even if they were never synced.
+
+        Returns:
+            List[str]: The claimed course names.
+        """
+        now = datetime.utcnow()
+        for course_name in courses or []:
+            self.sync_state.update_one({"_id": course_name}, {"$setOnInsert": {"since": None}}, upsert=True)
+
+        claimed = []
+        for state in self.sync_state.find({}, {"_id": 1}):
+            course_name = state["_id"]
+            if self.sync_state.find_one_and_update(
+                {"_id": course_name, "$or": [{"next_run_at": {"$lte": now}}, {"next_run_at": {"$exists": False}}]},
+                {"$set": {"next_run_at": now + timedelta(seconds=interval_seconds)}},
+                return_document=ReturnDocument.AFTER
+            ) is not None:
+                claimed.append(course_name)
+        return claimed
+
+
+class FacebookSyncScheduler():
+    """
+    In-process scheduler running the Facebook sync of every course on a fixed interval.
+
+    The courses are those synced at least once and those listed in FB_SYNC_COURSES.
+    Each due course is handed to enqueue, which queues the sync as an ingestion job.
+    """
+    def __init__(self, sync_service: FacebookSyncService, enqueue: Callable[[str], str], interval_seconds: Optional[int] = None,
+                 courses: Optional[List[str]] = None):
+        """
+        Initializes the FacebookSyncScheduler object.
+
+        Parameters:
+            sync_service (FacebookSyncService): Holds the per-course sync state.
+            enqueue (Callable): Called with a course name to queue its sync.
+            interval_seconds (int, optional): Seconds between two syncs of a course, 0 disables the scheduler.
+                Defaults to the FB_SYNC_INTERVAL_SECONDS environment variable or 3600.
+            courses (List[str], optional): Courses to sync even if they were never synced.
+                Defaults to the comma separated FB_SYNC_COURSES environment variable.
+        """
+        if interval_seconds is None:
+            interval_seconds = int(os.getenv("FB_SYNC_INTERVAL_SECONDS", 3600))
+        if courses is None:
+            courses = [course.strip() for course in os.getenv("FB_SYNC_COURSES", "").split(",") if course.strip()]
+        self.sync_service = sync_service
+        self.enqueue = enqueue
+        self.interval_seconds = interval_seconds
+        self.courses = courses
+        self._stop = Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the scheduler thread. Called at application startup.
+        """
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="facebook-sync-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the scheduler thread. Called at application shutdown.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_due(self) -> List[str]:
+        """
+        Queues the sync of every due course.
+
+        Returns:
+            List[str]: The queued course names.
+        """
+        courses = self.sync_service.claim_due_courses(self.interval_seconds, self.courses)
+        for course_name in courses:
+            self.enqueue(course_name)
+        return courses
+
+    def _run(self):
+        # check a few times per interval so a course is synced close to when it is due
+        poll_seconds = max(1, min(60, self.interval_seconds // 4))
+        while True:
+            try:
+                self.run_due()
+            except Exception as e:
+                print(f"Error scheduling facebook sync: {e}")
+            if self._stop.wait(poll_seconds):
+                break
@@ -0,0 +1,37 @@
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode
+from typing import List
+
+def exclude_file_path(document: Document):
+    """
+    Leaves the file_path out of the text a document is embedded and answered with. It is the
+    temporary path the upload was written to, which differs on every upload; kept in, it would
+    change the chunk boundaries and embedding text of identical files.
+    """
+    for keys in (document.excluded_embed_metadata_keys, document.excluded_llm_metadata_keys):
+        if "file_path" not in keys:
+            keys.append("file_path")
+
+def parse_file(file_path: str, topic: str, chunk_size: int, chunk_overlap: int) -> List[BaseNode]:
+    """
+    Reads a file with SimpleDirectoryReader and splits it into chunks.
+
+    Runs in the worker processes of a bulk upload, so this module only imports
+    what parsing needs and the nodes are returned without embeddings.
+
+    Parameters:
+        file_path (str): Path of the file on disk.
+        topic (str): Topic stored in the metadata of every chunk.
+        chunk_size (int): Chunk size of the SentenceSplitter.
+        chunk_overlap (int): Chunk overlap of the SentenceSplitter.
+
+    Returns:
+        List[BaseNode]: The chunks of the file.
+    """
+    documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+    for document in documents:
+        document.metadata["topic"] = topic
+        exclude_file_path(document)
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.get_nodes_from_documents(documents)
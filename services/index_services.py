@@ -0,0 +1,349 @@
+from services.database_services import get_mongo_client
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from bson.son import SON
+from threading import Lock
+from typing import List, Optional
+from dotenv import load_dotenv
+load_dotenv()
+
+# course and subject collections whose indexes this process created
+_indexed_courses = set()
+_indexed_subjects = set()
+_index_lock = Lock()
+
+# server error codes of create_index when an index with the same keys or name differs,
+# and when a unique index cannot be built over duplicate values
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+DUPLICATE_KEY = 11000
+
+def global_indexes() -> List[tuple]:
+    """
+    Indexes of the collections shared by every course, as (database, collection, keys, options).
+    """
+    return [
+        ("chatbot", "users", [("email", ASCENDING)], {}),
+        ("chatbot", "users", [("school_id", ASCENDING)], {}),
+        ("vector", "records", [("course_name", ASCENDING)], {}),
+        ("vector", "files", [("course_name", ASCENDING), ("file_name", ASCENDING)], {"unique": True}),
+    ]
+
+def course_indexes(course_name: str) -> List[tuple]:
+    """
+    Indexes of the knowledge base collections of a course, as (database, collection, keys, options).
+    """
+    return [
+        ("vector", course_name, [("metadata.file_name", ASCENDING)], {}),
+        ("docstore", f"{course_name}/data", [("__data__.metadata.file_name", ASCENDING)], {}),
+        ("docstore", f"{course_name}/ref_doc_info", [("metadata.file_name", ASCENDING)], {}),
+        ("docstore", f"{course_name}/metadata", [("ref_doc_id", ASCENDING)], {}),
+    ]
+
+def subject_indexes(subject: str) -> List[tuple]:
+    """
+    Indexes of the chat history, statistics and feedback collections of a subject, as (database, collection, keys, options).
+    """
+    return [
+        # the conversation header is upserted on user_id, one header per user across writer processes
+        ("chat_history", subject, [("user_id", ASCENDING)], {"unique": True}),
+        ("chat_history", subject, [("created_at", ASCENDING)], {}),
+        ("chat_buckets", subject, [("user_id", ASCENDING), ("bucket", ASCENDING)], {"unique": True}),
+        # the message timestamps are read through the bounds of their bucket
+        ("chat_buckets", subject, [("start", ASCENDING), ("end", ASCENDING)], {}),
+        ("chat_stats", subject, [("granularity", ASCENDING), ("start", ASCENDING)], {}),
+        ("feedback", subject, [("user_id", ASCENDING)], {}),
+        ("feedback", subject, [("status", ASCENDING)], {}),
+    ]
+
+def merge_duplicate_conversations(collection) -> int:
+    """
+    Merges the conversation headers a user has more than once in a "chat_history.<subject>"
+    collection into the oldest one, e.g. headers left by the find then insert race of the
+    earlier chat history writes. Message counts are added up and the messages not yet
+    migrated to buckets are concatenated in time order.
+
+    Parameters:
+        collection (Collection): The chat history collection of a subject.
+
+    Returns:
+        int: The number of headers merged away.
+    """
+    removed = 0
+    duplicates = collection.aggregate([
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    for group in duplicates:
+        headers = sorted(collection.find({"_id": {"$in": group["ids"]}}),
+                         key=lambda header: (header.get("created_at") or datetime.min, str(header["_id"])))
+        fields = {}
+        if any("message_count" in header for header in headers):
+            fields["message_count"] = sum(header.get("message_count", 0) for header in headers)
+        if any("messages" in header for header in headers):
+            messages = [message for header in headers for message in header.get("messages", [])]
+            fields["messages"] = sorted(messages, key=lambda message: message.get("timestamp") or datetime.min)
+        created = [header["created_at"] for header in headers if header.get("created_at")]
+        if created:
+            fields["created_at"] = min(created)
+        if fields:
+            collection.update_one({"_id": headers[0]["_id"]}, {"$set": fields})
+        removed += collection.delete_many({"_id": {"$in": [header["_id"] for header in headers[1:]]}}).deleted_count
+    if removed:
+        print(f"Merged {removed} duplicate conversation headers of {collection.full_name}")
+    return removed
+
+# unique indexes whose existing duplicates can be merged, by database
+_duplicate_mergers = {"chat_history": merge_duplicate_conversations}
+
+def _make_unique(collection, keys: List[tuple]):
+    # the existing index is converted in place and never dropped, so the collection keeps an index
+    # throughout: new duplicates are refused first, then the existing ones merged (MongoDB 6.0+)
+    key_pattern = SON(keys)
+    db = collection.database
+    db.command("collMod", collection.name, index={"keyPattern": key_pattern, "prepareUnique": True})
+    merge = _duplicate_mergers.get(db.name)
+    if merge:
+        merge(collection)
+    db.command("collMod", collection.name, index={"keyPattern": key_pattern, "unique": True})
+
+def _create_index(collection, keys: List[tuple], options: dict):
+    try:
+        collection.create_index(keys, **options)
+    except OperationFailure as e:
+        merge = _duplicate_mergers.get(collection.database.name)
+        if e.code == DUPLICATE_KEY and merge:
+            # a unique index over a collection that already holds duplicates
+            merge(collection)
+            collection.create_index(keys, **options)
+        elif e.code in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT) and options.get("unique"):
+            # an index on the same keys that was created before it was made unique
+            _make_unique(collection, keys)
+        else:
+            raise
+
+def create_indexes(specs: List[tuple], client=None, raise_errors: bool = True) -> int:
+    """
+    Creates indexes, an index that already exists is left as is. An existing index that
+    must become unique is converted in place, after merging the duplicates it holds.
+
+    Parameters:
+        specs (List[tuple]): The indexes, as (database, collection, keys, options).
+        client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+        raise_errors (bool, optional): Raise when an index cannot be created, otherwise log it
+            and go on with the other indexes. Defaults to True.
+
+    Returns:
+        int: The number of indexes ensured.
+    """
+    client = client or get_mongo_client()
+    created = 0
+    for db_name, collection_name, keys, options in specs:
+        try:
+            _create_index(client[db_name][collection_name], keys, options)
+            created += 1
+        except Exception as e:
+            if raise_errors:
+                raise
+            print(f"Error creating index {keys} of {db_name}.{collection_name}: {e}")
+    return created
+
+def ensure_course_indexes(course_name: str, client=None):
+    """
+    Creates the indexes of a course's knowledge base collections once per process.
+
+    Parameters:
+        course_name (str): Name of the course.
+        client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+    """
+    if course_name in _indexed_courses:
+        return
+    with _index_lock:
+        if course_name not in _indexed_courses:
+            # a missing index slows the queries down but must not fail the request
+            create_indexes(course_indexes(course_name), client, raise_errors=False)
+            _indexed_courses.add(course_name)
+
+def ensure_subject_indexes(subject: str, client=None):
+    """
+    Creates the indexes of a subject's chat history and feedback collections once per process.
+
+    Parameters:
+        subject (str): Name of the subject.
+        client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+    """
+    if subject in _indexed_subjects:
+        return
+    with _index_lock:
+        if subject not in _indexed_subjects:
+            # a missing index slows the queries down but must not fail the write
+            create_indexes(subject_indexes(subject), client, raise_errors=False)
+            _indexed_subjects.add(subject)
+
+def forget_course_indexes(course_name: str):
+    """
+    Marks the indexes of a course as missing, after its collections were dropped.
+
+    Parameters:
+        course_name (str): Name of the course.
+    """
+    with _index_lock:
+        _indexed_courses.discard(course_name)
+
+def _courses(client) -> List[str]:
+    return sorted({doc["course_name"] for doc in client["vector"]["records"].find({}, {"course_name": 1, "_id": 0})})
+
+def _subjects(client) -> List[str]:
+    subjects = set()
+    for db_name in ("chat_history", "chat_buckets", "chat_stats", "feedback"):
+        subjects.update(client[db_name].list_collection_names())
+    return sorted(subjects)
+
+def provision_indexes(client=None) -> dict:
+    """
+    Creates the indexes of every hot query: the shared collections, the knowledge base
+    collections of every course and the chat history and feedback collections of every
+    subject. Called at application startup; collections created later get their indexes
+    when their first document is written.
+
+    Parameters:
+        client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+
+    Returns:
+        dict: The number of courses, subjects and indexes provisioned.
+    """
+    try:
+        client = client or get_mongo_client()
+        total = create_indexes(global_indexes(), client)
+        courses = _courses(client)
+        # an index that cannot be built is logged, it must not keep the application from starting
+        for course_name in courses:
+            total += create_indexes(course_indexes(course_name), client, raise_errors=False)
+        with _index_lock:
+            _indexed_courses.update(courses)
+        subjects = _subjects(client)
+        for subject in subjects:
+            total += create_indexes(subject_indexes(subject), client, raise_errors=False)
+        with _index_lock:
+            _indexed_subjects.update(subjects)
+        print(f"Provisioned {total} indexes for {len(courses)} courses and {len(subjects)} subjects")
+        return {"courses": len(courses), "subjects": len(subjects), "indexes": total}
+    except Exception as e:
+        raise Exception("Error in provisioning indexes: " + str(e))
+
+
+def hot_queries(courses: List[str], subjects: List[str]) -> List[dict]:
+    """
+    The queries the application runs on every request or ingestion, with sample values.
+
+    Parameters:
+        courses (List[str]): Courses whose knowledge base queries are listed.
+        subjects (List[str]): Subjects whose chat history and feedback queries are listed.
+
+    Returns:
+        List[dict]: The queries, with their name, database, collection, filter and sort.
+    """
+    sample = "index-advisor"
+    day = datetime(2024, 1, 1)
+    queries = [
+        {"name": "user by email", "db": "chatbot", "collection": "users", "filter": {"email": sample}},
+        {"name": "user by school id", "db": "chatbot", "collection": "users", "filter": {"school_id": sample}},
+        {"name": "course record", "db": "vector", "collection": "records", "filter": {"course_name": sample}},
+        {"name": "course files", "db": "vector", "collection": "files", "filter": {"course_name": sample},
+         "sort": [("file_name", ASCENDING)]},
+    ]
+    for course_name in courses:
+        queries += [
+            {"name": "vectors of a file", "db": "vector", "collection": course_name,
+             "filter": {"metadata.file_name": sample}},
+            {"name": "docstore nodes of a file", "db": "docstore", "collection": f"{course_name}/data",
+             "filter": {"__data__.metadata.file_name": sample}},
+            {"name": "docstore ref docs of a file", "db": "docstore", "collection": f"{course_name}/ref_doc_info",
+             "filter": {"metadata.file_name": sample}},
+        ]
+    for subject in subjects:
+        queries += [
+            {"name": "conversation of a user", "db": "chat_history", "collection": subject, "filter": {"user_id": sample}},
+            {"name": "conversations by creation date", "db": "chat_history", "collection": subject,
+             "filter": {"created_at": {"$gte": day, "$lte": day}}},
+            {"name": "latest messages of a user", "db": "chat_buckets", "collection": subject,
+             "filter": {"user_id": sample}, "sort": [("bucket", DESCENDING)]},
+            {"name": "messages by timestamp", "db": "chat_buckets", "collection": subject,
+             "filter": {"start": {"$lte": day}, "end": {"$gte": day}}},
+            {"name": "statistics rollups by date", "db": "chat_stats", "collection": subject,
+             "filter": {"granularity": "hour", "start": {"$gte": day, "$lt": day}}},
+            {"name": "feedback of a user", "db": "feedback", "collection": subject, "filter": {"user_id": sample}},
+            {"name": "feedback by status", "db": "feedback", "collection": subject, "filter": {"status": "New"}},
+        ]
+    return queries
+
+def _plan_stages(plan: dict) -> List[dict]:
+    # depth first walk of an explain plan, e.g. FETCH -> IXSCAN or SORT -> COLLSCAN
+    stages = [plan]
+    for child in plan.get("inputStages", []) + ([plan["inputStage"]] if "inputStage" in plan else []):
+        stages += _plan_stages(child)
+    return stages
+
+
+class IndexAdvisor():
+    """
+    Service class reporting how MongoDB runs each hot query, from the explain() of the query.
+    A query answered with a collection scan is flagged with the index it is missing.
+    """
+    def __init__(self, client=None):
+        """
+        Initializes the IndexAdvisor object.
+
+        Parameters:
+            client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+        """
+        self.client = client or get_mongo_client()
+
+    def explain(self, query: dict) -> dict:
+        """
+        Explains a hot query.
+
+        Parameters:
+            query (dict): The query, as listed by hot_queries.
+
+        Returns:
+            dict: The query with its winning plan stages, the index used, whether it scans
+                the collection and the keys and documents examined.
+        """
+        cursor = self.client[query["db"]][query["collection"]].find(query["filter"])
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+        explanation = cursor.explain()
+        stages = _plan_stages(explanation["queryPlanner"]["winningPlan"])
+        execution = explanation.get("executionStats", {})
+        collscan = any(stage.get("stage") == "COLLSCAN" for stage in stages)
+        return {
+            "name": query["name"],
+            "namespace": f"{query['db']}.{query['collection']}",
+            "filter": sorted(query["filter"]),
+            "stages": [stage.get("stage") for stage in stages],
+            "index": next((stage["indexName"] for stage in stages if "indexName" in stage), None),
+            "collscan": collscan,
+            "keys_examined": execution.get("totalKeysExamined"),
+            "docs_examined": execution.get("totalDocsExamined"),
+            "suggested_index": list(query["filter"]) + [key for key, _ in query.get("sort", [])] if collscan else None,
+        }
+
+    def report(self, course_name: Optional[str] = None) -> List[dict]:
+        """
+        Explains every hot query, the collection scans first.
+
+        Parameters:
+            course_name (str, optional): Restrict the per-course and per-subject queries to one course.
+
+        Returns:
+            List[dict]: The explained queries, see explain.
+        """
+        try:
+            courses = [course_name] if course_name else _courses(self.client)
+            subjects = [course_name] if course_name else _subjects(self.client)
+            report = [self.explain(query) for query in hot_queries(courses, subjects)]
+            return sorted(report, key=lambda entry: not entry["collscan"])
+        except Exception as e:
+            raise Exception("Error in explaining queries: " + str(e))
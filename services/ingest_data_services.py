@@ -1,24 +1,119 @@
 from llama_index.core import (
     VectorStoreIndex,
     StorageContext,
+    SimpleDirectoryReader,
 )
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.storage.docstore.mongodb import MongoDocumentStore
+from llama_index.core.readers.file.base import default_file_metadata_func
 from llama_index.core import Document
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore.utils import json_to_doc
+import hashlib
+import json
 import os
 from llama_index.vector_stores.mongodb import MongoDBAtlasVectorSearch
 from llama_index.core import Document
-import pymongo
 from llama_index.embeddings.openai import OpenAIEmbedding
-from typing import List
+from services.cache_services import invalidate_course_caches
+from services.bm25_index_services import BM25IndexService
+from services.embedding_cache_services import EmbeddingCacheService
+from services.file_parsing_services import exclude_file_path
+from services.database_services import get_mongo_client, get_mongo_docstore
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from itertools import islice
+import pypdf
 from dotenv import load_dotenv
 load_dotenv()
 
+# same exclusions SimpleDirectoryReader applies to the file metadata it adds, plus the file_path
+EXCLUDED_FILE_METADATA_KEYS = [
+    "file_path",
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+# chunking of the ingested files
+INGEST_CHUNK_SIZE = 512
+INGEST_CHUNK_OVERLAP = 10
+
+class FileDocumentStream():
+    """
+    Iterates the documents of a file one at a time. PDFs are read page by page,
+    producing the same per-page documents as SimpleDirectoryReader without
+    holding the whole file's text in memory. Other file types are loaded with
+    SimpleDirectoryReader.
+    """
+    def __init__(self, file_path: str):
+        """
+        Initializes the FileDocumentStream object.
+
+        Parameters:
+            file_path (str): Path of the file to read.
+        """
+        self.file_path = file_path
+        self.total_pages = None
+        self.pages_read = 0
+
+    def __iter__(self) -> Iterator[Document]:
+        if not self.file_path.lower().endswith(".pdf"):
+            documents = SimpleDirectoryReader(input_files=[self.file_path]).load_data()
+            self.total_pages = len(documents)
+            for document in documents:
+                exclude_file_path(document)
+                self.pages_read += 1
+                yield document
+            return
+
+        file_metadata = default_file_metadata_func(self.file_path)
+        with open(self.file_path, "rb") as fp:
+            pdf = pypdf.PdfReader(fp)
+            self.total_pages = len(pdf.pages)
+            for page in range(self.total_pages):
+                metadata = {"page_label": pdf.page_labels[page], **file_metadata}
+                document = Document(
+                    text=pdf.pages[page].extract_text(),
+                    metadata=metadata,
+                    excluded_embed_metadata_keys=list(EXCLUDED_FILE_METADATA_KEYS),
+                    excluded_llm_metadata_keys=list(EXCLUDED_FILE_METADATA_KEYS),
+                )
+                self.pages_read += 1
+                yield document
+
+
+def chunk_hash(node: BaseNode) -> str:
+    """
+    Hashes the text of a chunk and the metadata it is embedded with. The file_path is
+    left out, it is the temporary path the upload was written to and differs every time.
+    """
+    return hashlib.sha256(EmbeddingCacheService.cache_text(node).encode("utf-8")).hexdigest()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Groups an iterable into lists of at most size items.
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 class IngestDataService():
-    def __init__(self):
+    def __init__(self, embed_batch_size: int = 100):
         self.embed_model = OpenAIEmbedding(model="text-embedding-3-small")
-        self.MONGO_URI = os.getenv('MONGODB_CONNECTION_STRING')
-    def add_data(self,course_name: str,data: List[Document],topic:str = "", chunkingallowed: int = 1):
+        self.bm25_index = BM25IndexService()
+        self.embedding_cache = EmbeddingCacheService()
+        self.embed_batch_size = embed_batch_size
+        self.splitter = SentenceSplitter(
+            chunk_size=INGEST_CHUNK_SIZE,
+            chunk_overlap=INGEST_CHUNK_OVERLAP,
+        )
+    def add_data(self,course_name: str,data: List[Document],topic:str = "", chunkingallowed: int = 1, progress_callback: Optional[Callable[[int, int], None]] = None):
         """
         Adds data to the knowledge base.
         
@@ -27,38 +122,206 @@ class IngestDataService():
             data (List[Document]): List of Document objects to be added.
             topic (str, optional): Topic of the data. Defaults to "".
             chunkingallowed (int, optional): Flag indicating whether chunking is allowed. Defaults to 1.
+            progress_callback (Callable, optional): Called with (chunks embedded, total chunks) after each embedding batch.
         """
         try:
-            if not self.MONGO_URI:
-                raise ValueError("MongoDB URI is required.")
-            
-            
-            mongodb_client = pymongo.MongoClient(self.MONGO_URI)
             for doc in data:
                 doc.metadata["topic"] = topic
             
             if chunkingallowed ==1:
-                splitter = SentenceSplitter(
-                    chunk_size=512,
-                    chunk_overlap=10,
-                )
-                nodes = splitter.get_nodes_from_documents(data)
+                nodes = self.splitter.get_nodes_from_documents(data)
             else:
                 nodes = data
             
-            #create a vector index
-            store = MongoDBAtlasVectorSearch(mongodb_client,db_name="vector", collection_name=course_name)
-            storage_context_vector = StorageContext.from_defaults(vector_store=store)
-            VectorStoreIndex(nodes, storage_context=storage_context_vector, embed_model=self.embed_model)
-
-            #add to docstore
-            storage_context_docstore = StorageContext.from_defaults(
-                docstore=MongoDocumentStore.from_uri(uri=self.MONGO_URI, namespace=course_name, db_name="docstore"),
-                )
-            storage_context_docstore.docstore.add_documents(nodes)
+            #embed and store the nodes in batches to report progress
+            index, docstore = self._get_stores(course_name)
+            total = len(nodes)
+            for start in range(0, total, self.embed_batch_size):
+                self._store_nodes(course_name, index, docstore, nodes[start:start + self.embed_batch_size])
+                if progress_callback:
+                    progress_callback(min(start + self.embed_batch_size, total), total)
+
+            #drop the cached retrievers and answers so the next query sees the new nodes
+            invalidate_course_caches(course_name)
         
             print("Successfully Added to the Knowledge base")
         except Exception as e:
             raise Exception("Error in adding data: "+str(e))
 
- 
\ No newline at end of file
+    def add_file(self,course_name: str,file_path: str,topic:str = "", progress_callback: Optional[Callable[..., None]] = None):
+        """
+        Adds a file to the knowledge base with a streaming pipeline: pages are parsed and
+        split one at a time, and chunks are embedded and written in bounded batches,
+        so peak memory does not grow with the size of the file.
+
+        Parameters:
+            course_name (str): Name of the course.
+            file_path (str): Path of the file on disk.
+            topic (str, optional): Topic of the data. Defaults to "".
+            progress_callback (Callable, optional): Called after each batch with
+                (chunks embedded, chunks split so far, pages_processed=..., total_pages=...).
+        """
+        try:
+            documents = FileDocumentStream(file_path)
+            split_count = 0
+
+            def iter_nodes():
+                nonlocal split_count
+                for document in documents:
+                    document.metadata["topic"] = topic
+                    page_nodes = self.splitter.get_nodes_from_documents([document])
+                    split_count += len(page_nodes)
+                    yield from page_nodes
+
+            index, docstore = self._get_stores(course_name)
+            embedded = 0
+            for batch in batched(iter_nodes(), self.embed_batch_size):
+                self._store_nodes(course_name, index, docstore, batch)
+                embedded += len(batch)
+                if progress_callback:
+                    progress_callback(embedded, split_count, pages_processed=documents.pages_read, total_pages=documents.total_pages)
+
+            #drop the cached retrievers and answers so the next query sees the new nodes
+            invalidate_course_caches(course_name)
+
+            print("Successfully Added to the Knowledge base")
+        except Exception as e:
+            raise Exception("Error in adding file: "+str(e))
+
+    def add_nodes(self,course_name: str,nodes: Iterable[BaseNode], progress_callback: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Adds already split nodes to the knowledge base. The nodes are embedded and written
+        in shared batches as they are produced, whichever file they come from.
+
+        Parameters:
+            course_name (str): Name of the course.
+            nodes (Iterable[BaseNode]): The nodes, e.g. a generator over several files.
+            progress_callback (Callable, optional): Called with the number of nodes stored after each batch.
+
+        Returns:
+            int: The number of nodes stored.
+        """
+        try:
+            index, docstore = self._get_stores(course_name)
+            stored = 0
+            for batch in batched(nodes, self.embed_batch_size):
+                self._store_nodes(course_name, index, docstore, batch)
+                stored += len(batch)
+                if progress_callback:
+                    progress_callback(stored)
+
+            #drop the cached retrievers and answers so the next query sees the new nodes
+            invalidate_course_caches(course_name)
+            return stored
+        except Exception as e:
+            raise Exception("Error in adding nodes: "+str(e))
+
+    def update_file(self,course_name: str,file_path: str,file_name: str,topic: Optional[str] = None,
+                    progress_callback: Optional[Callable[[int, int], None]] = None) -> dict:
+        """
+        Replaces a file of the knowledge base with a new version by diffing its chunks.
+        The new version is split with the same splitter as add_file and every chunk is
+        hashed; only the chunks whose hash is not among the stored chunks of the file are
+        embedded and inserted, and only the stored chunks missing from the new version are
+        deleted from the vector collection, the docstore and the bm25 index.
+
+        Parameters:
+            course_name (str): Name of the course.
+            file_path (str): Path of the new version on disk.
+            file_name (str): Name of the file in the knowledge base.
+            topic (str, optional): Topic of the data. Defaults to the topic of the stored chunks.
+            progress_callback (Callable, optional): Called with (chunks embedded, chunks to embed) after each batch.
+
+        Returns:
+            dict: The number of chunks unchanged, added and removed.
+        """
+        try:
+            stored = self._get_file_nodes(course_name, file_name)
+            if topic is None:
+                topic = next((node.metadata.get("topic", "") for node in stored), "")
+
+            stored_ids: Dict[str, List[str]] = {}
+            for node in stored:
+                stored_ids.setdefault(chunk_hash(node), []).append(node.node_id)
+
+            # a chunk repeated in the file is matched as many times as it is stored
+            new_nodes = []
+            unchanged = 0
+            for document in FileDocumentStream(file_path):
+                document.metadata["topic"] = topic
+                for node in self.splitter.get_nodes_from_documents([document]):
+                    ids = stored_ids.get(chunk_hash(node))
+                    if ids:
+                        ids.pop()
+                        unchanged += 1
+                    else:
+                        new_nodes.append(node)
+            removed_ids = [node_id for ids in stored_ids.values() for node_id in ids]
+
+            # insert before deleting so the file never disappears from the answers
+            index, docstore = self._get_stores(course_name)
+            total = len(new_nodes)
+            for start in range(0, total, self.embed_batch_size):
+                self._store_nodes(course_name, index, docstore, new_nodes[start:start + self.embed_batch_size])
+                if progress_callback:
+                    progress_callback(min(start + self.embed_batch_size, total), total)
+            self._remove_nodes(course_name, file_name, removed_ids)
+
+            if new_nodes or removed_ids:
+                #drop the cached retrievers and answers so the next query sees the new version
+                invalidate_course_caches(course_name)
+
+            print(f"Updated {file_name}: {unchanged} chunks unchanged, {total} added, {len(removed_ids)} removed")
+            return {"unchanged": unchanged, "added": total, "removed": len(removed_ids)}
+        except Exception as e:
+            raise Exception("Error in updating file: "+str(e))
+
+    def _get_file_nodes(self,course_name: str,file_name: str) -> List[BaseNode]:
+        #the docstore keeps every chunk with its metadata, so the stored hashes can be recomputed
+        collection = get_mongo_client()["docstore"][f"{course_name}/data"]
+        docs = collection.find({"__data__.metadata.file_name": file_name})
+        return [json_to_doc({key: value for key, value in doc.items() if key != "_id"}) for doc in docs]
+
+    def _remove_nodes(self,course_name: str,file_name: str,node_ids: List[str]):
+        if not node_ids:
+            return
+        client = get_mongo_client()
+        result = client["vector"][course_name].delete_many({"_id": {"$in": node_ids}})
+        print("Deleted node vector:", result.deleted_count)
+
+        db_docstore = client["docstore"]
+        db_docstore[f"{course_name}/data"].delete_many({"_id": {"$in": node_ids}})
+        db_docstore[f"{course_name}/metadata"].delete_many({"_id": {"$in": node_ids}})
+        ref_doc_info = db_docstore[f"{course_name}/ref_doc_info"]
+        ref_doc_info.update_many(
+            {"metadata.file_name": file_name, "node_ids": {"$in": node_ids}},
+            {"$pull": {"node_ids": {"$in": node_ids}}}
+        )
+        ref_doc_info.delete_many({"metadata.file_name": file_name, "node_ids": {"$size": 0}})
+
+        self.bm25_index.remove_nodes(course_name, node_ids)
+
+    def _get_stores(self,course_name: str):
+        #vector index over the course's vector collection, and the course's docstore
+        store = MongoDBAtlasVectorSearch(get_mongo_client(),db_name="vector", collection_name=course_name)
+        storage_context_vector = StorageContext.from_defaults(vector_store=store)
+        index = VectorStoreIndex([], storage_context=storage_context_vector, embed_model=self.embed_model)
+        storage_context_docstore = StorageContext.from_defaults(
+            docstore=get_mongo_docstore(course_name),
+            )
+        return index, storage_context_docstore.docstore
+
+    def _store_nodes(self,course_name: str, index, docstore, nodes):
+        #reuse cached vectors, only the misses are sent to the embedding model
+        self.embedding_cache.embed_nodes(nodes, self.embed_model, self.embed_batch_size)
+        index.insert_nodes(nodes)
+
+        #the vectors live in the vector store, the docstore nodes are kept without them
+        for node in nodes:
+            node.embedding = None
+
+        #add to docstore
+        docstore.add_documents(nodes)
+
+        #add to the bm25 inverted index
+        self.bm25_index.add_nodes(course_name, nodes)
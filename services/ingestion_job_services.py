@@ -0,0 +1,581 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from threading import Event, Lock, Thread
+from pymongo import ReturnDocument
+from gridfs import GridFSBucket
+from services.database_services import get_mongo_client
+from services.ingest_data_services import IngestDataService, INGEST_CHUNK_SIZE, INGEST_CHUNK_OVERLAP
+from services.file_parsing_services import parse_file
+from services.knowledge_base_services import KnowledgeBaseService
+from services.facebook_services import FacebookService
+from services.facebook_sync_services import FacebookSyncService, FacebookSyncScheduler
+from typing import BinaryIO, List, Optional, Tuple
+import multiprocessing
+import requests
+import socket
+import zipfile
+import uuid
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+class IngestionJobService():
+    """
+    Service class for running ingestion in the background.
+
+    Jobs are stored in the "jobs.ingestion" collection and uploaded files in the
+    "jobs.uploads" GridFS bucket, so queued and interrupted jobs are resumed after
+    a restart. A bounded thread pool runs the jobs so ingestion cannot take every
+    worker thread away from the chat endpoints.
+
+    A running job carries the id of the worker that claimed it and a heartbeat the
+    worker refreshes periodically. Every worker sweeps for running jobs whose
+    heartbeat stopped, from a process that crashed or was killed, and runs them again.
+    """
+    def __init__(self, client=None, max_workers: Optional[int] = None, stale_after_seconds: Optional[int] = None,
+                 parse_processes: Optional[int] = None, heartbeat_seconds: Optional[int] = None,
+                 shutdown_timeout_seconds: Optional[int] = None, max_attempts: Optional[int] = None):
+        """
+        Initializes the IngestionJobService object.
+
+        Parameters:
+            client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+            max_workers (int, optional): Number of jobs running at once.
+                Defaults to the INGEST_MAX_CONCURRENT_JOBS environment variable or 2.
+            stale_after_seconds (int, optional): A running job whose worker sent no heartbeat for this long
+                is considered interrupted and is resumed. Defaults to INGEST_JOB_STALE_SECONDS or 120.
+            parse_processes (int, optional): Number of processes parsing the files of a bulk upload.
+                Defaults to INGEST_PARSE_PROCESSES or the number of CPUs.
+            heartbeat_seconds (int, optional): Seconds between two heartbeats of the running jobs and two
+                sweeps for interrupted jobs. Defaults to INGEST_JOB_HEARTBEAT_SECONDS or 30.
+            shutdown_timeout_seconds (int, optional): Seconds shutdown waits for the running jobs before
+                queueing them again. Defaults to INGEST_SHUTDOWN_TIMEOUT_SECONDS or 30.
+            max_attempts (int, optional): Number of times a job whose worker stopped is run before it is
+                marked failed. Defaults to INGEST_MAX_JOB_ATTEMPTS or 3.
+        """
+        if max_workers is None:
+            max_workers = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", 2))
+        if stale_after_seconds is None:
+            stale_after_seconds = int(os.getenv("INGEST_JOB_STALE_SECONDS", 120))
+        if parse_processes is None:
+            parse_processes = int(os.getenv("INGEST_PARSE_PROCESSES", os.cpu_count() or 1))
+        if heartbeat_seconds is None:
+            heartbeat_seconds = int(os.getenv("INGEST_JOB_HEARTBEAT_SECONDS", 30))
+        if shutdown_timeout_seconds is None:
+            shutdown_timeout_seconds = int(os.getenv("INGEST_SHUTDOWN_TIMEOUT_SECONDS", 30))
+        if max_attempts is None:
+            max_attempts = int(os.getenv("INGEST_MAX_JOB_ATTEMPTS", 3))
+        self.client = client or get_mongo_client()
+        db = self.client["jobs"]
+        self.jobs = db["ingestion"]
+        self.uploads = GridFSBucket(db, bucket_name="uploads")
+        self.max_workers = max_workers
+        self.stale_after_seconds = stale_after_seconds
+        self.parse_processes = parse_processes
+        self.heartbeat_seconds = heartbeat_seconds
+        self.shutdown_timeout_seconds = shutdown_timeout_seconds
+        self.max_attempts = max_attempts
+        # stamped on the jobs this process claims, the heartbeat and the final status only touch those
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._executor = None
+        # job id -> future of the jobs submitted to this process's pool
+        self._futures = {}
+        self._lock = Lock()
+        self._stopping = Event()
+        self._heartbeat_thread = None
+        self.ingest_data_service = IngestDataService()
+        self.kb_service = KnowledgeBaseService(client=self.client)
+        self.fb_service = FacebookService(client=self.client)
+        self.fb_sync_service = FacebookSyncService(self.fb_service, self.kb_service, self.ingest_data_service)
+
+    def start(self):
+        """
+        Starts the worker pool and the heartbeat thread, and resumes the queued and interrupted
+        jobs. Called at application startup.
+        """
+        try:
+            if self._executor is None:
+                self._stopping.clear()
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingestion")
+            self.jobs.create_index([("status", 1), ("heartbeat_at", 1)])
+            self.jobs.create_index([("status", 1), ("updated_at", 1)])
+            self.jobs.create_index([("course_name", 1), ("created_at", -1)])
+
+            self.sweep()
+            for job in self.jobs.find({"status": "queued"}, {"_id": 1}).sort("created_at", 1):
+                self._submit(job["_id"])
+            if self._heartbeat_thread is None:
+                self._heartbeat_thread = Thread(target=self._run_heartbeat, name="ingestion-heartbeat", daemon=True)
+                self._heartbeat_thread.start()
+        except Exception as e:
+            raise Exception("Error in starting ingestion jobs: " + str(e))
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """
+        Stops the worker pool before the MongoDB client is closed. The jobs not started yet are
+        cancelled, the running jobs stop at their next progress update, and the jobs still
+        running after the timeout are queued again, so they are resumed by the next start or
+        by another worker.
+
+        Parameters:
+            timeout (float, optional): Seconds to wait for the running jobs. Defaults to shutdown_timeout_seconds.
+        """
+        if self._executor is None:
+            return
+        if timeout is None:
+            timeout = self.shutdown_timeout_seconds
+        self._stopping.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            futures = list(self._futures.values())
+        wait(futures, timeout=timeout)
+        self._executor = None
+
+        # an attempt cut short by a shutdown does not count towards max_attempts
+        requeued = self.jobs.update_many(
+            {"status": "running", "owner": self.worker_id},
+            {"$set": {"status": "queued", "owner": None, "updated_at": datetime.utcnow()}, "$inc": {"attempts": -1}}
+        ).modified_count
+        if requeued:
+            print(f"Queued {requeued} unfinished ingestion jobs again at shutdown")
+
+    def sweep(self) -> int:
+        """
+        Queues again the running jobs whose worker stopped sending heartbeats, and runs them
+        along with the queued jobs no live worker picked up. A job whose worker stopped
+        max_attempts times, e.g. a file that crashes the process, is marked failed instead.
+
+        Returns:
+            int: The number of jobs queued again.
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.stale_after_seconds)
+        stale = {"status": "running", "$or": [
+            {"heartbeat_at": {"$lt": stale_before}},
+            # jobs claimed before heartbeats were recorded
+            {"heartbeat_at": {"$exists": False}, "updated_at": {"$lt": stale_before}},
+        ]}
+        requeued = 0
+        for job in self.jobs.find(stale, {"_id": 1, "kind": 1, "course_name": 1, "attempts": 1, "file_id": 1, "files": 1, "file_name": 1}):
+            if job.get("attempts", 0) >= self.max_attempts:
+                if self.jobs.update_one(
+                    {"_id": job["_id"], **stale},
+                    {"$set": {"status": "failed", "owner": None, "updated_at": now,
+                              "error": f"The worker stopped during each of the {job['attempts']} attempts"}}
+                ).modified_count:
+                    print(f"Ingestion job {job['_id']} failed after {job['attempts']} attempts")
+                    if job["kind"] in ("upload", "link"):
+                        self._remove_partial(job["course_name"], [job["file_name"]])
+                    elif job["kind"] == "bulk":
+                        self._remove_partial(job["course_name"], [file["file_name"] for file in job["files"]])
+                    self._delete_uploads(job)
+                continue
+            if self.jobs.update_one(
+                {"_id": job["_id"], **stale},
+                {"$set": {"status": "queued", "owner": None, "updated_at": now}}
+            ).modified_count:
+                requeued += 1
+                print(f"Ingestion job {job['_id']} lost its worker, queued again")
+                self._submit(job["_id"])
+
+        # queued by a worker that stopped before running them
+        for job in self.jobs.find({"status": "queued", "updated_at": {"$lt": stale_before}}, {"_id": 1}).sort("created_at", 1):
+            self._submit(job["_id"])
+        return requeued
+
+    def _run_heartbeat(self):
+        while not self._stopping.wait(self.heartbeat_seconds):
+            try:
+                self.jobs.update_many(
+                    {"status": "running", "owner": self.worker_id},
+                    {"$set": {"heartbeat_at": datetime.utcnow()}}
+                )
+                self.sweep()
+            except Exception as e:
+                print(f"Error in ingestion job heartbeat: {e}")
+
+    def _submit(self, job_id: str):
+        # a job already waiting in this process's pool is not submitted twice
+        with self._lock:
+            if job_id in self._futures:
+                return
+            future = self._executor.submit(self._run, job_id)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget(job_id))
+
+    def _forget(self, job_id: str):
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def _enqueue(self, kind: str, course_name: str, **fields) -> str:
+        now = datetime.utcnow()
+        job = {
+            "_id": str(uuid.uuid4()),
+            "kind": kind,
+            "course_name": course_name,
+            "status": "queued",
+            "total_chunks": 0,
+            "embedded_chunks": 0,
+            "attempts": 0,
+            "error": None,
+            "result": None,
+            "created_at": now,
+            "updated_at": now,
+            **fields,
+        }
+        self.jobs.insert_one(job)
+        if self._executor is None:
+            self.start()
+        else:
+            self._submit(job["_id"])
+        return job["_id"]
+
+    def enqueue_upload(self, course_name: str, file_name: str, file: BinaryIO) -> str:
+        """
+        Stores an uploaded file and queues its ingestion.
+
+        Parameters:
+            course_name (str): Name of the course.
+            file_name (str): Name of the uploaded file.
+            file (BinaryIO): The uploaded file, read in chunks.
+
+        Returns:
+            str: The job id.
+        """
+        try:
+            file_id = self.uploads.upload_from_stream(file_name, file, metadata={"course_name": course_name})
+            return self._enqueue("upload", course_name, file_name=file_name, file_id=file_id)
+        except Exception as e:
+            raise Exception("Error in queueing upload: " + str(e))
+
+    def enqueue_update(self, course_name: str, file_name: str, file: BinaryIO) -> str:
+        """
+        Stores the new version of a file already in the course and queues its re-ingestion.
+        Only the chunks that changed are embedded again.
+
+        Parameters:
+            course_name (str): Name of the course.
+            file_name (str): Name of the file.
+            file (BinaryIO): The new version, read in chunks.
+
+        Returns:
+            str: The job id.
+        """
+        try:
+            file_id = self.uploads.upload_from_stream(file_name, file, metadata={"course_name": course_name})
+            return self._enqueue("update", course_name, file_name=file_name, file_id=file_id)
+        except Exception as e:
+            raise Exception("Error in queueing update: " + str(e))
+
+    def enqueue_bulk_upload(self, course_name: str, uploads: List[Tuple[str, BinaryIO]]) -> dict:
+        """
+        Stores the files of a bulk upload and queues their ingestion as a single job.
+        Zip archives are expanded into their files. Files already in the course, or
+        repeated in the upload, are skipped with a single check for the whole batch.
+
+        Parameters:
+            course_name (str): Name of the course.
+            uploads (List[Tuple[str, BinaryIO]]): (file name, file) of each uploaded file or archive.
+
+        Returns:
+            dict: The job id, None if no file was queued, and a result per file under "files".
+        """
+        try:
+            entries = []
+            for upload_name, upload in uploads:
+                if upload_name.lower().endswith(".zip"):
+                    archive = zipfile.ZipFile(upload)
+                    for member in archive.infolist():
+                        file_name = os.path.basename(member.filename)
+                        # skip folders, hidden files and the resource forks macOS adds to archives
+                        if member.is_dir() or not file_name or file_name.startswith(".") or member.filename.startswith("__MACOSX/"):
+                            continue
+                        entries.append((file_name, lambda archive=archive, member=member: archive.open(member)))
+                else:
+                    entries.append((os.path.basename(upload_name), lambda upload=upload: upload))
+
+            existing = self.kb_service.existing_files(course_name, [file_name for file_name, _ in entries])
+            results = []
+            files = []
+            seen = set()
+            for file_name, open_file in entries:
+                if file_name in existing:
+                    results.append({"file_name": file_name, "status": "duplicate", "detail": f"{file_name} already exist"})
+                elif file_name in seen:
+                    results.append({"file_name": file_name, "status": "duplicate", "detail": f"{file_name} is repeated in the upload"})
+                else:
+                    seen.add(file_name)
+                    file_id = self.uploads.upload_from_stream(file_name, open_file(), metadata={"course_name": course_name})
+                    files.append({"file_name": file_name, "file_id": file_id})
+                    results.append({"file_name": file_name, "status": "queued", "detail": None})
+
+            job_id = self._enqueue("bulk", course_name, files=files) if files else None
+            return {"job_id": job_id, "files": results}
+        except Exception as e:
+            raise Exception("Error in queueing bulk upload: " + str(e))
+
+    def enqueue_link(self, course_name: str, download_link: str, file_name: str) -> str:
+        """
+        Queues the download and ingestion of a file link.
+
+        Parameters:
+            course_name (str): Name of the course.
+            download_link (str): URL of the file.
+            file_name (str): Name of the file taken from the URL.
+
+        Returns:
+            str: The job id.
+        """
+        try:
+            return self._enqueue("link", course_name, file_name=file_name, download_link=download_link)
+        except Exception as e:
+            raise Exception("Error in queueing download: " + str(e))
+
+    def enqueue_facebook(self, course_name: str, full: bool = False) -> str:
+        """
+        Queues the ingestion of the Facebook page posts. If a sync of the course is
+        already queued or running, its job id is returned instead.
+
+        Parameters:
+            course_name (str): Name of the course.
+            full (bool, optional): Read every post instead of the posts since the last sync. Defaults to False.
+
+        Returns:
+            str: The job id.
+        """
+        try:
+            active = self.jobs.find_one(
+                {"kind": "facebook", "course_name": course_name, "status": {"$in": ["queued", "running"]}},
+                {"_id": 1}
+            )
+            if active is not None:
+                return active["_id"]
+            return self._enqueue("facebook", course_name, full=full)
+        except Exception as e:
+            raise Exception("Error in queueing facebook ingestion: " + str(e))
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """
+        Retrieves a job by id.
+
+        Parameters:
+            job_id (str): The job id.
+
+        Returns:
+            dict or None: The job document.
+        """
+        try:
+            return self.jobs.find_one({"_id": job_id}, {"file_id": 0, "files": 0})
+        except Exception as e:
+            raise Exception("Error in getting job: " + str(e))
+
+    def get_jobs_by_course(self, course_name: str, limit: int = 50) -> List[dict]:
+        """
+        Retrieves the latest jobs of a course.
+
+        Parameters:
+            course_name (str): Name of the course.
+            limit (int, optional): Maximum number of jobs returned. Defaults to 50.
+
+        Returns:
+            List[dict]: The job documents, newest first.
+        """
+        try:
+            return list(self.jobs.find({"course_name": course_name}, {"file_id": 0, "files": 0}).sort("created_at", -1).limit(limit))
+        except Exception as e:
+            raise Exception("Error in getting jobs: " + str(e))
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = datetime.utcnow()
+        self.jobs.update_one({"_id": job_id}, {"$set": fields})
+
+    def _finish(self, job_id: str, **fields) -> bool:
+        # a job queued again by shutdown or by another worker's sweep no longer belongs to this worker
+        fields["updated_at"] = datetime.utcnow()
+        return self.jobs.update_one(
+            {"_id": job_id, "status": "running", "owner": self.worker_id}, {"$set": fields}
+        ).modified_count == 1
+
+    def _progress(self, job_id: str):
+        def callback(embedded: int, total: int, pages_processed: Optional[int] = None, total_pages: Optional[int] = None):
+            if self._stopping.is_set():
+                # stop between two batches, the job is resumed after the restart
+                raise Exception("Ingestion is shutting down")
+            fields = {"embedded_chunks": embedded, "total_chunks": total}
+            if total_pages is not None:
+                fields.update(pages_processed=pages_processed, total_pages=total_pages)
+            self._update(job_id, **fields)
+        return callback
+
+    def _run(self, job_id: str):
+        # claim the job so a second process resuming the same queue skips it
+        now = datetime.utcnow()
+        job = self.jobs.find_one_and_update(
+            {"_id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "owner": self.worker_id, "heartbeat_at": now, "updated_at": now}, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return
+        try:
+            if job["kind"] == "facebook":
+                result = self._run_facebook(job)
+            elif job["kind"] == "bulk":
+                result = self._run_bulk(job)
+            elif job["kind"] == "update":
+                result = self._run_update(job)
+            else:
+                result = self._run_file(job)
+            finished = self._finish(job_id, status="completed", result=result)
+            print(f"Ingestion job {job_id} completed")
+        except Exception as e:
+            if self._stopping.is_set():
+                # interrupted by the shutdown, the upload is kept for the next attempt
+                if self._finish(job_id, status="queued", owner=None, attempts=job["attempts"] - 1):
+                    print(f"Ingestion job {job_id} interrupted by shutdown, queued again")
+                return
+            finished = self._finish(job_id, status="failed", error=str(e))
+            print(f"Ingestion job {job_id} failed: {e}")
+        if not finished:
+            # another worker resumed the job and owns its uploads now
+            return
+
+        self._delete_uploads(job)
+
+    def _delete_uploads(self, job: dict):
+        # the stored uploads are only needed until the job finishes
+        file_ids = [job["file_id"]] if job.get("file_id") is not None else []
+        file_ids += [file["file_id"] for file in job.get("files", [])]
+        for file_id in file_ids:
+            try:
+                self.uploads.delete(file_id)
+            except Exception as e:
+                print(f"Error deleting upload of job {job['_id']}: {e}")
+
+    def _run_file(self, job: dict) -> dict:
+        course_name = job["course_name"]
+        file_name = job["file_name"]
+        if self.kb_service.file_exists(course_name, file_name):
+            raise ValueError(f"{file_name} already exist")
+        # an earlier attempt or upload of the file may have written part of the chunks, the file is only recorded at the end
+        self.kb_service.remove_file_chunks(course_name, [file_name])
+
+        try:
+            self._ingest_file(job)
+        except Exception:
+            self._remove_partial(course_name, [file_name])
+            raise
+        self.kb_service.add_file_to_course(course_name, file_name)
+        return {"file_name": file_name}
+
+    def _ingest_file(self, job: dict):
+        course_name = job["course_name"]
+        file_name = job["file_name"]
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, file_name)
+            with open(file_path, "wb") as temp_file:
+                if job["kind"] == "upload":
+                    self.uploads.download_to_stream(job["file_id"], temp_file)
+                else:
+                    response = requests.get(job["download_link"], stream=True)
+                    response.raise_for_status()
+                    for chunk in response.iter_content(1024 * 1024):
+                        if chunk:  # filter out keep-alive new chunks
+                            temp_file.write(chunk)
+
+            topic = file_name if job["kind"] == "upload" else ""
+            self.ingest_data_service.add_file(course_name, file_path, topic, progress_callback=self._progress(job["_id"]))
+
+    def _remove_partial(self, course_name: str, file_names: List[str]):
+        # chunks of files missing from the registry were left by an ingestion that did not finish,
+        # they are removed so retrieval does not serve them and a new upload does not duplicate them
+        try:
+            partial = set(file_names) - self.kb_service.existing_files(course_name, file_names)
+            if partial:
+                self.kb_service.remove_file_chunks(course_name, list(partial))
+        except Exception as e:
+            print(f"Error removing partial chunks of {course_name}: {e}")
+
+    def _run_update(self, job: dict) -> dict:
+        course_name = job["course_name"]
+        file_name = job["file_name"]
+        if not self.kb_service.file_exists(course_name, file_name):
+            raise ValueError(f"{file_name} not found")
+
+        # the diff is against what is stored, so an interrupted attempt is simply run again
+        with TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, file_name)
+            with open(file_path, "wb") as temp_file:
+                self.uploads.download_to_stream(job["file_id"], temp_file)
+            result = self.ingest_data_service.update_file(course_name, file_path, file_name, progress_callback=self._progress(job["_id"]))
+        return {"file_name": file_name, **result}
+
+    def _run_bulk(self, job: dict) -> dict:
+        course_name = job["course_name"]
+        files = job["files"]
+        file_names = [file["file_name"] for file in files]
+        # an earlier attempt may have written part of the chunks, the files are only recorded at the end
+        self._remove_partial(course_name, file_names)
+        try:
+            return self._ingest_bulk(job)
+        except Exception:
+            self._remove_partial(course_name, file_names)
+            raise
+
+    def _ingest_bulk(self, job: dict) -> dict:
+        course_name = job["course_name"]
+        files = job["files"]
+        progress = self._progress(job["_id"])
+        results = {}
+        split_count = 0
+
+        with TemporaryDirectory() as temp_dir:
+            paths = {}
+            for index, file in enumerate(files):
+                # a directory per file keeps the original name for the reader's file metadata
+                file_dir = os.path.join(temp_dir, str(index))
+                os.makedirs(file_dir)
+                paths[file["file_name"]] = os.path.join(file_dir, file["file_name"])
+                with open(paths[file["file_name"]], "wb") as temp_file:
+                    self.uploads.download_to_stream(file["file_id"], temp_file)
+
+            def iter_nodes():
+                nonlocal split_count
+                # parsing is CPU bound, files are read and split in parallel processes
+                # and their chunks embedded in shared batches as each file completes
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=min(self.parse_processes, len(files)), mp_context=context) as pool:
+                    futures = {
+                        pool.submit(parse_file, path, file_name, INGEST_CHUNK_SIZE, INGEST_CHUNK_OVERLAP): file_name
+                        for file_name, path in paths.items()
+                    }
+                    for future in as_completed(futures):
+                        file_name = futures[future]
+                        try:
+                            nodes = future.result()
+                        except Exception as e:
+                            results[file_name] = {"file_name": file_name, "status": "failed", "chunks": 0, "error": str(e)}
+                            continue
+                        results[file_name] = {"file_name": file_name, "status": "completed", "chunks": len(nodes), "error": None}
+                        split_count += len(nodes)
+                        yield from nodes
+
+            self.ingest_data_service.add_nodes(course_name, iter_nodes(), progress_callback=lambda stored: progress(stored, split_count))
+
+        ingested = [file_name for file_name, result in results.items() if result["status"] == "completed"]
+        self.kb_service.add_files_to_course(course_name, ingested)
+        return {
+            "total_ingested": len(ingested),
+            "files": [results[file["file_name"]] for file in files],
+        }
+
+    def _run_facebook(self, job: dict) -> dict:
+        return self.fb_sync_service.sync(job["course_name"], progress_callback=self._progress(job["_id"]), full=job.get("full", False))
+
+
+ingestion_job_service = IngestionJobService()
+facebook_sync_scheduler = FacebookSyncScheduler(ingestion_job_service.fb_sync_service, ingestion_job_service.enqueue_facebook)
@@ -1,214 +1,371 @@
 import os
-import pymongo
 import re
-from typing import List
+from services.cache_services import invalidate_course_caches
+from services.bm25_index_services import BM25IndexService
+from services.course_registry_services import course_registry
+from services.database_services import get_mongo_client
+from services.index_services import ensure_course_indexes, forget_course_indexes
+from datetime import datetime
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
 from dotenv import load_dotenv
 load_dotenv()
 
+# whether this process created the files registry index
+_files_indexed = False
+
+def ensure_file_indexes(client=None):
+    """
+    Creates the unique (course_name, file_name) index of the files registry.
+
+    Parameters:
+        client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+    """
+    global _files_indexed
+    client = client or get_mongo_client()
+    client["vector"]["files"].create_index([("course_name", ASCENDING), ("file_name", ASCENDING)], unique=True)
+    _files_indexed = True
+
+# default page size of the course file listing
+FILES_PAGE_SIZE = 100
+
+_delete_executor = ThreadPoolExecutor(max_workers=int(os.getenv("KB_DELETE_CONCURRENCY", 5)), thread_name_prefix="kb-delete")
+
+
 class KnowledgeBaseService():
     """
     Service class for managing knowledge base data in a MongoDB database.
     """
-    def __init__(self):
-        MONGO_URI = os.getenv('MONGODB_CONNECTION_STRING')
-        self.client = pymongo.MongoClient(MONGO_URI)
+    def __init__(self, client=None, registry=None):
+        self.client = client or get_mongo_client()
+        self.bm25_index = BM25IndexService(client=self.client)
+        self.course_registry = registry or course_registry
 
-    def delete_file(self,course_name: str, file_name_to_delete: str):
+    def delete_file(self,course_name: str, file_name_to_delete: str) -> dict:
         """
-        Deletes a file from the knowledge base.
+        Deletes a file from the knowledge base and the files registry.
 
         Parameters:
             course_name (str): Name of the course containing the file.
             file_name_to_delete (str): Name of the file to be deleted.
+
+        Returns:
+            dict: What was removed, see delete_files.
+        """
+        try:
+            return self.delete_files(course_name, [file_name_to_delete])
+        except Exception as e:
+            raise Exception("Error in deleting file: " + str(e))
+
+    def delete_files(self,course_name: str, file_names: List[str]) -> dict:
+        """
+        Deletes many files from the knowledge base with set-based deletes. The node and
+        ref doc ids are looked up once through indexed file_name queries, then the vector,
+        docstore and bm25 deletions run concurrently with $in filters. The files are removed
+        from the files registry, and the course is removed, with its facebook sync state,
+        when it has no file left.
+
+        Parameters:
+            course_name (str): Name of the course containing the files.
+            file_names (List[str]): Names of the files to be deleted.
+
+        Returns:
+            dict: The number of files, vectors, docstore nodes, ref docs and bm25 documents
+                removed, and whether the course was removed.
+        """
+        try:
+            file_names = list(set(file_names))
+            report = self.remove_file_chunks(course_name, file_names)
+
+            files = self._files_collection()
+            report["files"] = files.delete_many({"course_name": course_name, "file_name": {"$in": file_names}}).deleted_count
+            report["course_removed"] = files.find_one({"course_name": course_name}, {"_id": 1}) is None
+            if report["course_removed"]:
+                #a course not migrated to the files registry yet still lists its files in its record
+                legacy = self.client["vector"]["records"].find_one_and_update(
+                    {"course_name": course_name, "file_names": {"$exists": True}},
+                    {"$pull": {"file_names": {"$in": file_names}}},
+                    projection={"file_names": 1},
+                    return_document=ReturnDocument.AFTER
+                )
+                report["course_removed"] = not (legacy and legacy["file_names"])
+            if report["course_removed"]:
+                self._drop_course_collections(course_name)
+                self._forget_course(course_name)
+
+            #drop the cached retrievers and answers so the next query no longer sees the files
+            invalidate_course_caches(course_name)
+            print(f"Deleted {report['files']} files from {course_name}: {report}")
+            return report
+        except Exception as e:
+            raise Exception("Error in deleting files: " + str(e))
+
+    def remove_file_chunks(self,course_name: str, file_names: List[str]) -> dict:
+        """
+        Removes the vectors, docstore nodes and bm25 documents of files, leaving the files
+        registry and the course as they are. Used to clear the chunks an unfinished
+        ingestion wrote before the file was recorded.
+
+        Parameters:
+            course_name (str): Name of the course containing the files.
+            file_names (List[str]): Names of the files.
+
+        Returns:
+            dict: The number of vectors, docstore nodes, ref docs and bm25 documents removed.
         """
         try:
-            db_docstore = self.client["docstore"] 
+            file_names = list(set(file_names))
+            ensure_course_indexes(course_name, self.client)
+            db_docstore = self.client["docstore"]
             collection_data = db_docstore[f"{course_name}/data"]
-            filter_criteria_data = {"__data__.metadata.file_name": file_name_to_delete}
-            # Delete documents matching the filter criteria
-            result = collection_data.delete_many(filter_criteria_data)
-            # Print the number of deleted documents
-            print("Deleted count data:", result.deleted_count)
-
-            filter_criteria_ref_doc_info = {"metadata.file_name": file_name_to_delete}
-            
             collection_ref_doc_info = db_docstore[f"{course_name}/ref_doc_info"]
-            documents_to_delete = collection_ref_doc_info.find(filter_criteria_ref_doc_info)
-            # Extract _id values from the documents
-            ids_to_delete = [doc["_id"] for doc in documents_to_delete]
-            result = collection_ref_doc_info.delete_many(filter_criteria_ref_doc_info)
-            print("Deleted count ref_doc_info:", result.deleted_count)
-
-            deleted_count = 0
-            collection_metadata = db_docstore[f"{course_name}/metadata"]
-            for doc_id in ids_to_delete:
-                result = collection_metadata.delete_many({"ref_doc_id": doc_id})
-                deleted_count += result.deleted_count
-            print("Deleted count metadata:",deleted_count)
-
-            db_vector = self.client["vector"] 
-            collection = db_vector[course_name]
-            filter_criteria_ref_doc_info = {"metadata.file_name": file_name_to_delete}
-            result = collection.delete_many(filter_criteria_ref_doc_info)
-            print("Deleted node vector:", result.deleted_count)
-    
-            if collection.count_documents({}) == 0:
-                # If it's empty, delete the collection
-                db_vector.drop_collection(course_name)
-                db_docstore.drop_collection(f"{course_name}/data")
-                db_docstore.drop_collection(f"{course_name}/metadata")
-                db_docstore.drop_collection(f"{course_name}/ref_doc_info")
+            node_ids = [doc["_id"] for doc in collection_data.find({"__data__.metadata.file_name": {"$in": file_names}}, {"_id": 1})]
+            ref_doc_ids = [doc["_id"] for doc in collection_ref_doc_info.find({"metadata.file_name": {"$in": file_names}}, {"_id": 1})]
+
+            deletions = {
+                "vectors": lambda: self.client["vector"][course_name].delete_many({"metadata.file_name": {"$in": file_names}}).deleted_count,
+                "docstore_nodes": lambda: collection_data.delete_many({"_id": {"$in": node_ids}}).deleted_count,
+                "metadata": lambda: db_docstore[f"{course_name}/metadata"].delete_many({"_id": {"$in": node_ids}}).deleted_count,
+                "ref_docs": lambda: collection_ref_doc_info.delete_many({"_id": {"$in": ref_doc_ids}}).deleted_count,
+                "bm25_docs": lambda: self.bm25_index.remove_files(course_name, file_names),
+            }
+            return self._run_deletions(deletions)
         except Exception as e:
-            raise Exception("Error in deleting file: " + str(e))
+            raise Exception("Error in removing file chunks: " + str(e))
+
+    def delete_course(self,course_name: str) -> dict:
+        """
+        Deletes a course with every file of its knowledge base and its facebook sync state.
+        The course's vector, docstore and bm25 collections are dropped concurrently.
+
+        Parameters:
+            course_name (str): Name of the course.
+
+        Returns:
+            dict: The number of files, vectors and docstore nodes removed.
+        """
+        try:
+            report = {
+                "vectors": self.client["vector"][course_name].estimated_document_count(),
+                "docstore_nodes": self.client["docstore"][f"{course_name}/data"].estimated_document_count(),
+            }
+            self._drop_course_collections(course_name)
+            report["files"] = self._files_collection().delete_many({"course_name": course_name}).deleted_count
+            self._forget_course(course_name)
+
+            #drop the cached retrievers and answers of the course
+            invalidate_course_caches(course_name)
+            print(f"Deleted course {course_name}: {report}")
+            return report
+        except Exception as e:
+            raise Exception("Error in deleting course: " + str(e))
+
+    def _drop_course_collections(self,course_name: str):
+        db_docstore = self.client["docstore"]
+        self._run_deletions({
+            "vector": lambda: self.client["vector"].drop_collection(course_name),
+            "data": lambda: db_docstore.drop_collection(f"{course_name}/data"),
+            "metadata": lambda: db_docstore.drop_collection(f"{course_name}/metadata"),
+            "ref_doc_info": lambda: db_docstore.drop_collection(f"{course_name}/ref_doc_info"),
+            "bm25": lambda: self.bm25_index.drop_course(course_name),
+        })
+        forget_course_indexes(course_name)
+
+    def _forget_course(self,course_name: str):
+        self.client["vector"]["records"].delete_one({"course_name": course_name})
+        #the facebook sync scheduler would otherwise keep claiming the course and ingest its posts again
+        self.client["jobs"]["facebook_sync"].delete_one({"_id": course_name})
+        self.course_registry.discard(course_name)
+
+    def _run_deletions(self,deletions: Dict[str, Callable[[], Any]]) -> dict:
+        #the collections are independent, each deletion waits on its own round trip
+        futures = {name: _delete_executor.submit(deletion) for name, deletion in deletions.items()}
+        return {name: future.result() for name, future in futures.items()}
 
     def add_file_to_course(self,course_name, file_name):
         """
-        Records the file in the records collection
+        Records the file in the files registry. Recording a file twice has no effect.
         Parameters:
             course_name (str): Name of the course.
             file_name (str): Name of the file to be added.
         """
         try:
+            files = self._files_collection()
+            result = files.update_one(
+                {'course_name': course_name, 'file_name': file_name},
+                {'$setOnInsert': {'added_at': datetime.utcnow()}},
+                upsert=True
+            )
+            if result.upserted_id is None:
+                return
+            print(f"File '{file_name}' added to course '{course_name}'.")
 
-            db = self.client["vector"] 
-            course_collection = db["records"]
-            # Check if the course already exists
-            course = course_collection.find_one({'course_name': course_name})
-            if course:
-                # Add file name to the existing course
-                course_collection.update_one(
-                    {'_id': course['_id']},
-                    {'$push': {'file_names': file_name}}
-                )
-                print(f"File '{file_name}' added to course '{course_name}'.")
-            else:
-                # Course doesn't exist, create a new document
-                course_collection.insert_one({'course_name': course_name, 'file_names': [file_name]})
+            # the records collection keeps one document per course for the course registry
+            course = self.client["vector"]["records"].update_one(
+                {'course_name': course_name},
+                {'$setOnInsert': {'course_name': course_name}},
+                upsert=True
+            )
+            if course.upserted_id is not None:
                 print(f"Course '{course_name}' created with file '{file_name}'.")
+            ensure_course_indexes(course_name, self.client)
+            self.course_registry.add(course_name)
         except Exception as e:
             raise Exception("Error in adding file in records: " + str(e))
 
-    def get_all_files(self,course_name:str) -> List[str]:
+    def add_files_to_course(self,course_name: str, file_names: List[str]):
         """
-        Retrieves all files associated with a course.
+        Records several files of a course in the files registry with a single bulk write.
+
+        Parameters:
+            course_name (str): Name of the course.
+            file_names (List[str]): Names of the files to be added.
+        """
+        try:
+            if not file_names:
+                return
+            now = datetime.utcnow()
+            self._files_collection().bulk_write([
+                UpdateOne(
+                    {'course_name': course_name, 'file_name': file_name},
+                    {'$setOnInsert': {'added_at': now}},
+                    upsert=True
+                )
+                for file_name in file_names
+            ], ordered=False)
+            self.client["vector"]["records"].update_one(
+                {'course_name': course_name},
+                {'$setOnInsert': {'course_name': course_name}},
+                upsert=True
+            )
+            ensure_course_indexes(course_name, self.client)
+            self.course_registry.add(course_name)
+        except Exception as e:
+            raise Exception("Error in adding files in records: " + str(e))
+
+    def file_exists(self,course_name: str, file_name: str) -> bool:
+        """
+        Checks if a file is recorded for a course.
 
         Parameters:
             course_name (str): Name of the course.
+            file_name (str): Name of the file.
 
         Returns:
-            List[str]: List of file names associated with the course.
+            bool: True if the file exists, False otherwise.
         """
         try:
+            return self._files_collection().find_one(
+                {"course_name": course_name, "file_name": file_name}, {"_id": 1}
+            ) is not None
+        except Exception as e:
+            raise Exception("Error in checking file in records: " + str(e))
 
-            db = self.client["vector"] 
-            course_collection = db["records"]
-            # Query the collection based on the course name
-            result = course_collection.find_one({"course_name": course_name})
-            # Check if the course exists
-            if result:
-                # Extract and return the list of file names
-                file_names = result.get("file_names", [])
-                
-                if file_names:
-                    return file_names
-            return []
+    def existing_files(self,course_name: str, file_names: List[str]) -> Set[str]:
+        """
+        Checks which of the given files are recorded for a course, with a single indexed query.
 
-        except Exception as e:
-            raise Exception("Error in getting all files in records: ", str(e))
+        Parameters:
+            course_name (str): Name of the course.
+            file_names (List[str]): Names of the files to check.
 
+        Returns:
+            Set[str]: The names among file_names that are recorded.
+        """
+        try:
+            if not file_names:
+                return set()
+            cursor = self._files_collection().find(
+                {"course_name": course_name, "file_name": {"$in": list(file_names)}}, {"file_name": 1, "_id": 0}
+            )
+            return {doc["file_name"] for doc in cursor}
+        except Exception as e:
+            raise Exception("Error in checking files in records: " + str(e))
 
-    def get_all_facebook_posts(self,course_name:str) -> List[str]:
+    def get_files(self,course_name: str, skip: int = 0, limit: int = FILES_PAGE_SIZE, prefix: Optional[str] = None) -> List[str]:
         """
-        Retrieves all files associated with a course and only the facebook posts.
+        Retrieves a page of the files associated with a course, in name order.
 
         Parameters:
             course_name (str): Name of the course.
+            skip (int, optional): Number of files to skip. Defaults to 0.
+            limit (int, optional): Maximum number of files returned, 0 for all. Defaults to FILES_PAGE_SIZE.
+            prefix (str, optional): Only return the files whose name starts with prefix.
 
         Returns:
             List[str]: List of file names associated with the course.
         """
         try:
+            query = {"course_name": course_name}
+            if prefix:
+                # an anchored prefix match is answered by the (course_name, file_name) index
+                query["file_name"] = {"$regex": "^" + re.escape(prefix)}
+            cursor = self._files_collection().find(query, {"file_name": 1, "_id": 0}).sort("file_name", ASCENDING).skip(skip)
+            if limit:
+                cursor = cursor.limit(limit)
+            return [doc["file_name"] for doc in cursor]
+        except Exception as e:
+            raise Exception("Error in getting files in records: " + str(e))
 
-            db = self.client["vector"] 
-            course_collection = db["records"]
-            # Query the collection based on the course name
-            result = course_collection.find_one({"course_name": course_name})
-            # Check if the course exists
-            if result:
-                # Extract and return the list of file names
-                file_names = result.get("file_names", [])
-                # Filter the file names to include only those that start with "facebook_posts"
-                facebook_posts_files = [file_name for file_name in file_names if file_name.startswith("facebook_post_id_")]
-                if facebook_posts_files:
-                    return facebook_posts_files
-            return []
+    def get_all_files(self,course_name:str) -> List[str]:
+        """
+        Retrieves all files associated with a course.
 
-        except Exception as e:
-            raise Exception("Error in getting all files in records: ", str(e))
+        Parameters:
+            course_name (str): Name of the course.
+
+        Returns:
+            List[str]: List of file names associated with the course.
+        """
+        return self.get_files(course_name, limit=0)
+
+
+    def get_all_facebook_posts(self,course_name:str) -> List[str]:
+        """
+        Retrieves all files associated with a course and only the facebook posts.
+
+        Parameters:
+            course_name (str): Name of the course.
+
+        Returns:
+            List[str]: List of file names associated with the course.
+        """
+        return self.get_files(course_name, limit=0, prefix="facebook_post_id_")
 
     def get_all_course(self) -> List[str]:
         """
-        Retrieves all courses from the records.
+        Retrieves all courses from the course registry.
 
         Returns:
             List[str]: List of course names.
         """
         try:
-            # Check if the "records" collection exists
-            if "vector" not in self.client.list_database_names():
-                raise ValueError("Records collection does not exist")
-            
-            db = self.client["vector"] 
-            # Check if the "records" collection exists
-            if "records" not in db.list_collection_names():
-                raise ValueError("Records collection does not exist")
-            
-            course_collection = db["records"]
-            result = course_collection.find({})
-            course_names = [doc["course_name"] for doc in result]
-            return course_names
+            return self.course_registry.get_courses()
         except Exception as e:
             raise Exception("Error in getting all course: " + str(e))
 
-
-    def delete_course_file(self,course_name: str, file_name:str):
+    def course_exists(self,course_name: str) -> bool:
         """
-        Deletes a file from the records
+        Checks if a course exists, from the in-memory course registry.
 
         Parameters:
             course_name (str): Name of the course.
-            file_name (str): Name of the file to be deleted.
-        """
-        try: 
-            # Check if the "records" collection exists
-            if "vector" not in self.client.list_database_names():
-                raise ValueError("Records collection does not exist")
-            
-            db = self.client["vector"] 
-
-            # Check if the "records" collection exists
-            if "records" not in db.list_collection_names():
-                raise ValueError("Records collection does not exist")
-            
-            course_collection = db["records"]
-            # Check if the course exists
-            course = course_collection.find_one({'course_name': course_name})
-            if course:
-                course_collection.update_one(
-                            {'_id': course['_id']},
-                            {'$pull': {'file_names': file_name}}
-                        )
-                # Retrieve the updated course document
-                updated_course = course_collection.find_one({'_id': course['_id']})
-                # If the file list becomes empty, delete the entire document
-                if 'file_names' in updated_course and not updated_course['file_names']:
-                    course_collection.delete_one({'_id': course['_id']})
-                    print(f"Document for course '{course_name}' deleted because file list became empty.")
-            else:
-                raise ValueError("Course not found")
+
+        Returns:
+            bool: True if the course exists, False otherwise.
+        """
+        try:
+            return self.course_registry.contains(course_name)
         except Exception as e:
-            raise Exception("Error in deleting course file: " +str(e))
-            
+            raise Exception("Error in checking course: " + str(e))
+
+    def _files_collection(self):
+        files = self.client["vector"]["files"]
+        if not _files_indexed:
+            ensure_file_indexes(self.client)
+        return files
+
 
     def valid_index_name(self,name:str) -> bool:
         """
@@ -226,3 +383,42 @@ class KnowledgeBaseService():
 
         # Match the pattern at the beginning and end of the string for completeness
         return bool(re.match(pattern, name))
+
+
+def migrate_file_records(client=None) -> dict:
+    """
+    Moves the "file_names" arrays of the "vector.records" course documents into the files registry,
+    one document per course and file. Running it again only migrates what is left.
+
+    Parameters:
+        client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+
+    Returns:
+        dict: The number of courses and files migrated.
+    """
+    try:
+        client = client or get_mongo_client()
+        ensure_file_indexes(client)
+        records = client["vector"]["records"]
+        files = client["vector"]["files"]
+        migrated_courses = 0
+        migrated_files = 0
+        for course in records.find({"file_names": {"$exists": True}}):
+            file_names = course.get("file_names", [])
+            if file_names:
+                now = datetime.utcnow()
+                files.bulk_write([
+                    UpdateOne(
+                        {"course_name": course["course_name"], "file_name": file_name},
+                        {"$setOnInsert": {"added_at": now}},
+                        upsert=True
+                    )
+                    for file_name in file_names
+                ], ordered=False)
+            records.update_one({"_id": course["_id"]}, {"$unset": {"file_names": ""}})
+            migrated_courses += 1
+            migrated_files += len(file_names)
+            print(f"Migrated {len(file_names)} files of {course['course_name']}")
+        return {"courses": migrated_courses, "files": migrated_files}
+    except Exception as e:
+        raise Exception("Error in migrating file records: " + str(e))
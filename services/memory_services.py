@@ -1,80 +1,522 @@
-from pymongo import MongoClient
+from services.database_services import get_mongo_client, get_async_mongo_client
+from services.index_services import ensure_subject_indexes
+from services.statistics_services import rollup_updates
 import uuid
+from datetime import datetime
+from threading import Lock, Thread
+from typing import List, Optional
+import asyncio
+import queue
+import time
 from llama_index.core.llms import ChatMessage
-from data_definitions.schemas import Message, Conversation
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, ReturnDocument, UpdateOne
+from data_definitions.schemas import Message
 import os
 from dotenv import load_dotenv
 load_dotenv()
+
+# messages are stored in fixed size buckets so a conversation never grows into one unbounded document
+MESSAGE_BUCKET_SIZE = int(os.getenv("CHAT_BUCKET_SIZE", 50))
+# number of previous messages given to the chat engine
+CHAT_HISTORY_LENGTH = 5
+
+def _new_message(user_query: str, ai_response: str, timestamp: datetime) -> dict:
+    return Message(message_id=str(uuid.uuid4()), user_query=user_query, ai_response=ai_response, timestamp=timestamp).model_dump()
+
+def _push_messages(messages: List[dict]) -> dict:
+    # update adding messages to their bucket, creating the bucket on its first message
+    return {
+        "$push": {"messages": {"$each": messages}},
+        "$inc": {"count": len(messages)},
+        "$max": {"end": max(message["timestamp"] for message in messages)},
+        "$min": {"start": min(message["timestamp"] for message in messages)},
+    }
+
+def _bucket_of(message_count: int) -> int:
+    return (message_count - 1) // MESSAGE_BUCKET_SIZE
+
+def _history_buckets() -> int:
+    # the newest bucket may hold fewer than CHAT_HISTORY_LENGTH messages
+    return -(-CHAT_HISTORY_LENGTH // MESSAGE_BUCKET_SIZE) + 1
+
+def _to_chat_history(messages: List[dict]) -> List[ChatMessage]:
+    chat_history = []
+    for message in messages[-CHAT_HISTORY_LENGTH:]:
+        chat_history.append(ChatMessage(content=message['user_query'], role="user"))
+        chat_history.append(ChatMessage(content=message['ai_response'], role="assistant"))
+    return chat_history
+
+
 class ChatHistory():
     """
     Class for managing chat history in a MongoDB database.
+
+    Each user has a conversation document in "chat_history.<subject>" holding its
+    message count, and the messages themselves are stored in buckets of
+    MESSAGE_BUCKET_SIZE messages in "chat_buckets.<subject>", indexed on (user_id, bucket).
+    Messages are written behind the request by a ChatMessageWriter.
     """
-    def __init__(self, subject:str, user_id:str):
+    def __init__(self, subject:str, user_id:str, client=None, writer=None):
         """
         Initializes the ChatHistory object.
 
         Parameters:
             subject (str): Subject of the chat history.
             user_id (str, optional): ID of the user.
+            client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+            writer (ChatMessageWriter, optional): Writer persisting the messages. Defaults to the shared writer.
         """
-        MONGO_URI = os.getenv("MONGODB_CONNECTION_STRING")
-        client = MongoClient(MONGO_URI)
+        client = client or get_mongo_client()
         db = client["chat_history"]
         self.conversations = db[subject]
+        self.buckets = client["chat_buckets"][subject]
         self.user_id = user_id
         self.subject = subject
-        
+        self.writer = writer or chat_message_writer
+
     def add_message(self,user_query:str, ai_response:str):
         """
-        Adds a message to the chat history.
+        Queues a message to be added to the chat history.
 
         Parameters:
             user_query (str): User's query message.
             ai_response (str): AI's response message.
         """
         try:
-            # Check if conversation exists for the user
-            conversation = self.conversations.find_one({"user_id": self.user_id})
-            # Create new conversation if it doesn't exist
-            if not conversation:
-                new_conversation_data = Conversation(user_id=self.user_id, subject=self.subject)
-                self.conversations.insert_one(new_conversation_data.model_dump())
-
-            # Create new message object
-            new_message_data = Message(message_id=str(uuid.uuid4()),user_query=user_query, ai_response=ai_response)
-            self.conversations.update_one({"user_id": self.user_id}, {"$push": {"messages": new_message_data.model_dump()}})
+            self.writer.add(self.subject, self.user_id, user_query, ai_response)
         except Exception as e:
             print(f"Error adding message: {e}")
 
 
     def get_chat_history(self):
         """
-        Retrieves the chat history.
+        Retrieves the last 5 messages of the chat history.
+
+        Returns:
+            list: List of ChatMessage objects representing the chat history.
+        """
+        try:
+            # Only the newest buckets are read, and only their last messages transferred
+            buckets = list(self.buckets.find(
+                {"user_id": self.user_id},
+                {"messages": {"$slice": -CHAT_HISTORY_LENGTH}, "bucket": 1}
+            ).sort("bucket", DESCENDING).limit(_history_buckets()))
+
+            if buckets:
+                messages = [message for bucket in reversed(buckets) for message in bucket["messages"]]
+                return _to_chat_history(messages)
+            else:
+                print(f"No conversation found for user: {self.user_id}")
+        except Exception as e:
+            print(f"Error retrieving messages: {e}")
+
+
+class AsyncChatHistory():
+    """
+    Async counterpart of ChatHistory backed by motor, for use from async routes.
+    """
+    def __init__(self, subject:str, user_id:str, client=None, writer=None):
+        """
+        Initializes the AsyncChatHistory object.
+
+        Parameters:
+            subject (str): Subject of the chat history.
+            user_id (str, optional): ID of the user.
+            client (AsyncIOMotorClient, optional): Motor client. Defaults to the shared client.
+            writer (ChatMessageWriter, optional): Writer persisting the messages. Defaults to the shared writer.
+        """
+        client = client or get_async_mongo_client()
+        db = client["chat_history"]
+        self.conversations = db[subject]
+        self.buckets = client["chat_buckets"][subject]
+        self.user_id = user_id
+        self.subject = subject
+        self.writer = writer or chat_message_writer
+
+    async def add_message(self,user_query:str, ai_response:str):
+        """
+        Queues a message to be added to the chat history.
+
+        Parameters:
+            user_query (str): User's query message.
+            ai_response (str): AI's response message.
+        """
+        try:
+            await self.writer.aadd(self.subject, self.user_id, user_query, ai_response)
+        except Exception as e:
+            print(f"Error adding message: {e}")
+
+    async def get_chat_history(self):
+        """
+        Retrieves the last 5 messages of the chat history.
 
         Returns:
             list: List of ChatMessage objects representing the chat history.
         """
         try:
-            # Find the conversation document for the user
-            conversation = self.conversations.find_one({"user_id": self.user_id})
-
-            if conversation:
-                # Get all messages from the conversation
-                messages = conversation["messages"]
-   
-                # Limit the messages to the first 5 items
-                messages = messages[::-1][:5]
-                messages.reverse()
-                chat_history = []
-                for message in messages:
-                    print(message['user_query'])
-                    chat_history.append(ChatMessage(content=message['user_query'], role="user"))
-                    chat_history.append(ChatMessage(content=message['ai_response'], role="assistant"))
-                return chat_history
+            # Only the newest buckets are read, and only their last messages transferred
+            cursor = self.buckets.find(
+                {"user_id": self.user_id},
+                {"messages": {"$slice": -CHAT_HISTORY_LENGTH}, "bucket": 1}
+            ).sort("bucket", DESCENDING).limit(_history_buckets())
+            buckets = await cursor.to_list(length=None)
+
+            if buckets:
+                messages = [message for bucket in reversed(buckets) for message in bucket["messages"]]
+                return _to_chat_history(messages)
             else:
                 print(f"No conversation found for user: {self.user_id}")
         except Exception as e:
             print(f"Error retrieving messages: {e}")
 
 
+class ChatMessageWriter():
+    """
+    Write-behind writer for chat messages.
+
+    Messages are queued in memory and a background thread writes them in batches, grouped by
+    subject and user: one counter update per conversation and one bulk write of bucket upserts
+    per subject. A batch is written when it reaches batch_size messages or flush_interval seconds
+    after its first message. The queue is bounded; when it is full, callers wait for room and
+    write the message themselves if none frees up within enqueue_timeout seconds. A batch that
+    fails is written again with exponential backoff, without reserving its positions twice.
+    """
+    def __init__(self, client=None, max_queue_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, enqueue_timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None, retry_backoff: Optional[float] = None):
+        """
+        Initializes the ChatMessageWriter object.
+
+        Parameters:
+            client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+            max_queue_size (int, optional): Maximum number of queued messages.
+                Defaults to the CHAT_WRITE_QUEUE_SIZE environment variable or 10000.
+            batch_size (int, optional): Maximum number of messages per batch.
+                Defaults to the CHAT_WRITE_BATCH_SIZE environment variable or 500.
+            flush_interval (float, optional): Maximum seconds a message waits in the queue.
+                Defaults to the CHAT_WRITE_FLUSH_INTERVAL environment variable or 0.5.
+            enqueue_timeout (float, optional): Seconds a caller waits for room in a full queue.
+                Defaults to the CHAT_WRITE_ENQUEUE_TIMEOUT environment variable or 5.
+            max_retries (int, optional): Number of times a failed batch is written again.
+                Defaults to the CHAT_WRITE_MAX_RETRIES environment variable or 5.
+            retry_backoff (float, optional): Seconds before the first retry, doubled on each retry.
+                Defaults to the CHAT_WRITE_RETRY_BACKOFF environment variable or 0.5.
+        """
+        if max_queue_size is None:
+            max_queue_size = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", 10000))
+        if batch_size is None:
+            batch_size = int(os.getenv("CHAT_WRITE_BATCH_SIZE", 500))
+        if flush_interval is None:
+            flush_interval = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", 0.5))
+        if enqueue_timeout is None:
+            enqueue_timeout = float(os.getenv("CHAT_WRITE_ENQUEUE_TIMEOUT", 5))
+        if max_retries is None:
+            max_retries = int(os.getenv("CHAT_WRITE_MAX_RETRIES", 5))
+        if retry_backoff is None:
+            retry_backoff = float(os.getenv("CHAT_WRITE_RETRY_BACKOFF", 0.5))
+        self._client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._closed = False
+        self._lock = Lock()
+
+    @property
+    def client(self):
+        return self._client or get_mongo_client()
+
+    def start(self):
+        """
+        Starts the background writer thread. Called at application startup.
+        """
+        with self._lock:
+            self._closed = False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name="chat-message-writer", daemon=True)
+                self._thread.start()
+
+    def shutdown(self):
+        """
+        Writes every queued message and stops the writer thread. Called at application shutdown.
+        Messages added afterwards are written directly by the caller.
+        """
+        with self._lock:
+            self._closed = True
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        self._write_leftovers()
+
+    def flush(self):
+        """
+        Blocks until every message queued so far is written.
+        """
+        self._ensure_started()
+        self._queue.join()
+
+    def add(self, subject: str, user_id: str, user_query: str, ai_response: str):
+        """
+        Queues a message, waiting for room if the queue is full.
+
+        Parameters:
+            subject (str): Subject of the chat history.
+            user_id (str): ID of the user.
+            user_query (str): User's query message.
+            ai_response (str): AI's response message.
+        """
+        item = (subject, user_id, _new_message(user_query, ai_response, datetime.utcnow()))
+        if not self._ensure_started():
+            self._write_with_retry([item])
+            return
+        self._put_or_write(item)
+
+    async def aadd(self, subject: str, user_id: str, user_query: str, ai_response: str):
+        """
+        Async version of add. Only waits in a worker thread when the queue is full.
+
+        Parameters:
+            subject (str): Subject of the chat history.
+            user_id (str): ID of the user.
+            user_query (str): User's query message.
+            ai_response (str): AI's response message.
+        """
+        item = (subject, user_id, _new_message(user_query, ai_response, datetime.utcnow()))
+        if not self._ensure_started():
+            await asyncio.to_thread(self._write_with_retry, [item])
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            await asyncio.to_thread(self._put_or_write, item)
+            return
+        if self._closed:
+            await asyncio.to_thread(self._write_leftovers)
+
+    def _ensure_started(self) -> bool:
+        # the writer starts lazily outside the application, but is never respawned after shutdown
+        if self._closed:
+            return False
+        if self._thread is None:
+            self.start()
+        return True
+
+    def _put_or_write(self, item: tuple):
+        try:
+            self._queue.put(item, timeout=self.enqueue_timeout)
+        except queue.Full:
+            # the writer is not keeping up, the message is written on the caller's time instead of lost
+            print("Chat message queue is full, writing message directly")
+            self._write_with_retry([item])
+            return
+        if self._closed:
+            # queued while the writer was shutting down
+            self._write_leftovers()
+
+    def _write_leftovers(self):
+        items = self._drain()
+        try:
+            if items:
+                self._write_with_retry(items)
+        finally:
+            for _ in items:
+                self._queue.task_done()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    # write what is left before stopping
+                    stopping = True
+                    self._queue.task_done()
+                    batch.extend(self._drain())
+                    break
+                batch.append(item)
+            try:
+                self._write_with_retry(batch)
+            except Exception as e:
+                print(f"Error writing {len(batch)} chat messages, giving up after {self.max_retries} retries: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _drain(self) -> List[tuple]:
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is None:
+                self._queue.task_done()
+            else:
+                items.append(item)
+
+    def _write_with_retry(self, batch: List[tuple]):
+        # the state carries what the failed attempts already wrote across the retries
+        state = {"reserved": {}, "written": set(), "counted": set()}
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._write(batch, state)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * 2 ** attempt
+                print(f"Error writing {len(batch)} chat messages, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def _write(self, batch: List[tuple], state: Optional[dict] = None):
+        # subject -> user id -> messages, in the order they were queued
+        groups = {}
+        for subject, user_id, message in batch:
+            groups.setdefault(subject, {}).setdefault(user_id, []).append(message)
+
+        # positions reserved and subjects written by an earlier attempt at the same batch,
+        # so a retry neither reserves positions twice nor stores a message twice
+        if state is None:
+            state = {"reserved": {}, "written": set(), "counted": set()}
+        retry = bool(state["reserved"])
+        client = self.client
+        for subject, users in groups.items():
+            if subject in state["counted"]:
+                continue
+            conversations = client["chat_history"][subject]
+            buckets = client["chat_buckets"][subject]
+            ensure_subject_indexes(subject, client)
+            if subject not in state["written"]:
+                operations = []
+                for user_id, messages in users.items():
+                    if (subject, user_id) not in state["reserved"]:
+                        # reserve positions for all the messages of the user at once
+                        conversation = conversations.find_one_and_update(
+                            {"user_id": user_id},
+                            {
+                                "$inc": {"message_count": len(messages)},
+                                "$setOnInsert": {"subject": subject, "created_at": messages[0]["timestamp"]},
+                            },
+                            projection={"message_count": 1},
+                            upsert=True,
+                            return_document=ReturnDocument.AFTER
+                        )
+                        state["reserved"][(subject, user_id)] = conversation["message_count"] - len(messages) + 1
+                    first_position = state["reserved"][(subject, user_id)]
+                    by_bucket = {}
+                    for position, message in enumerate(messages, start=first_position):
+                        by_bucket.setdefault(_bucket_of(position), []).append(message)
+                    if retry:
+                        # the failed attempt may have stored part of the messages
+                        stored = {
+                            message["message_id"]
+                            for bucket in buckets.find({"user_id": user_id, "bucket": {"$in": list(by_bucket)}}, {"messages.message_id": 1})
+                            for message in bucket.get("messages", [])
+                        }
+                        by_bucket = {bucket: [message for message in bucket_messages if message["message_id"] not in stored]
+                                     for bucket, bucket_messages in by_bucket.items()}
+                    for bucket, bucket_messages in by_bucket.items():
+                        if bucket_messages:
+                            operations.append(UpdateOne(
+                                {"user_id": user_id, "bucket": bucket},
+                                _push_messages(bucket_messages),
+                                upsert=True
+                            ))
+                if operations:
+                    buckets.bulk_write(operations, ordered=False)
+                state["written"].add(subject)
+
+            # keep the day and hour statistics rollups in step with the stored messages
+            timestamps = [message["timestamp"] for messages in users.values() for message in messages]
+            conversation_starts = [messages[0]["timestamp"] for user_id, messages in users.items()
+                                   if state["reserved"][(subject, user_id)] == 1]
+            client["chat_stats"][subject].bulk_write(rollup_updates(timestamps, conversation_starts), ordered=False)
+            state["counted"].add(subject)
+
+
+chat_message_writer = ChatMessageWriter()
+
+def migrate_conversations_to_buckets(subject: Optional[str] = None, client=None) -> dict:
+    """
+    Moves the messages stored in the "messages" array of conversation documents into message buckets.
+
+    Messages already in buckets for the same user are kept after the migrated ones, and a message
+    is never written twice, so the migration can be run again after an interruption.
+
+    Parameters:
+        subject (str, optional): Subject to migrate. Defaults to every subject.
+        client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+
+    Returns:
+        dict: The number of subjects, conversations and messages migrated.
+    """
+    try:
+        client = client or get_mongo_client()
+        db = client["chat_history"]
+        subjects = [subject] if subject else db.list_collection_names()
+        migrated_conversations = 0
+        migrated_messages = 0
+        for name in subjects:
+            conversations = db[name]
+            buckets = client["chat_buckets"][name]
+            ensure_subject_indexes(name, client)
+
+            for conversation in conversations.find({"messages": {"$exists": True}}, {"user_id": 1, "messages": 1}):
+                user_id = conversation["user_id"]
+                messages = list(conversation["messages"])
+                seen = {message["message_id"] for message in messages}
+                for bucket in buckets.find({"user_id": user_id}).sort("bucket", ASCENDING):
+                    for message in bucket["messages"]:
+                        if message["message_id"] not in seen:
+                            seen.add(message["message_id"])
+                            messages.append(message)
+
+                operations = []
+                for number, start in enumerate(range(0, len(messages), MESSAGE_BUCKET_SIZE)):
+                    bucket_messages = messages[start:start + MESSAGE_BUCKET_SIZE]
+                    operations.append(ReplaceOne(
+                        {"user_id": user_id, "bucket": number},
+                        {
+                            "user_id": user_id,
+                            "bucket": number,
+                            "count": len(bucket_messages),
+                            "start": min(message["timestamp"] for message in bucket_messages),
+                            "end": max(message["timestamp"] for message in bucket_messages),
+                            "messages": bucket_messages,
+                        },
+                        upsert=True
+                    ))
+                if operations:
+                    buckets.bulk_write(operations, ordered=True)
+                buckets.delete_many({"user_id": user_id, "bucket": {"$gte": len(operations)}})
 
+                conversations.update_one(
+                    {"_id": conversation["_id"]},
+                    {"$set": {"message_count": len(messages)}, "$unset": {"messages": ""}}
+                )
+                migrated_conversations += 1
+                migrated_messages += len(conversation["messages"])
+            print(f"Migrated chat history of {name}")
+        return {
+            "subjects": len(subjects),
+            "conversations": migrated_conversations,
+            "messages": migrated_messages,
+        }
+    except Exception as e:
+        raise Exception("Error in migrating conversations: " + str(e))
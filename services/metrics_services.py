@@ -0,0 +1,113 @@
+from contextlib import contextmanager
+from time import perf_counter
+from typing import List
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.callbacks import TokenCountingHandler
+from llama_index.core.retrievers import QueryFusionRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import tiktoken
+
+# stages of the chat pipeline, in the order they run
+STAGES = [
+    "course_check",
+    "vector_index_setup",
+    "bm25_build",
+    "chat_history_load",
+    "condense",
+    "retriever_vector",
+    "retriever_bm25",
+    "fusion",
+    "answer_synthesis",
+    "add_message",
+]
+
+STAGE_LATENCY = Histogram(
+    "chat_stage_latency_seconds",
+    "Latency of each stage of the course chat pipeline.",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+LLM_TOKENS = Counter(
+    "chat_llm_tokens_total",
+    "LLM tokens used by the course chat pipeline.",
+    ["course", "type"],
+)
+
+_tokenizer = None
+
+@contextmanager
+def observe_stage(stage: str):
+    """
+    Records the duration of the wrapped block in the stage latency histogram.
+
+    Parameters:
+        stage (str): Name of the stage, one of STAGES.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(perf_counter() - start)
+
+def create_token_counter() -> TokenCountingHandler:
+    """
+    Creates a token counting callback for a single chat request.
+
+    Returns:
+        TokenCountingHandler: The token counter.
+    """
+    # loading the encoding is the expensive part, do it once per process
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = tiktoken.encoding_for_model("gpt-3.5-turbo").encode
+    return TokenCountingHandler(tokenizer=_tokenizer)
+
+def record_token_usage(course_name: str, token_counter: TokenCountingHandler):
+    """
+    Adds the LLM tokens counted for a chat request to the per-course counters.
+
+    Parameters:
+        course_name (str): Name of the course.
+        token_counter (TokenCountingHandler): The request's token counter.
+    """
+    LLM_TOKENS.labels(course_name, "prompt").inc(token_counter.prompt_llm_token_count)
+    LLM_TOKENS.labels(course_name, "completion").inc(token_counter.completion_llm_token_count)
+    token_counter.reset_counts()
+
+def metrics_payload() -> tuple:
+    """
+    Renders every metric in the Prometheus text format.
+
+    Returns:
+        tuple: The payload and its content type.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class TimedRetriever(BaseRetriever):
+    """
+    Retriever wrapper recording the latency of the wrapped retriever under a stage name.
+    """
+    def __init__(self, retriever: BaseRetriever, stage: str):
+        self._retriever = retriever
+        self._stage = stage
+        super().__init__()
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with observe_stage(self._stage):
+            return self._retriever.retrieve(query_bundle)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        with observe_stage(self._stage):
+            return await self._retriever.aretrieve(query_bundle)
+
+
+class TimedQueryFusionRetriever(QueryFusionRetriever):
+    """
+    QueryFusionRetriever recording the latency of the reciprocal rerank fusion step.
+    """
+    def _reciprocal_rerank_fusion(self, results):
+        with observe_stage("fusion"):
+            return super()._reciprocal_rerank_fusion(results)
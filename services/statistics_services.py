@@ -1,22 +1,144 @@
-from datetime import datetime, timezone
-from pymongo import MongoClient
-import os
+from datetime import datetime, timedelta, timezone
+from pymongo import ReplaceOne, UpdateOne
+from services.database_services import get_mongo_client
+from typing import Iterable, List, Optional, Tuple
+
+# rollup periods, from the longest to the shortest
+ROLLUP_PERIODS = [
+    ("day", timedelta(days=1)),
+    ("hour", timedelta(hours=1)),
+]
+
+def _to_utc(value: datetime) -> datetime:
+    # message timestamps are stored as naive UTC datetimes
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def period_start(granularity: str, value: datetime) -> datetime:
+    """
+    Truncates a timestamp to the start of its day or hour.
+
+    Parameters:
+        granularity (str): "day" or "hour".
+        value (datetime): The timestamp.
+
+    Returns:
+        datetime: The start of the period, in naive UTC.
+    """
+    value = _to_utc(value).replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        value = value.replace(hour=0)
+    return value
+
+def rollup_id(granularity: str, start: datetime) -> str:
+    return f"{granularity}:{start.isoformat()}"
+
+def rollup_updates(message_timestamps: Iterable[datetime], conversation_timestamps: Iterable[datetime] = ()) -> List[UpdateOne]:
+    """
+    Builds the $inc updates adding messages and new conversations to the day and hour rollups.
+
+    Parameters:
+        message_timestamps (Iterable[datetime]): Timestamps of the messages stored.
+        conversation_timestamps (Iterable[datetime], optional): Creation times of the conversations started.
+
+    Returns:
+        List[UpdateOne]: One upsert per rollup document touched.
+    """
+    increments = {}
+    for field, timestamps in (("messages", message_timestamps), ("conversations", conversation_timestamps)):
+        for timestamp in timestamps:
+            for granularity, _ in ROLLUP_PERIODS:
+                start = period_start(granularity, timestamp)
+                counts = increments.setdefault((granularity, start), {})
+                counts[field] = counts.get(field, 0) + 1
+    return [
+        UpdateOne(
+            {"_id": rollup_id(granularity, start)},
+            {"$inc": counts, "$setOnInsert": {"granularity": granularity, "start": start}},
+            upsert=True
+        )
+        for (granularity, start), counts in increments.items()
+    ]
+
+def rebuild_stats_rollups(subject: Optional[str] = None, client=None) -> dict:
+    """
+    Rebuilds the day and hour rollups of a subject from its stored messages and conversations.
+    Every rollup is replaced with the recounted value, so the rebuild can be run again,
+    but messages written while it runs may be missed; run it like the chat history migration.
+
+    Parameters:
+        subject (str, optional): Subject to rebuild. Defaults to every subject with chat history.
+        client (MongoClient, optional): MongoDB client. Defaults to the shared client.
+
+    Returns:
+        dict: The number of subjects, messages and rollup documents written.
+    """
+    try:
+        client = client or get_mongo_client()
+        subjects = [subject] if subject else client["chat_history"].list_collection_names()
+        total_messages = 0
+        total_rollups = 0
+        for name in subjects:
+            counts = {}
+            sources = (
+                ("messages", client["chat_buckets"][name], [
+                    {"$unwind": "$messages"},
+                    {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%dT%H", "date": "$messages.timestamp"}}, "count": {"$sum": 1}}},
+                ]),
+                ("conversations", client["chat_history"][name], [
+                    {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%dT%H", "date": "$created_at"}}, "count": {"$sum": 1}}},
+                ]),
+            )
+            for field, collection, pipeline in sources:
+                for hour in collection.aggregate(pipeline):
+                    if hour["_id"] is None:
+                        continue
+                    start = datetime.strptime(hour["_id"], "%Y-%m-%dT%H")
+                    for granularity, _ in ROLLUP_PERIODS:
+                        rollup = counts.setdefault((granularity, period_start(granularity, start)), {"messages": 0, "conversations": 0})
+                        rollup[field] += hour["count"]
+
+            stats = client["chat_stats"][name]
+            stats.delete_many({})
+            if counts:
+                stats.bulk_write([
+                    ReplaceOne(
+                        {"_id": rollup_id(granularity, start)},
+                        {"granularity": granularity, "start": start, **rollup},
+                        upsert=True
+                    )
+                    for (granularity, start), rollup in counts.items()
+                ], ordered=False)
+            total_messages += sum(rollup["messages"] for (granularity, _), rollup in counts.items() if granularity == "day")
+            total_rollups += len(counts)
+            print(f"Rebuilt statistics rollups of {name}")
+        return {"subjects": len(subjects), "messages": total_messages, "rollups": total_rollups}
+    except Exception as e:
+        raise Exception("Error in rebuilding statistics rollups: " + str(e))
+
 
 class StatisticsServices:
     """
     Class providing methods to retrieve statistical information from a MongoDB database containing chat history data.
+
+    Date range counts are read from the day and hour rollups in "chat_stats.<subject>",
+    which the chat message writer increments as it stores messages. Only the parts of
+    the range shorter than an hour, at its two ends, are counted from the messages.
     """
-    def __init__(self,subject:str):
+    def __init__(self,subject:str, client=None):
         """
         Initializes the StatisticsServices object.
 
         Parameters:
             subject (str): Name of the subject for which the chat history is being analyzed.
+            client (MongoClient, optional): MongoDB client. Defaults to the shared client.
         """
-        MONGO_URI = os.getenv("MONGODB_CONNECTION_STRING")
-        client = MongoClient(MONGO_URI)
+        client = client or get_mongo_client()
         db = client["chat_history"]
         self.conversations = db[subject]
+        self.buckets = client["chat_buckets"][subject]
+        self.rollups = client["chat_stats"][subject]
 
     def count_messages_in_date_range(self,start_date: datetime, end_date: datetime) -> int:
         """
@@ -30,19 +152,11 @@ class StatisticsServices:
             int: Total count of messages within the specified date range.
         """
         try:
-            pipeline = [
-                {"$unwind": "$messages"},
-                {"$match": {"messages.timestamp": {"$gte": start_date, "$lte": end_date}}},
-                {"$count": "message_count"}
-            ]
-            result = list(self.conversations.aggregate(pipeline))
-            if result:
-                return result[0]['message_count']
-            return 0
+            return self._count_in_range("messages", start_date, end_date, self._count_messages)
         except Exception as e:
             print(f"Error counting messages: {e}")
             return 0
-        
+
     def count_total_conversations(self) ->int:
         """
         Counts the total number of conversations in the chat history for the given subject.
@@ -51,19 +165,73 @@ class StatisticsServices:
             int: Total count of conversations in the chat history for the given subject.
         """
         try:
-            result=self.conversations.count_documents({})
+            # one header document per conversation, the collection metadata holds the count
+            result=self.conversations.estimated_document_count()
             return result
         except Exception as e:
             print(f"Error counting conversations: {e}")
 
     def count_conversations_in_date_range(self,start_date: datetime, end_date: datetime) -> int:
-        # Query to find conversations within the date range
-        query = {
-            "created_at": {
-                "$gte": start_date,
-                "$lte": end_date
-            }
-        }
-        count = self.conversations.count_documents(query)
-        return count
+        """
+        Counts the number of conversations started within the specified date range.
+
+        Parameters:
+            start_date (datetime): Start date of the date range.
+            end_date (datetime): End date of the date range.
+
+        Returns:
+            int: Total count of conversations started within the specified date range.
+        """
+        return self._count_in_range("conversations", start_date, end_date, self._count_conversations)
+
+    def _count_messages(self, start_date: datetime, end_date: datetime, include_end: bool) -> int:
+        end_filter = {"$lte" if include_end else "$lt": end_date}
+        pipeline = [
+            # only the buckets overlapping the date range are unwound
+            {"$match": {"start": end_filter, "end": {"$gte": start_date}}},
+            {"$unwind": "$messages"},
+            {"$match": {"messages.timestamp": {"$gte": start_date, **end_filter}}},
+            {"$count": "message_count"}
+        ]
+        result = list(self.buckets.aggregate(pipeline))
+        return result[0]['message_count'] if result else 0
+
+    def _count_conversations(self, start_date: datetime, end_date: datetime, include_end: bool) -> int:
+        end_filter = {"$lte" if include_end else "$lt": end_date}
+        return self.conversations.count_documents({"created_at": {"$gte": start_date, **end_filter}})
+
+    def _count_in_range(self, field: str, start_date: datetime, end_date: datetime, count_exact) -> int:
+        start_date, end_date = _to_utc(start_date), _to_utc(end_date)
+        if end_date < start_date:
+            return 0
+
+        # whole hours inside the range are read from the rollups, the edges are counted exactly
+        first_hour = period_start("hour", start_date)
+        if first_hour < start_date:
+            first_hour += timedelta(hours=1)
+        end_hour = period_start("hour", end_date)
+        if end_hour <= first_hour:
+            return count_exact(start_date, end_date, True)
+
+        total = 0
+        if start_date < first_hour:
+            total += count_exact(start_date, first_hour, False)
+        total += count_exact(end_hour, end_date, True)
+        for granularity, start, end in self._rollup_spans(first_hour, end_hour):
+            result = list(self.rollups.aggregate([
+                {"$match": {"granularity": granularity, "start": {"$gte": start, "$lt": end}}},
+                {"$group": {"_id": None, "count": {"$sum": f"${field}"}}},
+            ]))
+            total += result[0]["count"] if result else 0
+        return total
 
+    @staticmethod
+    def _rollup_spans(start: datetime, end: datetime) -> List[Tuple[str, datetime, datetime]]:
+        # whole days between two hour boundaries, and the hours before and after them
+        first_day = period_start("day", start)
+        if first_day < start:
+            first_day += timedelta(days=1)
+        end_day = period_start("day", end)
+        if end_day <= first_day:
+            return [("hour", start, end)]
+        return [("hour", start, first_day), ("day", first_day, end_day), ("hour", end_day, end)]
@@ -1,28 +1,30 @@
-from pymongo import MongoClient
+from services.database_services import get_mongo_client
 from datetime import datetime
 from data_definitions.schemas import UserCreate, UserUpdate
 from authentication.utils import hash
+from authentication.cache import user_cache
+from typing import Optional
 from dotenv import load_dotenv
 load_dotenv()
 import os
 class UserService():
-  def __init__(self):
-        MONGO_URI = os.getenv("MONGODB_CONNECTION_STRING")
-        client = MongoClient(MONGO_URI)
+  def __init__(self, client=None):
+        client = client or get_mongo_client()
         db = client["chatbot"]
         self.collection = db["users"]
 
-  def create_user(self,user: UserCreate):
+  def create_user(self,user: UserCreate, hashed_password: Optional[str] = None):
     """
     Creates a new user in the database.
 
     Args:
         user: User data to create.
+        hashed_password: Hash of the user's password, when the caller already hashed it.
     """
     existing_user = self.collection.find_one({"school_id": user.school_id})
     if existing_user:
       return {"error": "School ID already exists"}
-    hash_password = hash(user.password)
+    hash_password = hashed_password or hash(user.password)
     user.password = hash_password
     user_data = user.dict()
     user_data["created_at"] = datetime.utcnow()  # Set the current timestamp
@@ -50,7 +52,7 @@ class UserService():
     Args:
         school_id: User's school identifier to search for.
     """
-    user = self.collection.find_one({"email": email})
+    user = user_cache.get_or_load(email, lambda email: self.collection.find_one({"email": email}))
     if user:
       return user
     else:
@@ -67,6 +69,8 @@ class UserService():
     result = self.collection.update_one(
         {"school_id": school_id}, {"$set": new_data}
     )
+    # the update may change the email, so the cached user is found by school id
+    user_cache.invalidate(school_id=school_id)
     updated_user = self.collection.find_one({"school_id": school_id})
     return updated_user
 
@@ -80,4 +84,5 @@ class UserService():
         school_id: User's school identifier to delete.
     """
     result = self.collection.delete_one({"school_id": school_id})
+    user_cache.invalidate(school_id=school_id)
     return result.deleted_count 
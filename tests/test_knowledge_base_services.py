@@ -0,0 +1,55 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from services.course_registry_services import CourseRegistry
+from services.facebook_sync_services import FacebookSyncService
+from services.knowledge_base_services import KnowledgeBaseService
+
+
+class _FacebookService():
+    def __init__(self, client):
+        self.client = client
+
+
+@pytest.fixture
+def services():
+    client = mongomock.MongoClient()
+    registry = CourseRegistry(client=client, watch=False)
+    kb_service = KnowledgeBaseService(client=client, registry=registry)
+    sync_service = FacebookSyncService(_FacebookService(client), kb_service, ingest_data_service=object())
+    return kb_service, sync_service
+
+
+def test_deleted_course_is_not_claimed_by_facebook_sync(services):
+    kb_service, sync_service = services
+    kb_service.add_file_to_course("course_a", "notes.pdf")
+    kb_service.add_file_to_course("course_b", "notes.pdf")
+    sync_service.claim_due_courses(0, ["course_a", "course_b"])
+
+    kb_service.delete_course("course_a")
+
+    assert sync_service.claim_due_courses(0) == ["course_b"]
+
+
+def test_course_emptied_by_file_deletion_is_not_claimed_by_facebook_sync(services):
+    kb_service, sync_service = services
+    kb_service.add_file_to_course("course_a", "facebook_post_id_1")
+    sync_service.claim_due_courses(0, ["course_a"])
+
+    report = kb_service.delete_files("course_a", ["facebook_post_id_1"])
+
+    assert report["course_removed"]
+    assert sync_service.claim_due_courses(0) == []
+
+
+def test_deleting_a_file_of_a_course_not_migrated_keeps_the_course(services):
+    kb_service, sync_service = services
+    kb_service.client["vector"]["records"].insert_one({"course_name": "legacy", "file_names": ["a.pdf", "b.pdf"]})
+    sync_service.claim_due_courses(0, ["legacy"])
+
+    report = kb_service.delete_files("legacy", ["a.pdf"])
+
+    assert not report["course_removed"]
+    assert kb_service.client["vector"]["records"].find_one({"course_name": "legacy"})["file_names"] == ["b.pdf"]
+    assert sync_service.claim_due_courses(0) == ["legacy"]